@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+#Benchmark of the root-to-all maxflow pass over a synthetic low-fee reachable subgraph: the unit-capacity pass
+#the way node_recommender.py used to run it, building a fresh maxflow.Graph per sink with get_unweighted_maxflow(),
+#against the unit-capacity pass of lngraph's UnitConnectivity and the capacity-weighted pass of
+#CapacityConnectivity. The capacity maxflows of a sample of sinks are checked against a fresh maxflow.Graph each.
+#Both passes solve one flow per core sink on the same core; the capacity pass costs more because the solver
+#needs more augmenting paths with real capacities than with unit ones, and nothing of the unit pass carries over.
+#pip3 install PyMaxflow numpy
+import sys, os, time, random
+import maxflow
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(sys.argv[0])), ".."))
+from lngraph.connectivity import UnitConnectivity, CapacityConnectivity
+
+def get_unweighted_maxflow(source, sink, edges):
+    node_map = dict()
+    source_cap = 0
+    sink_cap = 0
+
+    i = 0
+    for (src, dest) in edges:
+        if src not in node_map:
+            node_map[src] = i
+            i += 1
+        if dest not in node_map:
+            node_map[dest] = i
+            i += 1
+        if src == source:
+            source_cap += 1
+        if dest == sink:
+            sink_cap += 1
+    g = maxflow.Graph[int](i, len(edges))
+    g.add_nodes(i)
+
+    for (src, dest) in edges:
+        g_src = node_map[src]
+        g_dest = node_map[dest]
+        g.add_edge(g_src, g_dest, 1, 0)
+    g.add_tedge(node_map[source], source_cap, 0)
+    g.add_tedge(node_map[sink], 0, sink_cap)
+    return g.maxflow()
+
+def get_capacity_maxflow(source, sink, edge_capacities):
+    node_map = dict()
+    for (src, dest) in edge_capacities:
+        for n in (src, dest):
+            if n not in node_map:
+                node_map[n] = len(node_map)
+    source_cap = sum([capacity for ((src, dest), capacity) in edge_capacities.items() if src == source])
+    sink_cap = sum([capacity for ((src, dest), capacity) in edge_capacities.items() if dest == sink])
+    if source == sink:
+        return min(source_cap, sink_cap)
+    g = maxflow.Graph[float](len(node_map), len(edge_capacities))
+    g.add_nodes(len(node_map))
+    for ((src, dest), capacity) in edge_capacities.items():
+        g.add_edge(node_map[src], node_map[dest], capacity, 0)
+    g.add_tedge(node_map[source], source_cap + 1, 0)
+    g.add_tedge(node_map[sink], 0, sink_cap + 1)
+    return int(g.maxflow())
+
+#A preferential-attachment channel graph with both directions of most channels and a tail of leaf nodes,
+#with channel sizes spread over several orders of magnitude like those of the LN
+def make_subgraph(num_nodes, seed):
+    rnd = random.Random(seed)
+    edge_capacities = dict()
+    ends = [0, 1]
+    for n in range(2, num_nodes):
+        num_channels = 1 if rnd.random() < 0.3 else rnd.randint(2, 6)
+        for peer in set([rnd.choice(ends) for i in range(num_channels)]):
+            capacity = int(10 ** rnd.uniform(5, 9))
+            edge_capacities[(n, peer)] = capacity
+            if rnd.random() < 0.9:
+                edge_capacities[(peer, n)] = capacity
+            ends.extend([n, peer])
+    return edge_capacities
+
+print("%8s %8s %16s %12s %16s %16s" % ("nodes", "channels", "per sink (ms)", "unit (ms)", "capacity (ms)", "capacity/unit"))
+for num_nodes in [500, 1000, 2000, 4000]:
+    edge_capacities = make_subgraph(num_nodes, num_nodes)
+    sinks = {n for edge in edge_capacities for n in edge}
+    #rebuilding the graph per sink is quadratic, so only time it on a sample of the sinks and scale up
+    sample = sorted(sinks)[:: max(1, len(sinks) // 50)]
+    t0 = time.perf_counter()
+    for t in sample:
+        get_unweighted_maxflow(0, t, edge_capacities.keys())
+    t1 = time.perf_counter()
+    UnitConnectivity(edge_capacities.keys(), 0).maxflows(sinks)
+    t2 = time.perf_counter()
+    flows = CapacityConnectivity(edge_capacities, 0).maxflows(sinks)
+    t3 = time.perf_counter()
+    for t in sample:
+        if get_capacity_maxflow(0, t, edge_capacities) != flows[t]:
+            sys.stderr.write("capacity maxflows to %d differ for %d nodes\n" % (t, num_nodes))
+            sys.exit(1)
+    print("%8d %8d %16.1f %12.1f %16.1f %16.2f" % (len(sinks), len(edge_capacities), (t1 - t0) * 1000 * len(sinks) / len(sample), (t2 - t1) * 1000, (t3 - t2) * 1000, (t3 - t2) / (t2 - t1)))
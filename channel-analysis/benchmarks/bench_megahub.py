@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+#Benchmark of the megahub triangle extraction: the fixed-point loop megahub.py used to run, which rescanned the
+#neighbourhood of the whole megahub and re-enumerated every candidate's triangles until a full pass admitted no
+#one, against the worklist-driven lngraph.triangles.MegahubExtraction. Runs on a compiled snapshot (e.g. of
+#mainnet listchannels) if one is given, otherwise on a mainnet-sized synthetic graph, seeded with the best
+#connected nodes that form a clique. The old loop checks triangles in one direction only, so both are also run on
+#channels with every one made bidirectional, where their megahubs must be the same. Finally the triangle
+#counts and k-truss decomposition of lngraph.truss, which answer the --truss megahubs of every N, are timed.
+#pip3 install numpy
+import sys, os, time
+import numpy
+sys.path.insert(0, os.path.dirname(os.path.realpath(sys.argv[0])))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(sys.argv[0])), ".."))
+from synthetic_graph import SyntheticGraph
+from lngraph.snapshot import GraphSnapshot
+from lngraph.triangles import MegahubExtraction
+from lngraph.truss import TriangleIndex
+
+min_chan_size = 100000
+
+def extract_megahub_fixed_point(adjacent, seeds, N):
+    megahub_nodes = set(seeds)
+    finished = False
+    while not finished:
+        potentials = set()
+        finished = True
+        for node in megahub_nodes:
+            for n in filter(lambda x: x not in megahub_nodes, adjacent[node]):
+                potentials.add(n)
+        for src in potentials:
+            triangle_edges = set()
+            for dst1 in filter(lambda x: x in megahub_nodes, adjacent[src]):
+                if (src, dst1) not in triangle_edges:
+                    for dst2 in filter(lambda x: x in megahub_nodes and x != dst1, adjacent[src]):
+                        if dst1 in adjacent[dst2]:
+                            triangle_edges.add((src, dst1))
+                            triangle_edges.add((src, dst2))
+                            break
+            if len(triangle_edges) - 1 >= N:
+                megahub_nodes.add(src)
+                finished = False
+    return megahub_nodes
+
+#Returns the channels of the synthetic graph the way GraphSnapshot.channels() selects them from a snapshot
+def synthetic_channels(graph):
+    channels = list()
+    for (node1, node2, capacity, policy1, policy2) in graph.channels:
+        if capacity <= min_chan_size:
+            continue
+        if policy1 is not None and not policy1[2]:
+            channels.append((node1, node2))
+        if policy2 is not None and not policy2[2]:
+            channels.append((node2, node1))
+    return numpy.unique(numpy.array(channels, dtype = numpy.int64).reshape(-1, 2), axis = 0)
+
+#Returns the dict mapping every node number to the set of numbers it has a channel to, which the old loop worked on
+def adjacency(channels, num_nodes):
+    adjacent = {n: set() for n in range(num_nodes)}
+    for (src, dest) in channels.tolist():
+        adjacent[src].add(dest)
+    return adjacent
+
+#Returns up to count of the best connected nodes that all have channels to each other
+def clique_seeds(adjacent, count):
+    seeds = list()
+    for n in sorted(adjacent, key = lambda n: (-len(adjacent[n]), n)):
+        if all([n in adjacent[s] and s in adjacent[n] for s in seeds]):
+            seeds.append(n)
+            if len(seeds) == count:
+                break
+    return seeds
+
+if len(sys.argv) > 1:
+    snapshot = GraphSnapshot(sys.argv[1])
+    (channels, num_nodes) = (snapshot.channels(min_chan_size), snapshot.num_nodes)
+    print("%s: %d nodes, %d directed channels" % (sys.argv[1], num_nodes, len(channels)))
+else:
+    graph = SyntheticGraph(16000, 1)
+    (channels, num_nodes) = (synthetic_channels(graph), len(graph.node_ids))
+    print("synthetic graph: %d nodes, %d directed channels" % (num_nodes, len(channels)))
+bidirectional = numpy.unique(numpy.concatenate((channels, channels[:, ::-1])), axis = 0)
+adjacent = adjacency(channels, num_nodes)
+seeds = clique_seeds(adjacent, 8)
+
+print("%-14s %3s %9s %12s %12s %8s" % ("adjacency", "N", "megahub", "fixed point", "worklist", "speedup"))
+for (name, edges) in (("as announced", channels), ("bidirectional", bidirectional)):
+    adj = adjacency(edges, num_nodes)
+    for N in (1, 2, 6):
+        start = time.perf_counter()
+        old_hub = extract_megahub_fixed_point(adj, seeds, N)
+        old_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        new_hub = MegahubExtraction(edges, num_nodes, seeds, N).hub
+        new_seconds = time.perf_counter() - start
+        if name == "bidirectional":
+            assert new_hub == old_hub
+            size = "%d" % len(new_hub)
+        else:
+            size = "%d/%d" % (len(old_hub), len(new_hub))
+        print("%-14s %3d %9s %11.3fs %11.3fs %7.1fx" % (name, N, size, old_seconds, new_seconds, old_seconds / new_seconds))
+
+start = time.perf_counter()
+triangles = TriangleIndex(channels, num_nodes)
+count_seconds = time.perf_counter() - start
+start = time.perf_counter()
+max_trussness = int(triangles.trussness().max())
+truss_seconds = time.perf_counter() - start
+print("%d undirected channels, %d triangles: counted in %.3fs, k-truss decomposition (up to k = %d) in %.3fs" % (len(triangles.edges), int(triangles.node_triangles.sum()) // 3, count_seconds, max_trussness, truss_seconds))
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+#Micro-benchmark of Pareto label insertion for a single node with a large (permillion, base) frontier:
+#the linear is_pareto_dominated() scan over a set that node_recommender.py used, against lngraph's Skyline.
+import sys, os, time, random
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(sys.argv[0])), ".."))
+from lngraph.skyline import Skyline
+
+def is_pareto_dominated(x, y, tuple_set):
+    for (t_x, t_y) in tuple_set:
+        if (t_x != x or t_y != y) and t_x <= x and t_y <= y:
+            return True
+    return False
+
+#Inserts labels the way the old BFS did, then does its Pareto filtering pass
+def insert_with_set(labels):
+    frontier = set()
+    for (ppm, base) in labels:
+        if not is_pareto_dominated(ppm, base, frontier):
+            frontier.add((ppm, base))
+    return {(ppm, base) for (ppm, base) in frontier if not is_pareto_dominated(ppm, base, frontier)}
+
+def insert_with_skyline(labels):
+    frontier = Skyline()
+    for label in labels:
+        frontier.insert(label)
+    return frontier
+
+#Labels scattered around the line ppm + base / 10 = 1000, so that many of them are mutually non-dominated,
+#as for well-connected nodes reachable along both cheap-base and cheap-ppm routes
+def make_labels(num_labels, seed):
+    rnd = random.Random(seed)
+    labels = list()
+    for i in range(num_labels):
+        ppm = rnd.randint(0, 1000)
+        labels.append((ppm, (1000 - ppm) * 10 + rnd.randint(0, 200)))
+    return labels
+
+print("%8s %10s %12s %12s %8s" % ("labels", "frontier", "set (ms)", "skyline (ms)", "speedup"))
+for num_labels in [10, 100, 1000, 5000]:
+    labels = make_labels(num_labels, num_labels)
+    t0 = time.perf_counter()
+    expected = insert_with_set(labels)
+    t1 = time.perf_counter()
+    frontier = insert_with_skyline(labels)
+    t2 = time.perf_counter()
+    if set(frontier) != expected:
+        sys.stderr.write("frontiers differ for %d labels\n" % num_labels)
+        sys.exit(1)
+    print("%8d %10d %12.3f %12.3f %7.1fx" % (num_labels, len(frontier), (t1 - t0) * 1000, (t2 - t1) * 1000, (t1 - t0) / (t2 - t1)))
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+#End-to-end benchmark of the channel-analysis tools on synthetic channel graphs (see synthetic_graph.py): compiles
+#a snapshot of each graph with compile_snapshot.py, then runs node_recommender.py --incremental from a typical
+#routing node and megahub.py from a clique of the best connected nodes on it. Each run is timed end to end and per
+#phase (from the tools' --profile output), its peak RSS is taken from the kernel's resource usage of the process,
+#and its output is hashed, so that a run can be saved as a baseline and later runs compared against it.
+#pip3 install PyMaxflow mpmath numpy pyln-client
+import sys, os, json, time, hashlib, subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(sys.argv[0])))
+from synthetic_graph import SyntheticGraph
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(sys.argv[0])), ".."))
+from lngraph.snapshot import read_snapshot_header
+
+CHANNEL_ANALYSIS = os.path.join(os.path.dirname(os.path.realpath(sys.argv[0])), "..")
+COMPILE_SNAPSHOT = os.path.join(CHANNEL_ANALYSIS, "compile-snapshot", "compile_snapshot.py")
+NODE_RECOMMENDER = os.path.join(CHANNEL_ANALYSIS, "node-recommender", "node_recommender.py")
+MEGAHUB = os.path.join(CHANNEL_ANALYSIS, "extract-megahub", "megahub.py")
+
+BASELINE_FORMAT = 1
+
+#####################################################
+#GLOBAL VARIABLES
+#####################################################
+
+sizes = [1000, 3000]
+lnd = False #generate LND describegraph JSON instead of C-Lightning listnodes/listchannels JSON
+seed = 1
+work_dir = "bench-tools" #generated graphs, snapshots, outputs and profiles, reused by later runs
+cases = ["compile", "recommender", "megahub"]
+baseline_path = None #compare against this baseline
+save_baseline_path = None #save the results as a baseline to this file
+tolerance = 0.2 #relative slowdown or RSS growth over the baseline that counts as a regression
+min_seconds = 0.5 #slowdowns of less than this many seconds are noise, whatever their relative size
+recommender_fees = (1000, 100)
+megahub_triangles = 2
+megahub_seeds = 5
+
+
+#####################################################
+#FUNCTION DEFINITIONS
+#####################################################
+
+def print_usage_and_die():
+    sys.stderr.write("Usage:\n")
+    sys.stderr.write("%s [--sizes N[,N...]] [--lnd] [--seed S] [--cases CASE[,CASE...]] [--work-dir DIR] [--save-baseline FILE] [--baseline FILE] [--tolerance T]\n" % sys.argv[0])
+    sys.stderr.write("\n")
+    sys.stderr.write("Generates a synthetic channel graph of each size (default 1000,3000 nodes), compiles it into a snapshot\n")
+    sys.stderr.write("and times each tool on it, printing wall time, peak RSS and the slowest phases of every run.\n")
+    sys.stderr.write("\n")
+    sys.stderr.write("--lnd: Generate LND describegraph JSON instead of C-Lightning listnodes/listchannels JSON\n")
+    sys.stderr.write("--seed S: Seed of the synthetic graphs (default 1)\n")
+    sys.stderr.write("--cases CASE[,CASE...]: Run only these of compile, recommender and megahub\n")
+    sys.stderr.write("--work-dir DIR: Keep graphs, snapshots, outputs and profiles in DIR (default ./bench-tools); graphs and\n")
+    sys.stderr.write("                snapshots already there are reused\n")
+    sys.stderr.write("--save-baseline FILE: Save the results to FILE as a baseline\n")
+    sys.stderr.write("--baseline FILE: Compare the results against the baseline in FILE and exit with status 1 if any run is\n")
+    sys.stderr.write("                 more than T (default 0.2, i.e. 20%%) slower or larger, or its output changed\n")
+    sys.stderr.write("\n")
+    sys.exit(1)
+
+def parse_options(argv):
+    global sizes, lnd, seed, work_dir, cases, baseline_path, save_baseline_path, tolerance
+    i = 0
+    while i < len(argv):
+        if argv[i] == "--sizes" and i + 1 < len(argv):
+            sizes = [int(s) for s in argv[i + 1].split(",")]
+            i += 2
+        elif argv[i] == "--lnd":
+            lnd = True
+            i += 1
+        elif argv[i] == "--seed" and i + 1 < len(argv):
+            seed = int(argv[i + 1])
+            i += 2
+        elif argv[i] == "--cases" and i + 1 < len(argv):
+            cases = argv[i + 1].split(",")
+            if any([case not in ("compile", "recommender", "megahub") for case in cases]):
+                print_usage_and_die()
+            i += 2
+        elif argv[i] == "--work-dir" and i + 1 < len(argv):
+            work_dir = argv[i + 1]
+            i += 2
+        elif argv[i] == "--baseline" and i + 1 < len(argv):
+            baseline_path = argv[i + 1]
+            i += 2
+        elif argv[i] == "--save-baseline" and i + 1 < len(argv):
+            save_baseline_path = argv[i + 1]
+            i += 2
+        elif argv[i] == "--tolerance" and i + 1 < len(argv):
+            tolerance = float(argv[i + 1])
+            i += 2
+        else:
+            print_usage_and_die()
+
+#Runs command with stdout going to output_path and returns (wall seconds, peak RSS in KiB, exit status). The peak
+#RSS is that of the process itself, from wait4(), not the maximum over every child this script has waited for.
+def run_measured(command, output_path):
+    env = dict(os.environ)
+    env["PYTHONHASHSEED"] = "0" #megahub.py prints sets, whose order depends on string hashing
+    with open(output_path, "wb") as out:
+        start = time.perf_counter()
+        p = subprocess.Popen(command, stdout = out, stderr = subprocess.PIPE, env = env)
+        stderr = p.stderr.read()
+        (pid, status, rusage) = os.wait4(p.pid, 0)
+        seconds = time.perf_counter() - start
+    p.returncode = os.waitstatus_to_exitcode(status)
+    p.stderr.close()
+    if p.returncode != 0:
+        sys.stderr.write(stderr.decode("utf-8", "replace"))
+    return (seconds, rusage.ru_maxrss, p.returncode)
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+#Returns the wall seconds of each phase in the --profile output at path
+def profile_phases(path):
+    with open(path) as f:
+        return {phase["phase"]: phase["wall_seconds"] for phase in json.load(f)["phases"]}
+
+#Generates the graph of num_nodes nodes unless it is already in the work directory, and returns its path, its
+#typical routing node and its best connected clique
+def prepare_graph(num_nodes):
+    prefix = os.path.join(work_dir, "%s-%d-seed%d" % ("lnd" if lnd else "cln", num_nodes, seed))
+    graph_path = prefix + ".json"
+    nodes_path = prefix + ".nodes.json"
+    if not os.path.exists(graph_path) or not os.path.exists(nodes_path):
+        start = time.perf_counter()
+        graph = SyntheticGraph(num_nodes, seed)
+        with open(graph_path + ".tmp", "w") as f:
+            if lnd:
+                graph.write_lnd(f)
+            else:
+                graph.write_cln(f)
+        os.replace(graph_path + ".tmp", graph_path)
+        with open(nodes_path, "w") as f:
+            json.dump({"root": graph.node_ids[graph.typical_routing_node()], "hubs": [graph.node_ids[n] for n in graph.connected_hubs(megahub_seeds)]}, f)
+        sys.stderr.write("generated %s: %d nodes, %d channels in %.1fs\n" % (graph_path, num_nodes, len(graph.channels), time.perf_counter() - start))
+    with open(nodes_path) as f:
+        nodes = json.load(f)
+    return (prefix, graph_path, nodes["root"], nodes["hubs"])
+
+#Runs one case on the graph of num_nodes nodes and returns its result object, or None if it failed
+def run_case(case, num_nodes):
+    (prefix, graph_path, root, hubs) = prepare_graph(num_nodes)
+    snapshot_path = prefix + ".snap"
+    output_path = "%s.%s.out" % (prefix, case)
+    profile_path = "%s.%s.profile.json" % (prefix, case)
+    if case != "compile" and not os.path.exists(snapshot_path):
+        (seconds, rss, status) = run_measured([sys.executable, COMPILE_SNAPSHOT, snapshot_path, graph_path], output_path)
+        if status != 0:
+            return None
+    if case == "compile":
+        command = [sys.executable, COMPILE_SNAPSHOT, "--force", snapshot_path, graph_path]
+    elif case == "recommender":
+        command = [sys.executable, NODE_RECOMMENDER, "--snapshot", snapshot_path, "--incremental", "--profile", profile_path, root, str(recommender_fees[0]), str(recommender_fees[1])]
+    else:
+        command = [sys.executable, MEGAHUB, "--snapshot", snapshot_path, "--profile", profile_path, str(megahub_triangles)] + hubs
+    (seconds, rss, status) = run_measured(command, output_path)
+    if status != 0:
+        sys.stderr.write("%s on %d nodes failed with exit status %d\n" % (case, num_nodes, status))
+        return None
+    result = {"wall_seconds": round(seconds, 3), "peak_rss_kib": rss}
+    if case == "compile":
+        #the snapshot header records its source's path and modification time, so only its payload is comparable
+        result["output_sha256"] = "crc32:%08x" % read_snapshot_header(snapshot_path)[0]["payload_crc32"]
+    else:
+        result["output_sha256"] = file_digest(output_path)
+        result["phases"] = profile_phases(profile_path)
+    return result
+
+#Returns the lines describing how result regressed against base, empty if it didn't
+def regressions(result, base):
+    lines = list()
+    if result["wall_seconds"] > base["wall_seconds"] * (1 + tolerance) and result["wall_seconds"] - base["wall_seconds"] >= min_seconds:
+        lines.append("wall time %.2fs, baseline %.2fs (%+.0f%%)" % (result["wall_seconds"], base["wall_seconds"], 100 * (result["wall_seconds"] / base["wall_seconds"] - 1)))
+    if result["peak_rss_kib"] > base["peak_rss_kib"] * (1 + tolerance):
+        lines.append("peak RSS %.1f MiB, baseline %.1f MiB" % (result["peak_rss_kib"] / 1024, base["peak_rss_kib"] / 1024))
+    if result["output_sha256"] != base["output_sha256"]:
+        lines.append("output differs from the baseline")
+    #slower phases explain a slower run, but only the run's total counts as a regression
+    if len(lines) > 0 and lines[0].startswith("wall time"):
+        for (phase, seconds) in sorted(result.get("phases", dict()).items(), key = lambda x: x[1], reverse = True):
+            base_seconds = base.get("phases", dict()).get(phase, 0.0)
+            if seconds > base_seconds * (1 + tolerance) and seconds - base_seconds >= min_seconds:
+                lines.append("  phase %s: %.2fs, baseline %.2fs" % (phase, seconds, base_seconds))
+    return lines
+
+def print_result(key, result):
+    line = "%-20s %9.2fs %9.1f MiB" % (key, result["wall_seconds"], result["peak_rss_kib"] / 1024)
+    phases = sorted(result.get("phases", dict()).items(), key = lambda x: x[1], reverse = True)[:3]
+    if len(phases) > 0:
+        line += "   " + ", ".join(["%s %.2fs" % (phase, seconds) for (phase, seconds) in phases])
+    print(line)
+
+
+#####################################################
+#MAIN BODY
+#####################################################
+
+parse_options(sys.argv[1:])
+os.makedirs(work_dir, exist_ok = True)
+
+baseline = None
+if baseline_path is not None:
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    if baseline.get("format") != BASELINE_FORMAT:
+        sys.stderr.write("%s has baseline format %s, expected %d\n" % (baseline_path, baseline.get("format"), BASELINE_FORMAT))
+        sys.exit(1)
+    if baseline["seed"] != seed or baseline["lnd"] != lnd:
+        sys.stderr.write("%s was run on other graphs (seed %d, %s JSON)\n" % (baseline_path, baseline["seed"], "LND" if baseline["lnd"] else "C-Lightning"))
+        sys.exit(1)
+
+print("%-20s %10s %13s   %s" % ("run", "wall", "peak RSS", "slowest phases"))
+runs = dict()
+failed = False
+regressed = False
+for num_nodes in sizes:
+    for case in cases:
+        key = "%s/%d" % (case, num_nodes)
+        result = run_case(case, num_nodes)
+        if result is None:
+            failed = True
+            continue
+        runs[key] = result
+        print_result(key, result)
+        if baseline is not None:
+            if key not in baseline["runs"]:
+                print("  not in the baseline")
+                continue
+            lines = regressions(result, baseline["runs"][key])
+            for line in lines:
+                print("  REGRESSION " + line if not line.startswith("  ") else "  " + line)
+            regressed = regressed or len(lines) > 0
+
+if save_baseline_path is not None:
+    with open(save_baseline_path, "w") as f:
+        json.dump({"format": BASELINE_FORMAT, "seed": seed, "lnd": lnd, "runs": runs}, f, indent = 4, sort_keys = True)
+        f.write("\n")
+
+if failed or regressed:
+    sys.exit(1)
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+#Checks node_recommender.py's incremental engine against a from-scratch evaluation of the same fee frontiers:
+#the output of an --incremental run must be identical to that of a default run, which propagates the frontiers
+#from scratch for every peer, also with --top, --plan and --routing-capacity, and every block of a --thresholds
+#sweep must be identical to the default run of its thresholds. For every candidate, the new low-fee reachable
+#subgraph is also rebuilt from lngraph.lowfee.LowfeeFrontiers.with_new_peer(), all its maxflows are solved, and
+#peer_score, its parts and new_maxflow_geomean are computed independently of node_recommender.py. The modes that
+#imply --incremental must run to completion and, where they are exact, agree with the default run:
+#--bounded-maxflow in peer_score and its parts, with --exact-geomean also in new_maxflow_geomean, --sample-targets
+#in the exact newly_reachable counts, and the first channel of --plan has the best peer_score.
+#
+#Runs on a synthetic graph and on a variant of it in which root_node has no low-fee incoming channel, so its own
+#baseline maxflow is 0, except from a few well-connected nodes whose channel to it only fits the fee thresholds
+#once they are root_node's peers. Exits with status 1 if any check fails.
+#pip3 install PyMaxflow mpmath numpy
+import sys, os, json, subprocess, tempfile
+sys.path.insert(0, os.path.dirname(os.path.realpath(sys.argv[0])))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(sys.argv[0])), ".."))
+from synthetic_graph import SyntheticGraph
+from lngraph.connectivity import UnitConnectivity
+from lngraph.ingest import ChannelGraphParser
+from lngraph.lowfee import LowfeeFrontiers
+from lngraph.metrics import geomean, format_metric
+
+recommender = os.path.join(os.path.dirname(os.path.realpath(sys.argv[0])), "..", "node-recommender", "node_recommender.py")
+(base_fee_threshold, permillion_fee_threshold) = (1000, 100)
+
+#Prices every channel into root above the fee thresholds, except those of the num_returning best connected
+#peers of root, which get the thresholds exactly; root doesn't announce its side of those channels
+def without_lowfee_return(graph, root, num_returning = 3):
+    peers = {node1 if node2 == root else node2 for (node1, node2, capacity, policy1, policy2) in graph.channels if root in (node1, node2)}
+    returning = set(sorted(peers, key = lambda n: (-graph.degree[n], n))[:num_returning])
+    def priced(policy):
+        return None if policy is None else (policy[0], 50000, policy[2])
+    channels = list()
+    for (node1, node2, capacity, policy1, policy2) in graph.channels:
+        if node2 == root:
+            (policy1, policy2) = ((base_fee_threshold, permillion_fee_threshold, False), None) if node1 in returning else (priced(policy1), policy2)
+        elif node1 == root:
+            (policy1, policy2) = (None, (base_fee_threshold, permillion_fee_threshold, False)) if node2 in returning else (policy1, priced(policy2))
+        channels.append((node1, node2, capacity, policy1, policy2))
+    graph.channels = channels
+    return graph
+
+#Returns the output of node_recommender.py run with options on the graph in path, or None if it failed.
+#thresholds are the (base fee, ppm) thresholds to pass, or None if options give them.
+def recommender_output(path, root_id, options, thresholds = (base_fee_threshold, permillion_fee_threshold)):
+    args = [sys.executable, recommender, "--input", path] + options + [root_id]
+    if thresholds is not None:
+        args += [str(t) for t in thresholds]
+    result = subprocess.run(args, stdout = subprocess.PIPE, stderr = subprocess.PIPE, universal_newlines = True)
+    if result.returncode != 0:
+        sys.stdout.write("  node_recommender.py %s failed:\n%s" % (" ".join(options), result.stderr[-2000:]))
+        return None
+    return result.stdout
+
+#Returns the parsed JSON output of node_recommender.py run with options on the graph in path, or None if it failed
+def run_recommender(path, root_id, options, thresholds = (base_fee_threshold, permillion_fee_threshold)):
+    output = recommender_output(path, root_id, options, thresholds)
+    return json.loads(output) if output is not None else None
+
+#Returns (root metrics, peer metrics by peer_id) as a default run would compute them on the exhaustive frontiers
+def from_scratch(path, root_id, peer_ids):
+    parser = ChannelGraphParser(node_ids = [root_id])
+    with open(path) as f:
+        parser.add_stream(f)
+    graph = parser.channel_graph()
+    root = parser.id_to_node[root_id]
+    frontiers = LowfeeFrontiers(graph, root, base_fee_threshold, permillion_fee_threshold)
+    existing = UnitConnectivity(frontiers.edges, root).maxflows(frontiers.nodes)
+    root_metrics = {"existing_reachable": len(existing), "existing_maxflow_geomean": format_metric(geomean(list(existing.values())))}
+    peers = dict()
+    for peer_id in peer_ids:
+        (changed_frontiers, added_edges) = frontiers.with_new_peer(parser.id_to_node[peer_id])
+        new_edges = frontiers.edges | added_edges
+        new_nodes = {n for edge in new_edges for n in edge}
+        now = UnitConnectivity(new_edges, root).maxflows(new_nodes)
+        newly_reachable = len([r for r in now if r not in existing])
+        improved = [r for r in now if r in existing and now[r] > existing[r]]
+        bonus = sum([max(0, 3 - existing[r]) for r in improved])
+        peers[peer_id] = {
+          "peer_score": 3*newly_reachable + len(improved) + bonus,
+          "newly_reachable": newly_reachable,
+          "routability_improvements": len(improved),
+          "bonus": bonus,
+          "new_maxflow_geomean": format_metric(geomean([now[r] for r in existing]))
+        }
+    return (root_metrics, peers)
+
+#Returns the number of the members of expected that differ in actual, reporting each
+def compare(description, expected, actual):
+    mismatches = 0
+    for (key, value) in expected.items():
+        if actual.get(key) != value:
+            sys.stdout.write("  %s: %s is %r, expected %r\n" % (description, key, actual.get(key), value))
+            mismatches += 1
+    return mismatches
+
+def check_graph(name, graph, work_dir):
+    root_id = graph.node_ids[graph.typical_routing_node()]
+    path = os.path.join(work_dir, "%s.json" % name)
+    with open(path, "w") as f:
+        graph.write_cln(f)
+    sys.stdout.write("%s (%d nodes, root %s):\n" % (name, len(graph.node_ids), root_id))
+    failures = 0
+    incremental_output = recommender_output(path, root_id, ["--incremental"])
+    default_output = recommender_output(path, root_id, [])
+    if incremental_output is None or default_output is None:
+        return 1
+    if incremental_output != default_output:
+        sys.stdout.write("  --incremental: the output differs from that of a default run\n")
+        failures += 1
+    else:
+        sys.stdout.write("  --incremental: same output as a default run\n")
+    incremental = json.loads(incremental_output)
+    for options in (["--top", "5"], ["--plan", "2"], ["--routing-capacity", "1000000"]):
+        outputs = [recommender_output(path, root_id, o) for o in (options, ["--incremental"] + options)]
+        if None in outputs or outputs[0] != outputs[1]:
+            sys.stdout.write("  %s: the output with --incremental differs from that without\n" % " ".join(options))
+            failures += 1
+        else:
+            sys.stdout.write("  %s: same output with and without --incremental\n" % " ".join(options))
+    #out of order, so that the sweep analyzes them in another order than it writes them
+    sweep = [(base_fee_threshold // 4, permillion_fee_threshold // 4), (base_fee_threshold, permillion_fee_threshold), (base_fee_threshold // 2, permillion_fee_threshold // 2)]
+    sweep_output = run_recommender(path, root_id, ["--thresholds", ",".join(["%d:%d" % t for t in sweep])], thresholds = None)
+    if sweep_output is None:
+        failures += 1
+    else:
+        for (thresholds, block) in zip(sweep, sweep_output["threshold_sweep"]):
+            single = json.loads(default_output) if thresholds == (base_fee_threshold, permillion_fee_threshold) else run_recommender(path, root_id, [], thresholds)
+            if single is None or dict(single, base_fee_threshold = thresholds[0], permillion_fee_threshold = thresholds[1]) != block:
+                sys.stdout.write("  --thresholds: the block of %d:%d differs from a default run\n" % thresholds)
+                failures += 1
+        sys.stdout.write("  --thresholds %s: %d blocks checked against default runs\n" % (",".join(["%d:%d" % t for t in sweep]), len(sweep)))
+    by_id = {p["peer_id"]: p for p in incremental["peer_metrics"]}
+    (root_metrics, expected) = from_scratch(path, root_id, list(by_id))
+    failures += compare("root_node_metrics", root_metrics, incremental["root_node_metrics"])
+    for (peer_id, peer) in expected.items():
+        failures += compare(peer_id, peer, by_id[peer_id])
+    sys.stdout.write("  --incremental: %d candidates checked against a from-scratch evaluation\n" % len(expected))
+
+    score_fields = ("peer_score", "newly_reachable", "routability_improvements", "bonus")
+    for options in (["--bounded-maxflow"], ["--bounded-maxflow", "--exact-geomean"], ["--incremental", "--top", "5"], ["--thresholds", "%d:%d" % (base_fee_threshold, permillion_fee_threshold)]):
+        #without --exact-geomean, new_maxflow_geomean is only a lower bound
+        exact_fields = score_fields if options == ["--bounded-maxflow"] else score_fields + ("new_maxflow_geomean",)
+        output = run_recommender(path, root_id, options, thresholds = None if options[0] == "--thresholds" else (base_fee_threshold, permillion_fee_threshold))
+        if output is None:
+            failures += 1
+            continue
+        if options[0] == "--thresholds":
+            output = output["threshold_sweep"][0]
+        for peer in output["peer_metrics"]:
+            failures += compare("%s %s" % (" ".join(options), peer["peer_id"]), {key: by_id[peer["peer_id"]][key] for key in exact_fields}, peer)
+        sys.stdout.write("  %s: ran, %d candidates\n" % (" ".join(options), len(output["peer_metrics"])))
+    #these only have to run: the sample's results are estimates, and the plan's later steps use other baselines
+    for options in (["--sample-targets", "50"], ["--incremental", "--plan", "2"]):
+        output = run_recommender(path, root_id, options)
+        if output is None:
+            failures += 1
+            continue
+        if options[0] == "--sample-targets":
+            for peer in output["peer_metrics"]:
+                failures += compare("%s %s" % (" ".join(options), peer["peer_id"]), {"newly_reachable": by_id[peer["peer_id"]]["newly_reachable"]}, peer)
+        else:
+            first = output["portfolio"][0]
+            failures += compare("%s step 1" % " ".join(options), {"marginal_gain": max([p["peer_score"] for p in by_id.values()])}, first)
+        sys.stdout.write("  %s: ran\n" % " ".join(options))
+    return failures
+
+num_nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+failures = 0
+with tempfile.TemporaryDirectory() as work_dir:
+    failures += check_graph("synthetic", SyntheticGraph(num_nodes, 1), work_dir)
+    graph = SyntheticGraph(num_nodes, 1)
+    failures += check_graph("no-lowfee-return", without_lowfee_return(graph, graph.typical_routing_node()), work_dir)
+sys.stdout.write("%s\n" % ("all checks passed" if failures == 0 else "%d checks failed" % failures))
+sys.exit(1 if failures > 0 else 0)
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+#Equivalence check of the channel-analysis tools: runs node_recommender.py and megahub.py in their main modes on a
+#synthetic channel graph (see synthetic_graph.py), as C-Lightning JSON, as LND JSON and as a compiled snapshot, and
+#compares a digest of every output with the digests saved in expected_outputs.json. Outputs that must be the same
+#whatever the graph was read from are also compared with each other. A change to the shared lngraph code that
+#should leave the results alone must pass this check; one that changes results on purpose saves new digests with
+#--update and says why in its commit.
+#
+#The digests under "baseline_outputs" come from the tools as they were before the shared lngraph code (saved with
+#--baseline from a checkout of that tree) and are never overwritten by --update. They cover the default modes that
+#must still print what the original scripts printed, on graph variants where the original scripts were exact: a
+#copy of the graph with the same fees on every channel, where the old breadth-first search finds the same low-fee
+#subgraph as the exhaustive frontiers, and one with every channel enabled in both directions, where the old
+#megahub loop didn't depend on set iteration order. The original node_recommender.py printed the id of the last
+#candidate it evaluated as every removed_peer_id, so those ids are left out of the comparison. megahub.py is compared in its
+#--exact-asp mode, since its default ASPs are now estimates.
+#pip3 install PyMaxflow mpmath numpy pyln-client
+import sys, os, re, ast, json, hashlib, subprocess, tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(sys.argv[0])))
+from synthetic_graph import SyntheticGraph
+
+CHANNEL_ANALYSIS = os.path.join(os.path.dirname(os.path.realpath(sys.argv[0])), "..")
+COMPILE_SNAPSHOT = os.path.join(CHANNEL_ANALYSIS, "compile-snapshot", "compile_snapshot.py")
+NODE_RECOMMENDER = os.path.join(CHANNEL_ANALYSIS, "node-recommender", "node_recommender.py")
+MEGAHUB = os.path.join(CHANNEL_ANALYSIS, "extract-megahub", "megahub.py")
+EXPECTED_PATH = os.path.join(os.path.dirname(os.path.realpath(sys.argv[0])), "expected_outputs.json")
+
+EXPECTED_FORMAT = 1
+num_nodes = 1000
+seed = 1
+recommender_fees = ["1000", "100"]
+uniform_fees = (250, 25) #(base fee, ppm) of every channel of the "uniform" graph variant
+
+#(case, tool, graph input, options before the positional arguments, positional arguments) where the graph input is
+#"cln", "lnd", "snapshot", "uniform", "uniform-lnd" or "bidirectional" and the positional arguments "fees" (root node and fee
+#thresholds), "root" or "seeds" (the number of triangles and the seed nodes)
+CASES = [
+    ("recommender", NODE_RECOMMENDER, "cln", [], "fees"),
+    ("recommender-snapshot", NODE_RECOMMENDER, "snapshot", [], "fees"),
+    ("recommender-incremental", NODE_RECOMMENDER, "snapshot", ["--incremental"], "fees"),
+    ("recommender-top", NODE_RECOMMENDER, "snapshot", ["--top", "5"], "fees"),
+    ("recommender-thresholds", NODE_RECOMMENDER, "snapshot", ["--thresholds", "1000:100,500:50"], "root"),
+    ("recommender-sample", NODE_RECOMMENDER, "snapshot", ["--sample-targets", "100"], "fees"),
+    ("recommender-capacity", NODE_RECOMMENDER, "snapshot", ["--incremental", "--routing-capacity", "1000000"], "fees"),
+    ("recommender-lnd", NODE_RECOMMENDER, "lnd", ["--incremental"], "fees"),
+    ("megahub", MEGAHUB, "snapshot", [], "seeds"),
+    ("megahub-input", MEGAHUB, "cln", [], "seeds"),
+    ("megahub-exact", MEGAHUB, "snapshot", ["--exact-asp"], "seeds"),
+    ("megahub-truss", MEGAHUB, "snapshot", ["--truss"], "seeds"),
+    ("megahub-lnd", MEGAHUB, "lnd", [], "seeds"),
+]
+
+#pairs of cases whose outputs must be the same
+SAME_OUTPUTS = [("recommender", "recommender-snapshot"), ("megahub", "megahub-input")]
+
+#cases compared with the outputs of the original scripts, which ran without options: megahub.py's exact ASPs are
+#what the original printed
+BASELINE_CASES = [
+    ("baseline-recommender", NODE_RECOMMENDER, "uniform", [], "fees"),
+    ("baseline-recommender-lnd", NODE_RECOMMENDER, "uniform-lnd", [], "fees"),
+    ("baseline-megahub", MEGAHUB, "bidirectional", ["--exact-asp"], "seeds"),
+]
+
+#The original megahub.py read the channels from lightningd's RPC socket; this stands in for pyln.client when it
+#runs with --baseline and replays the CLN JSON named by LISTCHANNELS_JSON
+RPC_REPLAY = """import os, json
+class LightningRpc:
+    def __init__(self, path):
+        pass
+    def listchannels(self):
+        with open(os.environ["LISTCHANNELS_JSON"]) as f:
+            return json.load(f)
+"""
+
+def print_usage_and_die():
+    sys.stderr.write("Usage:\n")
+    sys.stderr.write("%s [--update | --baseline DIR] [--work-dir DIR]\n" % sys.argv[0])
+    sys.stderr.write("\n")
+    sys.stderr.write("Runs node_recommender.py and megahub.py on a %d-node synthetic graph and compares their outputs with\n" % num_nodes)
+    sys.stderr.write("the digests in expected_outputs.json. Exits with status 1 if any output differs.\n")
+    sys.stderr.write("\n")
+    sys.stderr.write("--update: Save the digests of these outputs to expected_outputs.json instead\n")
+    sys.stderr.write("--baseline DIR: Save the digests of the original scripts' outputs instead, running them from DIR, the\n")
+    sys.stderr.write("                channel-analysis directory of a checkout of the tree before the shared lngraph code\n")
+    sys.stderr.write("--work-dir DIR: Keep the graphs and outputs in DIR instead of a temporary directory, to inspect them\n")
+    sys.exit(1)
+
+#megahub.py prints the megahub as a Python set of node ids, whose order depends on string hashing
+def normalized_megahub_output(text):
+    lines = text.split("\n")
+    for (i, line) in enumerate(lines):
+        if line.startswith("{") or line.startswith("set("):
+            lines[i] = repr(sorted(ast.literal_eval(line) if line.startswith("{") else []))
+    return "\n".join(lines)
+
+#Outputs compared with the original scripts' leave out the removed_peer_ids (see above)
+def normalized_output(tool, text, against_original):
+    if tool == MEGAHUB:
+        return normalized_megahub_output(text)
+    return re.sub(r'"removed_peer_id": "[0-9a-f]*"', '"removed_peer_id": ""', text) if against_original else text
+
+#Returns a copy of the channels of graph with every policy replaced by enabled(policy, the other direction's policy)
+def with_policies(graph, enabled):
+    return [(node1, node2, capacity, enabled(policy1, policy2), enabled(policy2, policy1)) for (node1, node2, capacity, policy1, policy2) in graph.channels]
+
+def prepare_graphs(work_dir):
+    graph = SyntheticGraph(num_nodes, seed)
+    paths = {
+        "cln": os.path.join(work_dir, "graph.json"),
+        "lnd": os.path.join(work_dir, "graph-lnd.json"),
+        "snapshot": os.path.join(work_dir, "graph.snap"),
+        "uniform": os.path.join(work_dir, "graph-uniform.json"),
+        "uniform-lnd": os.path.join(work_dir, "graph-uniform-lnd.json"),
+        "bidirectional": os.path.join(work_dir, "graph-bidirectional.json")
+    }
+    with open(paths["cln"], "w") as f:
+        graph.write_cln(f)
+    with open(paths["lnd"], "w") as f:
+        graph.write_lnd(f)
+    subprocess.run([sys.executable, COMPILE_SNAPSHOT, paths["snapshot"], paths["cln"]], check = True, stderr = subprocess.DEVNULL)
+    channels = graph.channels
+    graph.channels = with_policies(graph, lambda policy, other: None if policy is None else uniform_fees + (policy[2],))
+    with open(paths["uniform"], "w") as f:
+        graph.write_cln(f)
+    with open(paths["uniform-lnd"], "w") as f:
+        graph.write_lnd(f)
+    graph.channels = with_policies(graph, lambda policy, other: None if policy is None and other is None else (policy or other)[:2] + (False,))
+    with open(paths["bidirectional"], "w") as f:
+        graph.write_cln(f)
+    graph.channels = channels
+    positional = {
+        "fees": [graph.node_ids[graph.typical_routing_node()]] + recommender_fees,
+        "root": [graph.node_ids[graph.typical_routing_node()]],
+        "seeds": ["2"] + [graph.node_ids[n] for n in graph.connected_hubs(5)]
+    }
+    return (paths, positional)
+
+#Runs a case and returns the digest of its normalized output, or None if it failed
+def run_case(case, work_dir, paths, positional, against_original = False):
+    (name, tool, graph_input, options, arguments) = case
+    graph_option = ["--snapshot", paths["snapshot"]] if graph_input == "snapshot" else ["--input", paths[graph_input]]
+    #the outputs must not depend on string hashing
+    env = dict(os.environ, PYTHONHASHSEED = "0")
+    result = subprocess.run([sys.executable, tool] + graph_option + options + positional[arguments], stdout = subprocess.PIPE, stderr = subprocess.PIPE, universal_newlines = True, env = env)
+    return digest_of(name, tool, result, work_dir, against_original)
+
+#Runs a baseline case with the original script in baseline_dir and returns the digest of its normalized output,
+#or None if it failed. The original node_recommender.py reads the graph from stdin, and megahub.py from RPC.
+def run_baseline_case(case, baseline_dir, work_dir, paths, positional):
+    (name, tool, graph_input, options, arguments) = case
+    original = os.path.join(baseline_dir, os.path.relpath(tool, CHANNEL_ANALYSIS))
+    env = dict(os.environ, PYTHONHASHSEED = "0")
+    if tool == MEGAHUB:
+        replay_dir = os.path.join(work_dir, "rpc-replay")
+        os.makedirs(os.path.join(replay_dir, "pyln"), exist_ok = True)
+        for (module, source) in (("__init__.py", ""), ("client.py", RPC_REPLAY)):
+            with open(os.path.join(replay_dir, "pyln", module), "w") as f:
+                f.write(source)
+        env.update(PYTHONPATH = replay_dir, LISTCHANNELS_JSON = paths[graph_input])
+        result = subprocess.run([sys.executable, original] + positional[arguments], stdout = subprocess.PIPE, stderr = subprocess.PIPE, universal_newlines = True, env = env)
+    else:
+        with open(paths[graph_input]) as f:
+            result = subprocess.run([sys.executable, original] + positional[arguments], stdin = f, stdout = subprocess.PIPE, stderr = subprocess.PIPE, universal_newlines = True, env = env)
+    return digest_of("%s-original" % name, tool, result, work_dir, True)
+
+#Saves the normalized output of a finished run as name.out in work_dir and returns its digest, or None if it failed
+def digest_of(name, tool, result, work_dir, against_original):
+    output = normalized_output(tool, result.stdout, against_original)
+    with open(os.path.join(work_dir, "%s.out" % name), "w") as f:
+        f.write(output)
+    if result.returncode != 0:
+        sys.stdout.write("%-26s failed:\n%s" % (name, result.stderr[-2000:]))
+        return None
+    return hashlib.sha256(output.encode("utf-8")).hexdigest()
+
+def load_expected():
+    if not os.path.exists(EXPECTED_PATH):
+        return dict()
+    with open(EXPECTED_PATH) as f:
+        return json.load(f)
+
+def save_expected(expected):
+    with open(EXPECTED_PATH, "w") as f:
+        json.dump(expected, f, indent = 4)
+        f.write("\n")
+
+#Returns the number of digests that differ from those in saved, reporting each
+def compare_digests(digests, saved, work_dir, label):
+    failures = 0
+    for (name, digest) in digests.items():
+        if digest is None:
+            continue
+        if digest == saved.get(name):
+            sys.stdout.write("%-26s %s\n" % (name, label))
+        else:
+            sys.stdout.write("%-26s CHANGED (output in %s)\n" % (name, os.path.join(work_dir, "%s.out" % name)))
+            failures += 1
+    return failures
+
+def check(work_dir, update, baseline_dir):
+    (paths, positional) = prepare_graphs(work_dir)
+    digests = {case[0]: run_case(case, work_dir, paths, positional) for case in CASES}
+    baseline_digests = {case[0]: run_case(case, work_dir, paths, positional, True) for case in BASELINE_CASES}
+    failures = len([d for d in list(digests.values()) + list(baseline_digests.values()) if d is None])
+    for (a, b) in SAME_OUTPUTS:
+        if digests[a] != digests[b]:
+            sys.stdout.write("%s and %s differ\n" % (a, b))
+            failures += 1
+    expected = load_expected()
+    if baseline_dir is not None:
+        originals = {case[0]: run_baseline_case(case, baseline_dir, work_dir, paths, positional) for case in BASELINE_CASES}
+        if None in originals.values():
+            sys.stdout.write("not saving %s: the original scripts failed\n" % EXPECTED_PATH)
+            return 1
+        expected["baseline_outputs"] = originals
+        save_expected(expected)
+        sys.stdout.write("saved the digests of %d outputs of the original scripts to %s\n" % (len(originals), EXPECTED_PATH))
+        return compare_digests(baseline_digests, originals, work_dir, "same as the original")
+    if update:
+        if failures > 0:
+            sys.stdout.write("not saving %s: %d checks failed\n" % (EXPECTED_PATH, failures))
+            return failures
+        #the digests of the original scripts don't come from this tree, so they are kept
+        save_expected({"format": EXPECTED_FORMAT, "num_nodes": num_nodes, "seed": seed, "outputs": digests, "baseline_outputs": expected.get("baseline_outputs", dict())})
+        sys.stdout.write("saved the digests of %d outputs to %s\n" % (len(digests), EXPECTED_PATH))
+        return 0
+    if expected.get("format") != EXPECTED_FORMAT or expected.get("num_nodes") != num_nodes or expected.get("seed") != seed:
+        sys.stdout.write("%s was saved for another graph or format; run with --update\n" % EXPECTED_PATH)
+        return failures + 1
+    failures += compare_digests(digests, expected["outputs"], work_dir, "same")
+    if len(expected.get("baseline_outputs", dict())) == 0:
+        sys.stdout.write("no digests of the original scripts saved; run with --baseline DIR\n")
+        return failures + 1
+    failures += compare_digests(baseline_digests, expected["baseline_outputs"], work_dir, "same as the original")
+    return failures
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    update = False
+    baseline_dir = None
+    work_dir = None
+    while len(args) > 0:
+        if args[0] == "--update":
+            update = True
+            args = args[1:]
+        elif args[0] == "--baseline" and len(args) >= 2:
+            baseline_dir = args[1]
+            args = args[2:]
+        elif args[0] == "--work-dir" and len(args) >= 2:
+            work_dir = args[1]
+            args = args[2:]
+        else:
+            print_usage_and_die()
+    if update and baseline_dir is not None:
+        print_usage_and_die()
+    if work_dir is not None:
+        os.makedirs(work_dir, exist_ok = True)
+        failures = check(work_dir, update, baseline_dir)
+    else:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            failures = check(temp_dir, update, baseline_dir)
+    if not update and baseline_dir is None:
+        sys.stdout.write("%s\n" % ("all outputs as expected" if failures == 0 else "%d checks failed" % failures))
+    sys.exit(1 if failures > 0 else 0)
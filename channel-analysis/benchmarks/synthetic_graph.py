@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+#Generates synthetic Lightning channel graphs shaped like the real one, as C-Lightning listnodes/listchannels or
+#LND describegraph JSON, for benchmarking the channel-analysis tools without a node or a gossip snapshot.
+#
+#Nodes join one at a time and open channels to peers picked in proportion to their number of channels
+#(preferential attachment), which gives the scale-free degree distribution of the LN: a few hubs with
+#thousands of channels and many nodes with one or two. Each node has its own fee style (a heavy-tailed
+#default ppm and a base fee of usually 1000 msat) that its channel policies vary around, a few nodes charge
+#nothing, channel sizes are log-normal, some channels have parallel channels between the same two nodes, and
+#a few are disabled. The same size and seed always give the same graph.
+import sys, json, math, random
+
+#Node ids and channel policies of a synthetic graph. channels holds (node1, node2, capacity, policy1, policy2)
+#with node indices; policy1 holds the fees of the direction node1 => node2, and a policy is
+#(base_fee_msat, fee_ppm, disabled) or None if the node never announced one.
+class SyntheticGraph:
+    def __init__(self, num_nodes, seed):
+        rnd = random.Random(seed)
+        self.node_ids = ["%02x%064x" % (rnd.choice([2, 3]), rnd.getrandbits(256)) for n in range(num_nodes)]
+        self.aliases = ["synthetic-%d" % n for n in range(num_nodes)]
+        #(base fee, ppm) each node's policies vary around: ppm is log-normal with a median of 50 and a long
+        #tail into the thousands, and 5% of the nodes route for free
+        self.fee_styles = list()
+        for n in range(num_nodes):
+            if rnd.random() < 0.05:
+                self.fee_styles.append((0, 0))
+            else:
+                self.fee_styles.append((rnd.choice([1000] * 8 + [0, 100, 2000, 5000]), min(int(math.exp(rnd.gauss(math.log(50), 1.5))), 50000)))
+        self.channels = list()
+        self.degree = [0] * num_nodes
+        ends = list() #every node once per channel end, so that a uniform choice is preferential
+        for n in range(num_nodes):
+            if n == 0:
+                continue
+            #number of channels opened on joining: Pareto-distributed, 1 for about half of the nodes
+            num_channels = min(int(rnd.paretovariate(1.2)), 200)
+            peers = set()
+            for i in range(num_channels):
+                peers.add(rnd.choice(ends) if len(ends) > 0 and rnd.random() < 0.9 else rnd.randrange(n))
+            for peer in peers:
+                self._add_channels(rnd, n, peer)
+                ends.extend([n, peer])
+
+    def _policy(self, rnd, n):
+        if rnd.random() < 0.01:
+            return None
+        (base_fee, ppm) = self.fee_styles[n]
+        #most channels keep the node's defaults, the others are tuned up or down
+        if rnd.random() < 0.3:
+            ppm = max(0, int(ppm * math.exp(rnd.gauss(0, 0.7))))
+        return (base_fee, ppm, rnd.random() < 0.03)
+
+    #Adds a channel between node1 and node2, and sometimes a few parallel ones that either have nearly the
+    #same fees (and so pool their capacity when merged) or clearly different ones
+    def _add_channels(self, rnd, node1, node2):
+        num_parallel = 1 if rnd.random() < 0.95 else rnd.randint(2, 4)
+        first = None
+        for i in range(num_parallel):
+            capacity = max(20000, min(int(math.exp(rnd.gauss(math.log(2000000), 1.3))), 500000000))
+            if first is not None and rnd.random() < 0.5:
+                (policy1, policy2) = [p if p is None else (p[0], p[1] + rnd.randint(0, 10), p[2]) for p in first]
+            else:
+                (policy1, policy2) = (self._policy(rnd, node1), self._policy(rnd, node2))
+            if first is None:
+                first = (policy1, policy2)
+            self.channels.append((node1, node2, capacity, policy1, policy2))
+            self.degree[node1] += 1
+            self.degree[node2] += 1
+
+    #Returns a node with many channels, but not one of the biggest hubs: the num_nodes / 200th best connected one
+    def typical_routing_node(self):
+        ranked = sorted(range(len(self.node_ids)), key = lambda n: (-self.degree[n], n))
+        return ranked[len(ranked) // 200]
+
+    #Returns up to count of the best connected nodes that all have channels to each other, best first
+    def connected_hubs(self, count):
+        adjacent = dict()
+        for (node1, node2, capacity, policy1, policy2) in self.channels:
+            adjacent.setdefault(node1, set()).add(node2)
+            adjacent.setdefault(node2, set()).add(node1)
+        hubs = list()
+        for n in sorted(range(len(self.node_ids)), key = lambda n: (-self.degree[n], n)):
+            if all([n in adjacent[h] for h in hubs]):
+                hubs.append(n)
+                if len(hubs) == count:
+                    break
+        return hubs
+
+    #Writes C-Lightning listnodes and listchannels output, combined into one object, to f
+    def write_cln(self, f):
+        f.write("{\"nodes\": [")
+        for n in range(len(self.node_ids)):
+            node = {"nodeid": self.node_ids[n], "alias": self.aliases[n], "color": "3399ff", "last_timestamp": 1638316800, "features": "88a0000a0169a2", "addresses": []}
+            f.write("%s\n%s" % ("," if n > 0 else "", json.dumps(node)))
+        f.write("],\n\"channels\": [")
+        first = True
+        for (k, (node1, node2, capacity, policy1, policy2)) in enumerate(self.channels):
+            for (src, dest, policy, direction) in ((node1, node2, policy1, 0), (node2, node1, policy2, 1)):
+                if policy is None:
+                    continue
+                (base_fee, ppm, disabled) = policy
+                chan = {"source": self.node_ids[src], "destination": self.node_ids[dest], "short_channel_id": "%dx%dx%d" % (600000 + k // 1000, k % 1000, direction),
+                        "public": True, "satoshis": capacity, "amount_msat": "%dmsat" % (capacity * 1000), "message_flags": 1, "channel_flags": direction | (2 if disabled else 0),
+                        "active": not disabled, "last_update": 1638316800, "base_fee_millisatoshi": base_fee, "fee_per_millionth": ppm, "delay": 40,
+                        "htlc_minimum_msat": "1000msat", "htlc_maximum_msat": "%dmsat" % (capacity * 990)}
+                f.write("%s\n%s" % ("" if first else ",", json.dumps(chan)))
+                first = False
+        f.write("]}\n")
+
+    #Writes LND describegraph output to f
+    def write_lnd(self, f):
+        f.write("{\"nodes\": [")
+        for n in range(len(self.node_ids)):
+            node = {"last_update": 1638316800, "pub_key": self.node_ids[n], "alias": self.aliases[n], "addresses": [], "color": "#3399ff", "features": {}}
+            f.write("%s\n%s" % ("," if n > 0 else "", json.dumps(node)))
+        f.write("],\n\"edges\": [")
+        for (k, (node1, node2, capacity, policy1, policy2)) in enumerate(self.channels):
+            #lngraph.ingest charges the direction node1 => node2 the fees of node2_policy, so each direction's policy
+            #goes where it is read from, and both formats of a graph give the same channel graph
+            edge = {"channel_id": str(((600000 + k // 1000) << 40) | ((k % 1000) << 16)), "chan_point": "%064x:0" % k, "last_update": 1638316800,
+                    "node1_pub": self.node_ids[node1], "node2_pub": self.node_ids[node2], "capacity": str(capacity),
+                    "node1_policy": lnd_policy(policy2, capacity), "node2_policy": lnd_policy(policy1, capacity)}
+            f.write("%s\n%s" % ("," if k > 0 else "", json.dumps(edge)))
+        f.write("]}\n")
+
+def lnd_policy(policy, capacity):
+    if policy is None:
+        return None
+    (base_fee, ppm, disabled) = policy
+    return {"time_lock_delta": 40, "min_htlc": "1000", "fee_base_msat": str(base_fee), "fee_rate_milli_msat": str(ppm), "disabled": disabled,
+            "max_htlc_msat": str(capacity * 990), "last_update": 1638316800}
+
+def print_usage_and_die():
+    sys.stderr.write("Usage:\n")
+    sys.stderr.write("%s [--lnd] [--seed S] num_nodes > graph.json\n" % sys.argv[0])
+    sys.stderr.write("\n")
+    sys.stderr.write("Writes a synthetic channel graph of num_nodes nodes as C-Lightning listnodes and listchannels JSON,\n")
+    sys.stderr.write("or with --lnd as LND describegraph JSON. The same num_nodes and seed (default 1) give the same graph.\n")
+    sys.exit(1)
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    lnd = False
+    seed = 1
+    while len(args) > 0 and args[0].startswith("--"):
+        if args[0] == "--lnd":
+            lnd = True
+            args = args[1:]
+        elif args[0] == "--seed" and len(args) >= 2:
+            seed = int(args[1])
+            args = args[2:]
+        else:
+            print_usage_and_die()
+    if len(args) != 1:
+        print_usage_and_die()
+    graph = SyntheticGraph(int(args[0]), seed)
+    if lnd:
+        graph.write_lnd(sys.stdout)
+    else:
+        graph.write_cln(sys.stdout)
+    sys.stderr.write("%d nodes, %d channels; a typical routing node is %s\n" % (len(graph.node_ids), len(graph.channels), graph.node_ids[graph.typical_routing_node()]))
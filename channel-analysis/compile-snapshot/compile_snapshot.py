@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+#Compiles a C-Lightning or LND channel graph dump into a binary snapshot for node_recommender.py and megahub.py
+#pip3 install numpy
+import sys, os, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(sys.argv[0])), ".."))
+from lngraph.ingest import ChannelGraphParser
+from lngraph.snapshot import GraphSnapshot, SnapshotError, write_snapshot, source_fingerprint, read_snapshot_header, source_unchanged
+
+
+#####################################################
+#GLOBAL VARIABLES
+#####################################################
+
+#Compile even if the snapshot is already up to date with its source
+force = False
+
+
+#####################################################
+#FUNCTION DEFINITIONS
+#####################################################
+
+def print_usage_and_die():
+    sys.stderr.write("Usage:\n")
+    sys.stderr.write("%s [--force] snapshot_file [graph.json ...]\n" % sys.argv[0])
+    sys.stderr.write("\n")
+    sys.stderr.write("Parses a channel graph dump (the same JSON node_recommender.py reads: C-Lightning listnodes and\n")
+    sys.stderr.write("listchannels output, separately or combined, or LND describegraph output) from the graph.json files\n")
+    sys.stderr.write("or stdin and writes it to snapshot_file, which node_recommender.py and megahub.py can then load with\n")
+    sys.stderr.write("--snapshot snapshot_file.\n")
+    sys.stderr.write("\n")
+    sys.stderr.write("--force: Compile even if snapshot_file was already compiled from the unchanged graph.json files\n")
+    sys.stderr.write("\n")
+    sys.exit(1)
+
+#Returns whether the snapshot at path was compiled from exactly the current content of source_paths
+def is_up_to_date(path, source_paths):
+    try:
+        (header, payload_start) = read_snapshot_header(path)
+    except (OSError, SnapshotError):
+        return False
+    sources = header["sources"]
+    if [source["path"] for source in sources] != [os.path.abspath(source_path) for source_path in source_paths]:
+        return False
+    return all([source_unchanged(source) for source in sources])
+
+
+#####################################################
+#MAIN BODY
+#####################################################
+
+args = list()
+for arg in sys.argv[1:]:
+    if arg == "--force":
+        force = True
+    elif arg.startswith("--"):
+        print_usage_and_die()
+    else:
+        args.append(arg)
+if len(args) < 1:
+    print_usage_and_die()
+snapshot_path = args[0]
+source_paths = args[1:]
+
+#pipes (e.g. <(lightning-cli listchannels)) can't be checked for changes later, and reading them for a
+#fingerprint would consume them
+regular_files = all([os.path.isfile(source_path) for source_path in source_paths])
+if len(source_paths) > 0 and regular_files and not force and is_up_to_date(snapshot_path, source_paths):
+    sys.stderr.write("%s is up to date\n" % snapshot_path)
+    sys.exit(0)
+
+start = time.time()
+#fingerprint before parsing, so a file replaced while it is being read makes the snapshot stale rather than wrong
+sources = [source_fingerprint(source_path) for source_path in source_paths if os.path.isfile(source_path)]
+parser = ChannelGraphParser()
+try:
+    if len(source_paths) == 0:
+        parser.add_stream(sys.stdin)
+    for source_path in source_paths:
+        with open(source_path) as f:
+            parser.add_stream(f)
+except ValueError as e:
+    sys.stderr.write("Could not read the channel graph: %s\n\n" % e)
+    print_usage_and_die()
+sys.stderr.write("%s\n" % parser.ingest_summary())
+write_snapshot(snapshot_path, parser, sources)
+
+load_start = time.time()
+GraphSnapshot(snapshot_path)
+sys.stderr.write("%s: %d bytes, compiled in %.1fs, loads in %.3fs\n" % (snapshot_path, os.path.getsize(snapshot_path), load_start - start, time.time() - load_start))
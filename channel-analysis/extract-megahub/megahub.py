@@ -1,165 +1,216 @@
 #!/usr/bin/python3
 import sys
+import os
 import json
+import math
+import numpy
 from datetime import date, datetime
 from pyln.client import LightningRpc
 from os.path import expanduser
-from mpmath import *
-from functools import reduce
 
-rpc = LightningRpc(expanduser("~") + "/.lightning/bitcoin/lightning-rpc")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(sys.argv[0])), ".."))
+from lngraph.allpairs import AllPairsDistances
+from lngraph.ingest import ChannelGraphParser
+from lngraph.metrics import geomean, format_metric
+from lngraph.profile import profiler
+from lngraph.sampling import confidence_interval
+from lngraph.snapshot import GraphSnapshot, SnapshotError
+from lngraph.triangles import MegahubExtraction
+from lngraph.truss import TriangleIndex
+
 N = 1 # min number of triangles
 megahub_nodes = set()
-adjacent = dict() # node_id -> adjacent node_ids (i.e. other node_ids to which this node has a direct channel)
+node_ids = list() # node number -> node_id, the numbers the channels are interned as
+channels = None # (src, dest) node numbers of the channels, an array of shape (channels, 2)
 min_chan_size = 100000 #satoshis minimum in a channel for it to be considered
+snapshot_path = None #read the channel graph from this compiled snapshot instead of from lightningd
+input_paths = list() #read the channel graph from these JSON files instead of from lightningd
+profile_path = None #write per-phase wall times and call counts to this JSON file
+profile_trace_path = None #write every profiled phase as a Chrome trace event to this file
+profile_memory = False #also record the peak of memory allocated in each phase, with tracemalloc
+truss = False #take the megahub from the k-truss decomposition instead of extracting it triangle by triangle
+exact_asp = False #search from every node of the wider LN instead of estimating its ASPs from a sample of them
+asp_pivots = 512 #number of nodes of each group to search from when estimating the wider LN ASPs
+asp_seed = 1 #seed of the sample of nodes searched from
 
 def print_usage_and_die():
     sys.stderr.write("Usage:\n")
-    sys.stderr.write("%s N node_id [node_id ...]" % sys.argv[0])
+    sys.stderr.write("%s [--snapshot FILE | --input FILE [--input FILE ...]] [--truss] [--exact-asp] [--asp-pivots K] [--asp-seed S] [--profile FILE] [--profile-trace FILE] [--profile-memory] N node_id [node_id ...]" % sys.argv[0])
     sys.stderr.write("\n")
     sys.stderr.write("Extracts the megahub rooted at the specified node_ids with all nodes having at least N\n")
     sys.stderr.write("triangles where both other nodes are already in the megahub.\n")
     sys.stderr.write("\n")
+    sys.stderr.write("--snapshot FILE: Read the channel graph from a snapshot compiled by compile_snapshot.py instead of\n")
+    sys.stderr.write("                 from lightningd's listchannels\n")
+    sys.stderr.write("--input FILE: Read the channel graph from FILE instead of from lightningd: C-Lightning listchannels (and\n")
+    sys.stderr.write("              listnodes) output or LND describegraph output, the JSON node_recommender.py reads\n")
+    sys.stderr.write("--truss: Take the megahub from the k-truss decomposition of the channel graph: the connected components\n")
+    sys.stderr.write("         of the (N + 2)-truss that contain a seed, in which every channel is in at least N triangles\n")
+    sys.stderr.write("         of the megahub. Also prints the size of this megahub for every N.\n")
+    sys.stderr.write("--asp-pivots K: Estimate the average shortest paths in the wider LN from breadth-first searches from\n")
+    sys.stderr.write("                K sampled nodes of each group (default 512), with 95%% confidence intervals\n")
+    sys.stderr.write("--asp-seed S: Seed of the sampled nodes (default 1); the same graph and seed give the same estimates\n")
+    sys.stderr.write("--exact-asp: Search from every node of the wider LN instead (slow on large graphs)\n")
+    sys.stderr.write("--profile FILE: Write the wall time and number of calls of each phase (graph loading, triangle\n")
+    sys.stderr.write("                extraction, shortest paths, ...) to FILE as JSON\n")
+    sys.stderr.write("--profile-trace FILE: Write every phase as an event to FILE in the Chrome trace event format\n")
+    sys.stderr.write("--profile-memory: With --profile or --profile-trace, also record allocation peaks (slower)\n")
+    sys.stderr.write("\n")
     sys.exit(1)
 
-#Calculate the average shortest path length from root_node to each node in lowfee_nodes
-def calculate_asp(edges, nodes, root_node):
-    min_distance = dict()
-    mega_adjacent = dict()
-    processed = set()
-
-    for (src, dest) in edges:
-        if src not in mega_adjacent:
-            mega_adjacent[src] = set()
-        if dest not in mega_adjacent:
-            mega_adjacent[dest] = set()
-        mega_adjacent[src].add(dest)
-        mega_adjacent[dest].add(src)
-        min_distance[src] = sys.maxsize
-        min_distance[dest] = sys.maxsize
-
-    #Calculate shortest path lengths:
-    bfs_queue = [(root_node, 0)]
-    processed.add(root_node)
-    while len(bfs_queue) > 0:
-        (cur_node, distance) = bfs_queue.pop(0)
-        for a in mega_adjacent[cur_node]:
-            if (distance + 1) < min_distance[a]:
-                min_distance[a] = distance + 1
-            if a not in processed:
-                bfs_queue.append((a, distance + 1))
-                processed.add(a)
-
-    #Calculate average shortest path lengths:
-    #path_length_sum = reduce(lambda x,y: x+y, map(lambda n: min_distance[n], filter(lambda n: True if n in min_distance else False, nodes)))
-    #return float(path_length_sum)/len(nodes)
-    filter_func = lambda n: True if n in min_distance else False
-    path_length_prod = reduce(lambda x,y: x*y, map(lambda n: mpf(min_distance[n]), filter(filter_func, nodes)))
-    path_length_count = reduce(lambda x,y: x+y, map(lambda n: 1, filter(filter_func, nodes)))
-    return power(path_length_prod, mpf(1.0) / mpf(path_length_count))
+#Prints the geometric mean ASP of a group of num_nodes nodes from estimate, the (mean, standard error, number of
+#nodes searched) of the logarithms of their ASPs, with its confidence interval unless every node was searched
+def print_estimated_asp(description, estimate, num_nodes):
+    (log_mean, error, num_searched) = estimate
+    if num_searched >= num_nodes:
+        print("%s is %s" % (description, format_metric(math.exp(log_mean))))
+        return
+    (low, high) = confidence_interval(log_mean, error)
+    print("%s is %s (95%% confidence interval %s to %s, estimated from %d of %d nodes)" % (description, format_metric(math.exp(log_mean)), format_metric(math.exp(low)), format_metric(math.exp(high)), num_searched, num_nodes))
 
 #####################################################
 #MAIN BODY
 #####################################################
 
 # parse command line args:
-if len(sys.argv) < 3:
+args = sys.argv[1:]
+while len(args) > 0 and args[0].startswith("--"):
+    if args[0] == "--snapshot" and len(args) >= 2:
+        snapshot_path = args[1]
+        args = args[2:]
+    elif args[0] == "--input" and len(args) >= 2:
+        input_paths.append(args[1])
+        args = args[2:]
+    elif args[0] == "--truss":
+        truss = True
+        args = args[1:]
+    elif args[0] == "--exact-asp":
+        exact_asp = True
+        args = args[1:]
+    elif args[0] == "--asp-pivots" and len(args) >= 2:
+        asp_pivots = int(args[1])
+        args = args[2:]
+    elif args[0] == "--asp-seed" and len(args) >= 2:
+        asp_seed = int(args[1])
+        args = args[2:]
+    elif args[0] == "--profile" and len(args) >= 2:
+        profile_path = args[1]
+        args = args[2:]
+    elif args[0] == "--profile-trace" and len(args) >= 2:
+        profile_trace_path = args[1]
+        args = args[2:]
+    elif args[0] == "--profile-memory":
+        profile_memory = True
+        args = args[1:]
+    else:
+        print_usage_and_die()
+if len(args) < 2 or asp_pivots < 2 or (snapshot_path is not None and len(input_paths) > 0) or (profile_memory and profile_path is None and profile_trace_path is None):
     print_usage_and_die()
+if profile_path is not None or profile_trace_path is not None:
+    profiler.enable(track_memory = profile_memory, trace = profile_trace_path is not None)
+
+N = int(args[0])
+seed_ids = args[1:]
+
+# read the channels:
+if snapshot_path is not None:
+    try:
+        with profiler.phase("snapshot load"):
+            snapshot = GraphSnapshot(snapshot_path)
+            node_ids = snapshot.node_ids()[:snapshot.num_nodes]
+            channels = snapshot.channels(min_chan_size)
+    except (OSError, SnapshotError) as e:
+        sys.stderr.write("%s\n" % e)
+        sys.exit(1)
+else:
+    parser = ChannelGraphParser()
+    try:
+        if len(input_paths) > 0:
+            with profiler.phase("graph load"):
+                for path in input_paths:
+                    with open(path) as f:
+                        parser.add_stream(f)
+        else:
+            with profiler.phase("listchannels"):
+                parser.add_cln_rpc(LightningRpc(expanduser("~") + "/.lightning/bitcoin/lightning-rpc"), nodes = False)
+    except (OSError, ValueError) as e:
+        sys.stderr.write("Could not read the channel graph: %s\n" % e)
+        sys.exit(1)
+    node_ids = [parser.node_to_id[n] for n in range(len(parser.node_to_id))]
+    channels = parser.channels(min_chan_size)
+    parser = None
+
+#seeds need not have channels; those without get numbers after the interned nodes
+id_to_node = {node_id: n for (n, node_id) in enumerate(node_ids)}
+for node_id in seed_ids:
+    if node_id not in id_to_node:
+        id_to_node[node_id] = len(node_ids)
+        node_ids.append(node_id)
+    megahub_nodes.add(id_to_node[node_id])
+num_nodes = len(node_ids)
 
-N = int(sys.argv[1])
-for i in range(2, len(sys.argv)): 
-    node_id = sys.argv[i]
-    megahub_nodes.add(node_id)
+# extract megahub:
+if truss:
+    triangles = TriangleIndex(channels, num_nodes)
+    max_trussness = int(triangles.trussness().max()) if len(triangles.edges) > 0 else 2
+    #the k-truss hubs of every N at once, N being the minimum number of triangles k - 2
+    hub_sizes = ["N=%d: %d" % (n, len(megahub_nodes | triangles.truss_hub(n + 2, megahub_nodes))) for n in range(1, max_trussness - 1)]
+    print("k-truss megahub sizes: %s" % (", ".join(hub_sizes) if len(hub_sizes) > 0 else "no triangles"))
+    megahub_nodes = megahub_nodes | triangles.truss_hub(N + 2, megahub_nodes)
+else:
+    megahub_nodes = MegahubExtraction(channels, num_nodes, megahub_nodes, N).hub
 
-# build adjacent dict:
-for chan in rpc.listchannels()["channels"]:
-    src = chan["source"]
-    dst = chan["destination"]
+print("%d nodes in the megahub:" % len(megahub_nodes))
+print({node_ids[n] for n in megahub_nodes})
 
-    if src not in adjacent:
-        adjacent[src] = set()
-    if dst not in adjacent:
-        adjacent[dst] = set()
+#the channels within the megahub, and the nodes of the wider LN: those some channel leads to
+in_megahub = numpy.zeros(num_nodes, dtype = bool)
+in_megahub[list(megahub_nodes)] = True
+mega_edges = channels[in_megahub[channels[:, 0]] & in_megahub[channels[:, 1]]]
+all_nodes = set(numpy.unique(channels[:, 1]).tolist())
+non_megahub_nodes = {n for n in filter(lambda x: x not in megahub_nodes, all_nodes)}
 
-    if chan["active"] and int(chan["satoshis"]) > min_chan_size:
-        adjacent[src].add(dst)
+megahub_asp = AllPairsDistances(mega_edges, num_nodes).geomeans(megahub_nodes, megahub_nodes)
 
-# extract megahub:
-finished = False
-while not finished:
-    potentials = set()
-    finished = True
-    for node in megahub_nodes:
-        for n in filter(lambda x: x not in megahub_nodes, adjacent[node]):
-            potentials.add(n)
-    for src in potentials:
-        triangle_edges = set()
-        for dst1 in filter(lambda x: x in megahub_nodes, adjacent[src]):
-            # if there exists another adjacency dst2 that is in turn directly
-            # connected to dst1, the edges (src, dst1) and (src, dst2) are
-            # triangle edges
-            if (src, dst1) not in triangle_edges:
-                for dst2 in filter(lambda x: x in megahub_nodes and x != dst1, adjacent[src]):
-#                for dst2 in filter(lambda x: x != dst1, adjacent[src]): #FIXME do triangles have to have *both* other nodes already in the megahub?
-                    if dst1 in adjacent[dst2]:
-                        triangle_edges.add((src, dst1))
-                        triangle_edges.add((src, dst2))
-                        break
-        if len(triangle_edges) - 1 >= N:
-            megahub_nodes.add(src)
-            finished = False
+asp = geomean(list(megahub_asp.values()))
 
-print("%d nodes in the megahub:" % len(megahub_nodes))
-print(megahub_nodes)
-
-mega_edges = set()
-all_edges = set()
-all_nodes = set()
-for n in megahub_nodes:
-    for a in filter(lambda x: x in megahub_nodes, adjacent[n]):
-        mega_edges.add((n, a))
-for (n, adj) in adjacent.items():
-    for a in adj:
-        if a in adjacent:
-            all_nodes.add(a)
-            all_edges.add((n, a))
-non_megahub_nodes = {n for n in filter(lambda x: x not in megahub_nodes, all_nodes)}
+print("average shortest path in the megahub is %s" % format_metric(asp))
 
-megahub_asp = dict()
-for n in megahub_nodes:
-    asp = calculate_asp(mega_edges, megahub_nodes, n)
-    megahub_asp[n] = asp
+all_distances = AllPairsDistances(channels, num_nodes)
+if exact_asp:
+    megahub_all_asp = all_distances.geomeans(megahub_nodes, all_nodes)
 
-asp_prod = reduce(lambda x,y: x*y, [v for k, v in megahub_asp.items()])
-asp = power(asp_prod, mpf(1.0) / mpf(len(megahub_nodes)))
+    asp = geomean(list(megahub_all_asp.values()))
 
-print("average shortest path in the megahub is %s" % nstr(asp, 6))
+    print("average shortest path for megahub nodes in the wider LN is %s" % format_metric(asp))
 
-megahub_all_asp = dict()
-for n in megahub_nodes:
-    asp = calculate_asp(all_edges, all_nodes, n)
-    megahub_all_asp[n] = asp
+    non_megahub_all_asp = all_distances.geomeans(non_megahub_nodes, all_nodes)
 
-asp_prod = reduce(lambda x,y: x*y, [v for k, v in megahub_all_asp.items()])
-asp = power(asp_prod, mpf(1.0) / mpf(len(megahub_nodes)))
+    asp = geomean(list(non_megahub_all_asp.values()))
 
-print("average shortest path for megahub nodes in the wider LN is %s" % nstr(asp, 6))
+    print("average shortest path for non-megahub nodes in the wider LN is %s" % format_metric(asp))
 
-non_megahub_all_asp = dict()
-for n in non_megahub_nodes:
-    asp = calculate_asp(all_edges, all_nodes, n)
-    non_megahub_all_asp[n] = asp
+    combined_asp = [v for k, v in non_megahub_all_asp.items()]
+    for k, v in megahub_all_asp.items():
+        combined_asp.append(v)
 
-asp_prod = reduce(lambda x,y: x*y, [v for k, v in non_megahub_all_asp.items()])
-asp = power(asp_prod, mpf(1.0) / mpf(len(non_megahub_nodes)))
+    asp = geomean(combined_asp)
 
-print("average shortest path for non-megahub nodes in the wider LN is %s" % nstr(asp, 6))
+    print("average shortest path in the wider LN is %s" % format_metric(asp))
+else:
+    megahub_estimate = all_distances.sampled_log_mean(megahub_nodes, all_nodes, asp_pivots, asp_seed)
+    print_estimated_asp("average shortest path for megahub nodes in the wider LN", megahub_estimate, len(megahub_nodes))
 
-combined_asp = [v for k, v in non_megahub_all_asp.items()]
-for k, v in megahub_all_asp.items():
-    combined_asp.append(v)
+    non_megahub_estimate = all_distances.sampled_log_mean(non_megahub_nodes, all_nodes, asp_pivots, asp_seed)
+    print_estimated_asp("average shortest path for non-megahub nodes in the wider LN", non_megahub_estimate, len(non_megahub_nodes))
 
-asp_prod = reduce(lambda x,y: x*y, combined_asp)
-asp = power(asp_prod, mpf(1.0) / mpf(len(combined_asp)))
+    #the groups are sampled independently, so the variance of their weighted mean is the weighted sum of theirs
+    num_nodes = len(megahub_nodes) + len(non_megahub_nodes)
+    log_mean = (len(megahub_nodes) * megahub_estimate[0] + len(non_megahub_nodes) * non_megahub_estimate[0]) / num_nodes
+    error = math.sqrt((len(megahub_nodes) * megahub_estimate[1]) ** 2 + (len(non_megahub_nodes) * non_megahub_estimate[1]) ** 2) / num_nodes
+    print_estimated_asp("average shortest path in the wider LN", (log_mean, error, megahub_estimate[2] + non_megahub_estimate[2]), num_nodes)
 
-print("average shortest path in the wider LN is %s" % nstr(asp, 6))
+if profile_path is not None:
+    profiler.write_summary(profile_path)
+if profile_trace_path is not None:
+    profiler.write_trace(profile_trace_path)
@@ -0,0 +1,5 @@
+#Shared graph routines for the channel-analysis scripts: one channel graph parser for C-Lightning RPC, C-Lightning
+#JSON and LND JSON (ingest), the channels it interns as node numbers (graph, snapshot), one undirected adjacency
+#and breadth-first search over them (graph, allpairs) and the metrics computed from them.
+#The scripts add channel-analysis/ to sys.path and import the modules they need, e.g.
+#    from lngraph.connectivity import UnitConnectivity
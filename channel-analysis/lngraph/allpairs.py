@@ -0,0 +1,172 @@
+#Shortest path lengths from many sources at once, by bit-parallel multi-source breadth-first search
+#pip3 install numpy
+import sys
+import math
+import numpy
+from lngraph.graph import undirected_csr
+from lngraph.metrics import geomean_of_log_sum
+from lngraph.profile import profiled
+from lngraph.sampling import StratifiedSample
+
+#Multi-source BFS (MS-BFS) runs the breadth-first searches of many sources together: every node holds a bitset
+#with one bit per source, and one level of all the searches is a single pass over the edges that ORs the
+#frontier bitsets of each node's neighbours into its own. With numpy arrays of 64-bit words, one vectorized pass
+#advances batch_words * 64 sources. The number of targets each source reaches at a level is a column-wise
+#popcount of the bitsets of the targets, which is all the geometric mean of the path lengths needs, so the
+#lengths themselves are never stored. distances_from() runs the same levels for a single source and keeps the
+#distance at which each node is first reached, for node_recommender.py's path lengths from its root node.
+#
+#The graph is the undirected adjacency of lngraph.graph.undirected_csr() over interned node numbers, restricted to
+#the rows of the nodes that have edges. Path lengths follow the breadth-first search megahub.py and
+#node_recommender.py have always used: channel directions are ignored, a target the source can't reach counts as
+#sys.maxsize, and the source itself, having been relaxed from one of its neighbours, counts as 2.
+class AllPairsDistances:
+    #edges are (src, dest) pairs of node numbers below num_nodes, as lngraph.graph.undirected_csr() takes them; the
+    #graph is built once for any number of queries
+    def __init__(self, edges, num_nodes, batch_words = 8):
+        (offsets, adjacent, present) = undirected_csr(edges, num_nodes)
+        self.batch_words = batch_words
+        #the searches run over the rows of the nodes that have edges, so no neighbour list is empty and reduceat()
+        #can use the offsets as is
+        self.node_rows = numpy.flatnonzero(present)
+        self.num_rows = len(self.node_rows)
+        self.row_of = numpy.full(num_nodes, -1, dtype = numpy.int64)
+        self.row_of[self.node_rows] = numpy.arange(self.num_rows)
+        self.adjacent = self.row_of[adjacent]
+        self.row_starts = offsets[:-1][present]
+        self.degree = numpy.diff(offsets)[present]
+        self._largest_component = None
+
+    #Returns the row of node n, or None if it has no edges
+    def _row(self, n):
+        row = int(self.row_of[n])
+        return row if row >= 0 else None
+
+    #Returns the sorted array of the rows of the nodes of targets that have edges
+    def _target_rows(self, targets):
+        rows = self.row_of[numpy.fromiter(targets, dtype = numpy.int64)]
+        return numpy.unique(rows[rows >= 0])
+
+    #Returns the list of shortest path lengths from source to every node number, with None for the nodes without
+    #edges. With targets, stops as soon as the lengths of all of them are known; the lengths of the other nodes are
+    #then only final up to the distance of the farthest target.
+    def distances_from(self, source, targets = None):
+        distances = numpy.full(self.num_rows, sys.maxsize, dtype = numpy.int64)
+        source_row = self._row(source)
+        if targets is not None:
+            unknown = numpy.zeros(self.num_rows, dtype = bool)
+            unknown[self._target_rows(targets)] = True
+            if source_row is not None:
+                unknown[source_row] = False
+        for (distance, frontier) in self._levels([source]):
+            reached = numpy.flatnonzero(frontier[:, 0])
+            distances[reached] = distance
+            if targets is not None:
+                unknown[reached] = False
+                if not unknown.any():
+                    break
+        if source_row is not None:
+            distances[source_row] = 2
+        result = numpy.full(len(self.row_of), -1, dtype = numpy.int64)
+        result[self.node_rows] = distances
+        return [d if d >= 0 else None for d in result.tolist()]
+
+    #Returns a dict mapping each node number of sources to the geometric mean of its shortest path lengths to the
+    #node numbers of targets that have edges
+    @profiled("asp")
+    def geomeans(self, sources, targets):
+        target_rows = self._target_rows(targets)
+        is_target = numpy.zeros(self.num_rows, dtype = bool)
+        is_target[target_rows] = True
+        if len(target_rows) == 0:
+            raise ValueError("geometric mean of no path lengths")
+        sources = list(sources)
+        result = dict()
+        batch_size = self.batch_words * 64
+        for start in range(0, len(sources), batch_size):
+            batch = sources[start:start + batch_size]
+            (log_sums, reached) = self._search(batch, target_rows)
+            for (j, n) in enumerate(batch):
+                i = self._row(n)
+                unreached = len(target_rows) - reached[j]
+                log_sum = log_sums[j]
+                if i is not None and is_target[i]:
+                    unreached -= 1
+                    log_sum += math.log(2)
+                log_sum += unreached * math.log(sys.maxsize)
+                result[n] = geomean_of_log_sum(log_sum, len(target_rows))
+        return result
+
+    #Returns (mean, standard error, number of sources searched): the estimate of the mean of the logarithms of
+    #geomeans(sources, targets) from a sample of num_pivots of the sources, i.e. the logarithm of the geometric
+    #mean of their geomeans. Sources outside the largest connected component have targets they can't reach, which
+    #makes their logarithms an order of magnitude larger than the others', so they are all searched and only the
+    #sources in the largest component are sampled, stratified by their degree. The same arguments always give the
+    #same sample.
+    def sampled_log_mean(self, sources, targets, num_pivots, seed):
+        sources = list(sources)
+        if len(sources) <= num_pivots:
+            values = self.geomeans(sources, targets)
+            return (sum([math.log(v) for v in values.values()]) / len(sources), 0.0, len(sources))
+        largest = self.largest_component()
+        outside = list()
+        strata = dict()
+        for n in sources:
+            i = self._row(n)
+            if i is None or i not in largest:
+                outside.append(n)
+            else:
+                strata.setdefault(min(int(math.log2(self.degree[i])), 6), list()).append(n)
+        sample = StratifiedSample([strata[k] for k in sorted(strata)], num_pivots, seed)
+        values = self.geomeans(sorted(sample.nodes) + outside, targets)
+        logs = {n: math.log(v) for (n, v) in values.items()}
+        (total, error) = sample.total(logs) if sample.population > 0 else (0.0, 0.0)
+        total += sum([logs[n] for n in outside])
+        return (total / len(sources), error / len(sources), len(sample.nodes) + len(outside))
+
+    #Returns the set of rows of the nodes in the largest connected component, ignoring channel directions
+    def largest_component(self):
+        if self._largest_component is None:
+            #every node takes the smallest label among itself and its neighbours until no label changes
+            labels = numpy.arange(self.num_rows)
+            while True:
+                smallest = numpy.minimum(labels, numpy.minimum.reduceat(labels[self.adjacent], self.row_starts))
+                #jump to the label of the label, which halves the remaining distance on long paths
+                smallest = smallest[smallest]
+                if numpy.array_equal(smallest, labels):
+                    break
+                labels = smallest
+            largest = numpy.bincount(labels).argmax() if self.num_rows > 0 else 0
+            self._largest_component = set(numpy.flatnonzero(labels == largest).tolist())
+        return self._largest_component
+
+    #Runs the searches of the sources of batch together and returns, per source, the sum of the logarithms of
+    #its path lengths to the targets it reaches and the number of those targets, not counting itself
+    def _search(self, batch, target_rows):
+        num_words = (len(batch) + 63) // 64
+        log_sums = numpy.zeros(num_words * 64, dtype = numpy.float64)
+        reached = numpy.zeros(num_words * 64, dtype = numpy.int64)
+        for (distance, frontier) in self._levels(batch):
+            #bit j % 64 of word j // 64 is bit j of the little-endian bytes of a row
+            counts = numpy.unpackbits(frontier[target_rows].view(numpy.uint8), axis = 1, bitorder = "little").sum(axis = 0, dtype = numpy.int64)
+            log_sums += counts * math.log(distance)
+            reached += counts
+        return (log_sums[:len(batch)].tolist(), reached[:len(batch)].tolist())
+
+    #Runs the searches of the node numbers of batch together and yields (distance, frontier) for every level,
+    #where bit j of row i of frontier is set if the source batch[j] first reaches the node of row i at distance
+    def _levels(self, batch):
+        num_words = (len(batch) + 63) // 64
+        frontier = numpy.zeros((self.num_rows, num_words), dtype = "<u8")
+        for (j, n) in enumerate(batch):
+            i = self._row(n)
+            if i is not None:
+                frontier[i, j // 64] |= numpy.uint64(1 << (j % 64))
+        seen = frontier.copy()
+        distance = 0
+        while frontier.any():
+            distance += 1
+            frontier = numpy.bitwise_or.reduceat(frontier[self.adjacent], self.row_starts, axis = 0)
+            frontier &= ~seen
+            seen |= frontier
+            yield (distance, frontier)
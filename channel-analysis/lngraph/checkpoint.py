@@ -0,0 +1,56 @@
+#Checkpoints of finished candidate results, so that an interrupted run can be resumed
+import os, json, hashlib
+
+#The checkpoint is a JSON object holding its format version, the fingerprint of the run that wrote it and, per
+#section of the run (e.g. one per fee threshold), an object mapping the ids of finished candidates to their
+#result objects. It is written to a temporary file that then replaces the checkpoint, so a run killed while
+#writing it leaves the previous checkpoint intact.
+CHECKPOINT_VERSION = 1
+
+class CheckpointError(Exception):
+    pass
+
+#Returns the fingerprint of a run: a BLAKE2b digest of its channel graph (a lngraph.graph.ChannelGraph), the ids
+#and aliases of its nodes and settings, a JSON-serializable object of every other setting its results depend on
+def run_fingerprint(channel_graph, node_ids, aliases, settings):
+    digest = hashlib.blake2b(digest_size = 20)
+    digest.update(channel_graph.digest().encode("utf-8"))
+    digest.update(json.dumps([node_ids, aliases, settings], sort_keys = True).encode("utf-8"))
+    return digest.hexdigest()
+
+class Checkpoint:
+    #With resume, loads the results of the checkpoint at path, which must have been written by a run with the same
+    #fingerprint; otherwise, and if there is no checkpoint at path yet, starts without results.
+    #Raises CheckpointError if the checkpoint can't be read or belongs to another run.
+    def __init__(self, path, fingerprint, resume):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.sections = dict()
+        if not resume or not os.path.exists(path):
+            return
+        try:
+            with open(path) as f:
+                obj = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CheckpointError("Could not read the checkpoint %s: %s" % (path, e))
+        if obj.get("version") != CHECKPOINT_VERSION:
+            raise CheckpointError("%s has checkpoint format version %s, expected %d" % (path, obj.get("version"), CHECKPOINT_VERSION))
+        if obj.get("fingerprint") != fingerprint:
+            raise CheckpointError("%s was written by a run with another channel graph or other settings" % path)
+        self.sections = obj["sections"]
+
+    #Returns the dict mapping candidate ids of section to their results, to look finished candidates up in and
+    #add results to
+    def results(self, section):
+        return self.sections.setdefault(section, dict())
+
+    #Returns the number of finished candidates over all sections
+    def num_results(self):
+        return sum([len(results) for results in self.sections.values()])
+
+    def save(self):
+        obj = {"version": CHECKPOINT_VERSION, "fingerprint": self.fingerprint, "sections": self.sections}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(obj, f)
+        os.replace(tmp_path, self.path)
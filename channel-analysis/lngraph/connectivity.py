@@ -0,0 +1,325 @@
+#Root-to-all edge connectivity and capacity-weighted maxflows on channel subgraphs
+#pip3 install PyMaxflow numpy
+import numpy
+import maxflow
+from lngraph.profile import profiler, profiled
+
+#Computes the unit-capacity maxflow (i.e. the number of edge-disjoint directed paths) from a fixed
+#source to any number of sinks in the same edge set.
+#
+#Gomory-Hu trees only exist for undirected graphs, and channel directions matter here, so instead the
+#node interning, degree counts and the maxflow.Graph holding every edge are built once. Each sink then
+#only costs a C-level copy of that graph plus the two terminal edges, which yields exactly the values of
+#building a fresh maxflow.Graph per sink.
+#
+#Low-fee subgraphs have many leaf nodes and pendant chains. Ignoring directions, the nodes outside the
+#2-core (computed without ever removing the source) form trees that touch the core at a single node. The
+#only way into such a tree is through that node and then down the one tree path to the sink, so a tree
+#node's maxflow is 1 if that path is directed towards it and its attachment node is reachable, and 0
+#otherwise. A flow path that detours into a tree has to come back out through the same node, so the
+#trees don't change any flow between core nodes either, and the maxflow.Graph only holds the core.
+class UnitConnectivity:
+    graph_type = maxflow.Graph[int]
+
+    def __init__(self, edges, source):
+        edge_array = numpy.array(list(edges), dtype = numpy.int64).reshape(-1, 2)
+        self._build(edge_array, numpy.ones(len(edge_array), dtype = numpy.int64), source)
+
+    #Builds the core flow graph of edge_array, an (n, 2) array of (src, dest) node numbers, with the parallel
+    #edge capacities
+    @profiled("maxflow graph build")
+    def _build(self, edge_array, capacities, source):
+        (node_numbers, edge_nodes) = numpy.unique(edge_array, return_inverse = True)
+        edge_nodes = edge_nodes.reshape(-1, 2)
+        self.node_numbers = node_numbers
+        self.node_map = dict(zip(node_numbers.tolist(), range(len(node_numbers))))
+
+        num_nodes = len(node_numbers)
+        #the total capacity leaving and entering each node, i.e. its degrees with unit capacities
+        self.out_degree = numpy.bincount(edge_nodes[:, 0], weights = capacities, minlength = num_nodes).astype(numpy.int64)
+        self.in_degree = numpy.bincount(edge_nodes[:, 1], weights = capacities, minlength = num_nodes).astype(numpy.int64)
+        self.source = self.node_map[source]
+        self._peel_trees(edge_nodes, capacities, num_nodes)
+
+        core_mask = self.in_core[edge_nodes[:, 0]] & self.in_core[edge_nodes[:, 1]]
+        core_edges = edge_nodes[core_mask]
+        self.core_index = numpy.cumsum(self.in_core) - 1
+        num_core_nodes = int(self.in_core.sum())
+        self.num_nodes = num_nodes
+        self.num_edges = len(edge_array)
+        self.num_core_nodes = num_core_nodes
+        self.num_core_edges = len(core_edges)
+        self.core_flows = dict()
+        self.source_in_core_edges = bool((core_edges == self.source).any())
+
+        self.graph = self.graph_type(num_core_nodes, len(core_edges))
+        self.graph.add_nodes(num_core_nodes)
+        self.core_ends = self.core_index[core_edges]
+        self.core_capacities = capacities[core_mask]
+        if len(core_edges) > 0:
+            self.graph.add_edges(self.core_ends[:, 0], self.core_ends[:, 1], self.core_capacities, numpy.zeros(len(core_edges), dtype = capacities.dtype))
+        self.reversed_graph = None
+        self.residual_sources = dict()
+
+    #Sets in_core, and for every node outside the core the core node its tree is attached to (attachment),
+    #whether the tree path from there down to it is directed towards it (reached_down) and the smallest
+    #capacity along that path (path_capacity).
+    #Leaves are peeled a layer at a time; a leaf's parent is its one remaining neighbour.
+    def _peel_trees(self, edge_nodes, capacities, num_nodes):
+        #the undirected node pairs, with flags for which of their two directions are channels
+        low = numpy.minimum(edge_nodes[:, 0], edge_nodes[:, 1])
+        high = numpy.maximum(edge_nodes[:, 0], edge_nodes[:, 1])
+        (pair_keys, pair_of_edge) = numpy.unique(low * num_nodes + high, return_inverse = True)
+        pair_low = pair_keys // num_nodes
+        pair_high = pair_keys % num_nodes
+        upward = numpy.zeros(len(pair_keys), dtype = bool) #pair_low -> pair_high
+        upward_capacity = numpy.zeros(len(pair_keys), dtype = numpy.int64)
+        is_upward = edge_nodes[:, 0] < edge_nodes[:, 1]
+        upward[pair_of_edge[is_upward]] = True
+        upward_capacity[pair_of_edge[is_upward]] = capacities[is_upward]
+        downward = numpy.zeros(len(pair_keys), dtype = bool) #pair_high -> pair_low
+        downward_capacity = numpy.zeros(len(pair_keys), dtype = numpy.int64)
+        is_downward = edge_nodes[:, 0] > edge_nodes[:, 1]
+        downward[pair_of_edge[is_downward]] = True
+        downward_capacity[pair_of_edge[is_downward]] = capacities[is_downward]
+
+        degree = numpy.bincount(pair_low, minlength = num_nodes) + numpy.bincount(pair_high, minlength = num_nodes)
+        self.in_core = numpy.ones(num_nodes, dtype = bool)
+        pair_alive = numpy.ones(len(pair_keys), dtype = bool)
+        parent = numpy.full(num_nodes, -1, dtype = numpy.int64)
+        parent_pair = numpy.full(num_nodes, -1, dtype = numpy.int64)
+        layers = list()
+        while True:
+            leaves = self.in_core & (degree <= 1)
+            leaves[self.source] = False
+            if not leaves.any():
+                break
+            self.in_core[leaves] = False
+            layers.append(numpy.nonzero(leaves)[0])
+            pairs = numpy.nonzero(pair_alive & (leaves[pair_low] | leaves[pair_high]))[0]
+            pair_alive[pairs] = False
+            (l, h) = (pair_low[pairs], pair_high[pairs])
+            #a pair joining two leaves is a two-node component without the source; neither gets a parent
+            low_leaf = leaves[l] & ~leaves[h]
+            parent[l[low_leaf]] = h[low_leaf]
+            parent_pair[l[low_leaf]] = pairs[low_leaf]
+            high_leaf = leaves[h] & ~leaves[l]
+            parent[h[high_leaf]] = l[high_leaf]
+            parent_pair[h[high_leaf]] = pairs[high_leaf]
+            degree -= numpy.bincount(l, minlength = num_nodes) + numpy.bincount(h, minlength = num_nodes)
+
+        #parents were peeled after their children, so walk the layers back from the core outwards
+        self.attachment = numpy.full(num_nodes, -1, dtype = numpy.int64)
+        self.reached_down = numpy.zeros(num_nodes, dtype = bool)
+        self.path_capacity = numpy.zeros(num_nodes, dtype = numpy.int64)
+        for layer in reversed(layers):
+            v = layer[parent[layer] >= 0]
+            p = parent[v]
+            directed = numpy.where(p < v, upward[parent_pair[v]], downward[parent_pair[v]])
+            capacity = numpy.where(p < v, upward_capacity[parent_pair[v]], downward_capacity[parent_pair[v]])
+            parent_in_core = self.in_core[p]
+            self.attachment[v] = numpy.where(parent_in_core, p, self.attachment[p])
+            self.reached_down[v] = directed & (parent_in_core | self.reached_down[p])
+            self.path_capacity[v] = numpy.where(parent_in_core, capacity, numpy.minimum(capacity, self.path_capacity[p]))
+
+    #Returns a one-line summary of how much of the edge set the maxflow.Graph holds
+    def core_summary(self):
+        return "maxflow core of %d of %d nodes and %d of %d channels, %d nodes answered from attached trees" % (
+            self.num_core_nodes, self.num_nodes, self.num_core_edges, self.num_edges, self.num_nodes - self.num_core_nodes)
+
+    #No more edge-disjoint paths can reach sink than leave the source or enter the sink
+    def upper_bound(self, sink):
+        return int(min(self.out_degree[self.source], self.in_degree[self.node_map[sink]]))
+
+    #With limit, returns min(maxflow, limit) instead: the source's terminal capacity is cut down to limit,
+    #so the solver stops once limit paths are found
+    def maxflow_to(self, sink, limit = None):
+        t = self.node_map[sink]
+        if limit is None or not self._needs_flow_graph(t):
+            flow = self._node_maxflow(t)
+            return flow if limit is None else min(flow, limit)
+        if t in self.core_flows:
+            return min(self.core_flows[t], limit)
+        g = self._flow_graph(t, limit)
+        with profiler.phase("maxflow solve"):
+            return int(g.maxflow())
+
+    #Returns whether the maxflow to node index t takes a run of the flow solver
+    def _needs_flow_graph(self, t):
+        return self.in_core[t] and t != self.source and self.source_in_core_edges
+
+    #Returns a copy of the core flow graph with the terminal edges for node index t
+    @profiled("maxflow graph copy")
+    def _flow_graph(self, t, limit = None):
+        g = self.graph.copy()
+        #terminal capacities exceed the degrees in the whole edge set, so without a limit they never bind and
+        #no minimum cut goes through them
+        g.add_tedge(int(self.core_index[self.source]), int(self.out_degree[self.source]) + 1 if limit is None else limit, 0)
+        g.add_tedge(int(self.core_index[t]), 0, int(self.in_degree[t]) + 1)
+        return g
+
+    def _node_maxflow(self, t):
+        if not self.in_core[t]:
+            if not self.reached_down[t] or self.attachment[t] < 0:
+                return 0 #the tree isn't attached to the core at all
+            attachment = int(self.attachment[t])
+            #all of the flow passes the attachment node and then the tree path
+            path_capacity = int(self.path_capacity[t])
+            return path_capacity if attachment == self.source else min(self._node_maxflow(attachment), path_capacity)
+        if t == self.source:
+            #both terminal edges on one node: the flow is what passes straight through them
+            return int(min(self.out_degree[t], self.in_degree[t]))
+        if not self.source_in_core_edges:
+            return 0 #every channel of the source leads into a tree (and PyMaxflow crashes on copies with arc-less terminals)
+        if t not in self.core_flows:
+            g = self._flow_graph(t)
+            with profiler.phase("maxflow solve"):
+                self.core_flows[t] = int(g.maxflow())
+        return self.core_flows[t]
+
+    def maxflows(self, sinks):
+        return {t: self.maxflow_to(t) for t in sinks}
+
+    #Returns the core nodes the source reaches in the residual graph of a maximum flow to node index t, packed
+    #into bits. They are the source side of the minimum cut closest to the source, which every minimum cut's
+    #source side contains. The solver only tells which nodes reach the sink in the residual graph, so the flow
+    #is run on the reversed graph from t to the source, where those are the nodes the source reaches here.
+    def _residual_source_side(self, t):
+        if t not in self.residual_sources:
+            if self.reversed_graph is None:
+                self.reversed_graph = self.graph_type(self.num_core_nodes, self.num_core_edges)
+                self.reversed_graph.add_nodes(self.num_core_nodes)
+                if self.num_core_edges > 0:
+                    self.reversed_graph.add_edges(self.core_ends[:, 1], self.core_ends[:, 0], self.core_capacities, numpy.zeros(self.num_core_edges, dtype = self.core_capacities.dtype))
+            with profiler.phase("maxflow graph copy"):
+                g = self.reversed_graph.copy()
+            g.add_tedge(int(self.core_index[t]), int(self.in_degree[t]) + 1, 0)
+            g.add_tedge(int(self.core_index[self.source]), 0, int(self.out_degree[self.source]) + 1)
+            with profiler.phase("maxflow solve"):
+                g.maxflow()
+            self.residual_sources[t] = numpy.packbits(g.get_grid_segments(numpy.arange(self.num_core_nodes)))
+        return self.residual_sources[t]
+
+    #Returns the unit-capacity maxflows of sinks in the edge set without the edge source -> peer, or None if
+    #peer isn't a core node. Removing one edge lowers a maxflow by one if the edge is in some minimum cut and
+    #leaves it alone otherwise, and the edge is in one exactly if peer is outside the residual source side of
+    #_residual_source_side(). These source sides are kept, so the first call solves about as many flows as
+    #maxflows() and later calls, for other peers, usually none. A tree's attachment node and the path down to
+    #it don't change, since both ends of the edge are core nodes.
+    def maxflows_without_source_edge(self, peer, sinks):
+        p = self.node_map[peer]
+        if not self.in_core[p] or not self.source_in_core_edges:
+            return None
+        (byte, bit) = (int(self.core_index[p]) >> 3, 7 - (int(self.core_index[p]) & 7))
+        core_flows = dict()
+        def core_maxflow(t):
+            if t not in core_flows:
+                if t == self.source:
+                    core_flows[t] = int(min(self.out_degree[t] - 1, self.in_degree[t]))
+                else:
+                    reached = (self._residual_source_side(t)[byte] >> bit) & 1
+                    core_flows[t] = self._node_maxflow(t) - (0 if reached else 1)
+            return core_flows[t]
+        flows = dict()
+        for sink in sinks:
+            t = self.node_map[sink]
+            if self.in_core[t]:
+                flows[sink] = core_maxflow(t)
+            elif not self.reached_down[t] or self.attachment[t] < 0:
+                flows[sink] = 0
+            elif self.attachment[t] == self.source:
+                flows[sink] = int(self.path_capacity[t])
+            else:
+                flows[sink] = min(core_maxflow(int(self.attachment[t])), int(self.path_capacity[t]))
+        return flows
+
+    #Returns (flows, cuts): the maxflows of sinks as maxflows() does, and a MinCuts with a minimum cut of
+    #every sink that took a run of the flow solver
+    def maxflows_and_cuts(self, sinks):
+        flows = dict()
+        cut_sinks = list()
+        source_sides = list()
+        core_nodes = numpy.arange(self.num_core_nodes)
+        for sink in sinks:
+            t = self.node_map[sink]
+            if self._needs_flow_graph(t):
+                g = self._flow_graph(t)
+                with profiler.phase("maxflow solve"):
+                    flows[sink] = self.core_flows[t] = g.maxflow()
+                source_sides.append(numpy.packbits(~g.get_grid_segments(core_nodes)))
+                cut_sinks.append(sink)
+            else:
+                flows[sink] = self._node_maxflow(t)
+        return (flows, MinCuts(self, cut_sinks, source_sides))
+
+#Computes the capacity-weighted maxflow from a fixed source to any number of sinks in the same edge set, the
+#same way UnitConnectivity does: one core flow graph, copied per sink. A node in an attached tree gets the
+#smaller of its attachment node's maxflow and the smallest capacity on the tree path down to it.
+#edge_capacities maps (src, dest) node tuples to non-negative integer capacities. Their sums need to stay
+#below 2**53 (e.g. satoshi amounts), because the flow graph holds them as doubles to avoid overflowing C ints.
+class CapacityConnectivity(UnitConnectivity):
+    graph_type = maxflow.Graph[float]
+
+    def __init__(self, edge_capacities, source):
+        edge_array = numpy.array(list(edge_capacities.keys()), dtype = numpy.int64).reshape(-1, 2)
+        capacities = numpy.fromiter(edge_capacities.values(), dtype = numpy.int64, count = len(edge_capacities))
+        self._build(edge_array, capacities, source)
+
+#Minimum cuts between the source and sinks of a UnitConnectivity, one source side per sink as a bit row
+#over the core nodes. The solver puts every core node that can't reach the sink in the residual graph of
+#the maximum flow on the source side, so the other side is exactly the nodes that can.
+#
+#Edges added to the edge set can only raise a sink's maxflow if one of them leads from the source side of
+#its minimum cut to the other side; otherwise the cut still has the old capacity. A tree is put on the side
+#of the node it is attached to, which leaves the capacity of the cut unchanged. Conversely, if the added
+#edges lead from the source to a core node on the sink side, the old flow plus that path is a bigger flow.
+class MinCuts:
+    def __init__(self, connectivity, sinks, source_sides):
+        self.source = int(connectivity.node_numbers[connectivity.source])
+        self.sinks = sinks
+        self.row = {sink: i for (i, sink) in enumerate(sinks)}
+        self.source_sides = numpy.array(source_sides, dtype = numpy.uint8).reshape(len(sinks), (connectivity.num_core_nodes + 7) // 8)
+        #the core node whose side each node is on, or -1 for a tree not attached to the core (never on the source side)
+        attachment_column = numpy.where(connectivity.attachment >= 0, connectivity.core_index[connectivity.attachment], -1)
+        column = numpy.where(connectivity.in_core, connectivity.core_index, attachment_column)
+        self.column = {n: int(column[i]) for (n, i) in connectivity.node_map.items()}
+        core_column = numpy.where(connectivity.in_core, connectivity.core_index, -1)
+        self.core_column = {n: int(core_column[i]) for (n, i) in connectivity.node_map.items()}
+
+    def has_cut(self, sink):
+        return sink in self.row
+
+    #Returns the sinks whose source side holds the nodes in columns, as a bool matrix (sink, column)
+    def _on_source_side(self, columns):
+        known = columns >= 0
+        columns = numpy.where(known, columns, 0)
+        bits = (self.source_sides[:, columns >> 3] >> (7 - (columns & 7)).astype(numpy.uint8)) & 1
+        return (bits == 1) & known
+
+    #Returns the set of sinks with a cut that one of edges, (src, dest) node pairs, crosses from the source side
+    def crossed_by(self, edges, chunk_size = 256):
+        edges = list(edges)
+        crossed = numpy.zeros(len(self.sinks), dtype = bool)
+        for k in range(0, len(edges), chunk_size):
+            chunk = edges[k:k + chunk_size]
+            src_columns = numpy.array([self.column.get(src, -1) for (src, dest) in chunk], dtype = numpy.int64)
+            dest_columns = numpy.array([self.column.get(dest, -1) for (src, dest) in chunk], dtype = numpy.int64)
+            crossed |= (self._on_source_side(src_columns) & ~self._on_source_side(dest_columns)).any(axis = 1)
+        return {self.sinks[i] for i in numpy.nonzero(crossed)[0].tolist()}
+
+    #Returns the set of sinks whose maxflow edges, (src, dest) node pairs carrying no flow yet, raise by at least one
+    def augmented_by(self, edges):
+        outgoing = dict()
+        for (src, dest) in edges:
+            outgoing.setdefault(src, list()).append(dest)
+        reached = {self.source}
+        stack = [self.source]
+        while len(stack) > 0:
+            for dest in outgoing.get(stack.pop(), ()):
+                if dest not in reached:
+                    reached.add(dest)
+                    stack.append(dest)
+        columns = numpy.array([self.core_column.get(n, -1) for n in reached], dtype = numpy.int64)
+        known = columns >= 0
+        augmented = (~self._on_source_side(columns) & known).any(axis = 1)
+        return {self.sinks[i] for i in numpy.nonzero(augmented)[0].tolist()}
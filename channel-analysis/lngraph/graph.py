@@ -0,0 +1,124 @@
+#Compact array-backed channel graph and the undirected adjacency the scripts' traversals share
+import hashlib
+from array import array
+import numpy
+
+#Directed channel graph over interned node numbers 0 .. num_nodes - 1, stored in compressed sparse row
+#form: the channels leaving node n are the edge indices offsets[n] .. offsets[n + 1] - 1, and the
+#parallel arrays targets, fee_permillion, fee_base and capacity hold each channel's destination node,
+#fees and (merged) capacity. Compared to dicts of sets and (src, dest)-keyed dicts this needs a few
+#machine words per channel instead of several Python objects, and forked worker processes can share it
+#without copy-on-write faults from reference counting.
+class ChannelGraph:
+    def __init__(self, num_nodes, offsets, targets, fee_permillion, fee_base, capacity):
+        self.num_nodes = num_nodes
+        self.offsets = offsets
+        self.targets = targets
+        self.fee_permillion = fee_permillion
+        self.fee_base = fee_base
+        self.capacity = capacity
+
+    #Builds the graph from the node_recommender.py style outgoing sets and (src, dest)-keyed dicts.
+    #Channels of each node keep the iteration order of its outgoing set.
+    @staticmethod
+    def from_dicts(num_nodes, outgoing, chan_fees, chan_capacity):
+        offsets = array('q', [0])
+        targets = array('q')
+        fee_permillion = array('q')
+        fee_base = array('q')
+        capacity = array('q')
+        for n in range(num_nodes):
+            if n in outgoing:
+                for o in outgoing[n]:
+                    (permillion, base) = chan_fees[(n, o)]
+                    targets.append(o)
+                    fee_permillion.append(permillion)
+                    fee_base.append(base)
+                    capacity.append(chan_capacity[(n, o)])
+            offsets.append(len(targets))
+        return ChannelGraph(num_nodes, offsets, targets, fee_permillion, fee_base, capacity)
+
+    #Returns a copy of the graph with channels from src to each of dests added, without fees and with the
+    #given capacity. src's channels are ordered as if dests were added to its outgoing set.
+    def with_channels(self, src, dests, capacity = 0):
+        channels = {self.targets[e]: (self.fee_permillion[e], self.fee_base[e], self.capacity[e]) for e in self.edges_from(src)}
+        for dest in dests:
+            if dest not in channels:
+                channels[dest] = (0, 0, capacity)
+        offsets = array('q', self.offsets[:src + 1])
+        targets = array('q', self.targets[:self.offsets[src]])
+        fee_permillion = array('q', self.fee_permillion[:self.offsets[src]])
+        fee_base = array('q', self.fee_base[:self.offsets[src]])
+        capacity = array('q', self.capacity[:self.offsets[src]])
+        for o in set_order(channels):
+            targets.append(o)
+            fee_permillion.append(channels[o][0])
+            fee_base.append(channels[o][1])
+            capacity.append(channels[o][2])
+        shift = len(targets) - self.offsets[src + 1]
+        offsets.extend([offset + shift for offset in self.offsets[src + 1:]])
+        end = self.offsets[src + 1]
+        targets.extend(self.targets[end:])
+        fee_permillion.extend(self.fee_permillion[end:])
+        fee_base.extend(self.fee_base[end:])
+        capacity.extend(self.capacity[end:])
+        return ChannelGraph(self.num_nodes, offsets, targets, fee_permillion, fee_base, capacity)
+
+    def num_edges(self):
+        return len(self.targets)
+
+    def out_degree(self, n):
+        return self.offsets[n + 1] - self.offsets[n]
+
+    def edges_from(self, n):
+        return range(self.offsets[n], self.offsets[n + 1])
+
+    def successors(self, n):
+        return self.targets[self.offsets[n]:self.offsets[n + 1]]
+
+    #Returns a dict mapping each (src, dest) pair of edges that is a channel of the graph to its capacity
+    def capacities(self, edges):
+        wanted = dict()
+        for (src, dest) in edges:
+            wanted.setdefault(src, set()).add(dest)
+        capacities = dict()
+        for (src, dests) in wanted.items():
+            for e in self.edges_from(src):
+                if self.targets[e] in dests:
+                    capacities[(src, self.targets[e])] = self.capacity[e]
+        return capacities
+
+    def total_capacity(self, n):
+        return sum(self.capacity[self.offsets[n]:self.offsets[n + 1]])
+
+    #Returns the BLAKE2b digest of the graph's nodes and channels, the same for graphs with the same channels in
+    #the same order whether they are held in arrays or in the numpy views of a snapshot
+    def digest(self):
+        digest = hashlib.blake2b(digest_size = 20)
+        digest.update(str(self.num_nodes).encode("utf-8"))
+        for values in (self.offsets, self.targets, self.fee_permillion, self.fee_base, self.capacity):
+            digest.update(numpy.asarray(values, dtype = numpy.int64).tobytes())
+        return digest.hexdigest()
+
+#Returns values in the iteration order of a set they are added to one by one. The scripts have always
+#iterated a node's channels in the order of such a set, and node_recommender.py lists the root node's
+#peers in it.
+def set_order(values):
+    ordered = set()
+    for v in values:
+        ordered.add(v)
+    return list(ordered)
+
+#Builds an undirected compressed sparse row adjacency for (src, dest) node numbers, given as a collection of
+#tuples or as an array of shape (edges, 2). Returns numpy arrays (offsets, adjacent, present) indexed by node
+#number, where present[n] tells whether n is an endpoint of any of the edges. An edge given in both directions
+#appears twice in the neighbours of its endpoints.
+def undirected_csr(edges, num_nodes):
+    edge_array = numpy.array(edges if isinstance(edges, numpy.ndarray) else list(edges), dtype = numpy.int64).reshape(-1, 2)
+    ends = numpy.concatenate((edge_array[:, 0], edge_array[:, 1]))
+    others = numpy.concatenate((edge_array[:, 1], edge_array[:, 0]))
+    degree = numpy.bincount(ends, minlength = num_nodes)
+    offsets = numpy.zeros(len(degree) + 1, dtype = numpy.int64)
+    numpy.cumsum(degree, out = offsets[1:])
+    adjacent = others[numpy.argsort(ends, kind = "stable")]
+    return (offsets, adjacent, degree > 0)
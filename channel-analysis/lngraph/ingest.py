@@ -0,0 +1,200 @@
+#Parsing of C-Lightning and LND channel graph dumps into merged directed channels
+import time
+from array import array
+from enum import Enum
+import numpy
+from lngraph.graph import ChannelGraph, set_order
+from lngraph.jsonstream import iter_array_members
+from lngraph.profile import profiled
+
+class LNSoftwareType(Enum):
+    LND = "LND"
+    CLI = "C-Lightning"
+    UKN = 3
+
+#Tells the format from the first element of a top-level array: C-Lightning has "channels" (listchannels)
+#and "nodes" with a "nodeid" (listnodes), LND's describegraph has "edges" and "nodes" with a "pub_key"
+def detect_ln_software_type(key, element):
+    if key == "channels" or (key == "nodes" and "nodeid" in element):
+        return LNSoftwareType.CLI
+    if key == "edges" or (key == "nodes" and "pub_key" in element):
+        return LNSoftwareType.LND
+    return LNSoftwareType.UKN
+
+#Interns node ids in order of first appearance and merges parallel channels between the same two nodes
+#into one directed channel: channels whose fees are within 20 ppm and 200 msat of each other pool their
+#capacity and keep the lowest ppm, while a clearly cheaper channel replaces the others.
+#
+#Node numbers, the order of each node's outgoing set and the merged fees only depend on the order of the
+#channels in the input, so two parsers fed the same channels produce the same graph.
+class ChannelGraphParser:
+    #node_ids are interned before any channel, e.g. to give the root node number 0.
+    #Channels with an endpoint in banned_nodes are skipped before their endpoints are interned.
+    def __init__(self, banned_nodes = (), node_ids = ()):
+        self.banned_nodes = set(banned_nodes)
+        self.software_type = LNSoftwareType.UKN
+        self.node_to_id = dict()
+        self.id_to_node = dict()
+        self.id_to_alias = dict()
+        self.outgoing = dict() #maps each node to a dict whose keys are its channel peers in order of first channel
+        self.chan_fees = dict()
+        self.chan_fee_anchors = dict()
+        self.chan_capacity = dict()
+        self.max_channel_capacity = dict() #largest single active channel of each merged (src, dest)
+        self.channel_endpoints = array('q') #(src, dest) of every interned channel, in input order
+        self.num_channels = 0
+        self.num_inactive_channels = 0
+        self.ingest_seconds = 0.0
+        for node_id in node_ids:
+            self._intern(node_id)
+
+    def _intern(self, node_id):
+        if node_id not in self.id_to_node:
+            n = len(self.node_to_id)
+            self.node_to_id[n] = node_id
+            self.id_to_node[node_id] = n
+        return self.id_to_node[node_id]
+
+    #Adds the channels (and, for C-Lightning, the node aliases) read from f, a text or binary stream of one or
+    #more JSON documents: C-Lightning listnodes and/or listchannels output (separately or combined into one
+    #object) or LND describegraph output. Channels are added as they are read, without holding the text.
+    #Raises ValueError if the stream doesn't look like output from C-Lightning or LND, or mixes the two.
+    @profiled("json parse")
+    def add_stream(self, f):
+        self._add_members(iter_array_members(f))
+
+    #Adds the channels (and, for C-Lightning, the node aliases) of obj, a JSON document of the same kinds that is
+    #already decoded, e.g. the result of a listchannels call over C-Lightning's RPC.
+    #Raises ValueError like add_stream().
+    def add_document(self, obj):
+        self._add_members((key, element) for (key, value) in obj.items() if isinstance(value, list) for element in value)
+
+    #Adds the channels of the C-Lightning node behind rpc (a pyln.client.LightningRpc) and, with nodes, the
+    #aliases of all nodes it knows
+    def add_cln_rpc(self, rpc, nodes = True):
+        if nodes:
+            self.add_document(rpc.listnodes())
+        self.add_document(rpc.listchannels())
+
+    #Adds the (key, element) pairs of the array members of JSON documents
+    def _add_members(self, members):
+        start = time.time()
+        current_key = None
+        for (key, element) in members:
+            if key != current_key:
+                #the first element of an array decides how to handle the rest of it
+                current_key = key
+                add_element = self._element_handler(key, element)
+            if add_element is not None:
+                add_element(element)
+        self.ingest_seconds += time.time() - start
+        if self.software_type == LNSoftwareType.UKN:
+            raise ValueError("input doesn't look like output from C-Lightning or LND")
+
+    def _element_handler(self, key, element):
+        software_type = detect_ln_software_type(key, element)
+        if software_type == LNSoftwareType.UKN:
+            return None
+        if self.software_type == LNSoftwareType.UKN:
+            self.software_type = software_type
+        elif software_type != self.software_type:
+            raise ValueError("input mixes %s and %s output" % (self.software_type.value, software_type.value))
+        if key == "channels":
+            return self.add_cln_channel
+        if key == "edges":
+            return self.add_lnd_edge
+        if software_type == LNSoftwareType.CLI:
+            return self.add_cln_node
+        return None #LND node aliases are not used
+
+    #Returns a one-line summary of what was ingested and how fast
+    def ingest_summary(self):
+        return "ingested %d %s channels (%d inactive) of %d nodes in %.2fs, %.0f channels/sec" % (self.num_channels,
+            self.software_type.value, self.num_inactive_channels, len(self.node_to_id), self.ingest_seconds,
+            self.num_channels / max(self.ingest_seconds, 1e-9))
+
+    def add_cln_channel(self, chan):
+        if chan["source"] in self.banned_nodes or chan["destination"] in self.banned_nodes:
+            return
+        src = self._intern(chan["source"])
+        dest = self._intern(chan["destination"])
+        self.channel_endpoints.append(src)
+        self.channel_endpoints.append(dest)
+        self.num_channels += 1
+        if not chan["active"]:
+            self.num_inactive_channels += 1
+            return
+        self._add_directed(src, dest, chan["fee_per_millionth"], chan["base_fee_millisatoshi"], chan["satoshis"])
+
+    def add_cln_node(self, node):
+        if 'alias' in node:
+            self.id_to_alias[node['nodeid']] = node['alias']
+
+    #LND reports both directions of a channel in one edge
+    def add_lnd_edge(self, chan):
+        if chan["node1_policy"] == None or chan["node2_policy"] == None:
+            return
+        if chan["node1_pub"] in self.banned_nodes or chan["node2_pub"] in self.banned_nodes:
+            return
+        src = self._intern(chan["node1_pub"])
+        dest = self._intern(chan["node2_pub"])
+        self.channel_endpoints.append(src)
+        self.channel_endpoints.append(dest)
+        self.num_channels += 1
+        if chan["node1_policy"]["disabled"] or chan["node2_policy"]["disabled"]:
+            self.num_inactive_channels += 1
+            return
+        capacity = int(chan["capacity"])
+        #node1 => node2 pays the fees of node2_policy
+        self._add_directed(src, dest, int(chan["node2_policy"]["fee_rate_milli_msat"]), int(chan["node2_policy"]["fee_base_msat"]), capacity)
+        #REVERSE DIRECTION node2 => node1, fees of node1_policy count
+        self._add_directed(dest, src, int(chan["node1_policy"]["fee_rate_milli_msat"]), int(chan["node1_policy"]["fee_base_msat"]), capacity)
+
+    @profiled("fee-anchor merge")
+    def _add_directed(self, src, dest, permillion_fee, base_fee, capacity):
+        if src not in self.outgoing:
+            self.outgoing[src] = dict()
+        self.outgoing[src][dest] = None
+        key = (src, dest)
+        self.max_channel_capacity[key] = max(self.max_channel_capacity.get(key, capacity), capacity)
+
+        if key not in self.chan_fees:
+            self.chan_capacity[key] = capacity
+            self.chan_fees[key] = (permillion_fee, base_fee)
+            self.chan_fee_anchors[key] = (permillion_fee, base_fee, capacity)
+        else:
+            (existing_permillion, existing_base) = self.chan_fees[key]
+            (anchor_permillion, anchor_base, anchor_capacity) = self.chan_fee_anchors[key]
+            if abs(existing_permillion - permillion_fee) <= 20 and abs(existing_base - base_fee) <= 200:
+                #the channels are roughly the same fee rate; combine capacity
+                self.chan_capacity[key] += capacity
+                if permillion_fee < existing_permillion:
+                    #always record the lowest PPM feerate for the parallel channels
+                    self.chan_fees[key] = (permillion_fee, base_fee)
+                if abs(anchor_permillion - permillion_fee) > 20 or abs(anchor_base - base_fee) > 200:
+                    #we've drifted too far from the anchor fees
+                    #reset the anchor and remove capacity from parallel channels with too-high fees
+                    self.chan_capacity[key] -= anchor_capacity
+                    (t1, t2) = self.chan_fees[key]
+                    self.chan_fee_anchors[key] = (t1, t2, capacity if permillion_fee < existing_permillion else self.chan_capacity[key] - capacity)
+            elif permillion_fee <= existing_permillion and existing_base - base_fee > -200:
+                #this is a new, lower-rate channel, allowing for some base fee leeway
+                #discard old capacity; only consider capacity in lowest-rate channels between nodes
+                self.chan_fees[key] = (permillion_fee, base_fee)
+                self.chan_fee_anchors[key] = (permillion_fee, base_fee, capacity)
+                self.chan_capacity[key] = capacity
+
+    #Returns the aliases of the interned nodes, by node number
+    def node_to_alias(self):
+        return {self.id_to_node[node_id]: alias for (node_id, alias) in self.id_to_alias.items() if node_id in self.id_to_node}
+
+    #Returns the (src, dest) node numbers of the active channels whose largest single channel is bigger than
+    #min_channel_capacity, as an array of shape (channels, 2) in the order GraphSnapshot.channels() gives them
+    def channels(self, min_channel_capacity):
+        channels = [(n, o) for n in range(len(self.node_to_id)) for o in self.outgoing.get(n, ()) if self.max_channel_capacity[(n, o)] > min_channel_capacity]
+        return numpy.array(channels, dtype = numpy.int64).reshape(-1, 2)
+
+    @profiled("graph build")
+    def channel_graph(self):
+        outgoing = {src: set_order(dests) for (src, dests) in self.outgoing.items()}
+        return ChannelGraph.from_dicts(len(self.node_to_id), outgoing, self.chan_fees, self.chan_capacity)
@@ -0,0 +1,132 @@
+#Incremental reading of large JSON documents
+import codecs
+import json
+import re
+
+_whitespace = re.compile(r"[ \t\n\r]*")
+_decoder = json.JSONDecoder()
+_value_ends = ",:]} \t\n\r"
+_element_end = re.compile(r"[ \t\n\r]*([,\]])")
+
+#Reads a stream of one or more concatenated JSON objects, e.g. the output of several lightning-cli commands,
+#and yields (key, element) for every element of every array-valued member of those objects, in stream order.
+#Members that aren't arrays are decoded and skipped. Only one element is decoded at a time and the text is
+#read in chunks, so memory use is bounded by the largest element rather than by the document.
+#f may be a text or (faster) a binary stream of UTF-8.
+def iter_array_members(f, chunk_size = 1 << 20):
+    reader = _ChunkReader(f, chunk_size)
+    while reader.skip_whitespace():
+        reader.expect("{")
+        if reader.skip_whitespace() and reader.peek() == "}":
+            reader.pos += 1
+            continue
+        while True:
+            reader.skip_whitespace()
+            key = reader.decode()
+            reader.skip_whitespace()
+            reader.expect(":")
+            reader.skip_whitespace()
+            if reader.peek() == "[":
+                reader.pos += 1
+                reader.skip_whitespace()
+                if reader.peek() == "]":
+                    reader.pos += 1
+                else:
+                    for element in reader.array_elements():
+                        yield (key, element)
+            else:
+                reader.decode()
+            reader.skip_whitespace()
+            if reader.expect(",}") == "}":
+                break
+
+class _ChunkReader:
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.utf8 = codecs.getincrementaldecoder("utf-8")()
+
+    #Appends the next chunk to the buffer, dropping what was consumed; returns False at the end of the stream
+    def _fill(self):
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if isinstance(chunk, bytes):
+            final = len(chunk) == 0
+            chunk = self.utf8.decode(chunk, final)
+            if len(chunk) == 0 and not final:
+                return True #only part of a multi-byte character so far
+        if len(chunk) == 0:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    #Skips whitespace; returns False if the stream ended
+    def skip_whitespace(self):
+        while True:
+            self.pos = _whitespace.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return True
+            if not self._fill():
+                return False
+
+    def peek(self):
+        if self.pos >= len(self.buf) and not self._fill():
+            raise ValueError("unexpected end of JSON stream")
+        return self.buf[self.pos]
+
+    #Consumes one of the characters in expected and returns it
+    def expect(self, expected):
+        c = self.peek()
+        if c not in expected:
+            raise ValueError("expected one of %r at %r in JSON stream" % (expected, self.buf[self.pos:self.pos + 40]))
+        self.pos += 1
+        return c
+
+    #Yields the elements of the array whose "[" was just consumed, up to and including its "]".
+    #Elements that are complete in the buffer are decoded without going through decode().
+    def array_elements(self):
+        match_whitespace = _whitespace.match
+        match_element_end = _element_end.match
+        raw_decode = _decoder.raw_decode
+        while True:
+            buf = self.buf
+            pos = match_whitespace(buf, self.pos).end()
+            try:
+                (value, end) = raw_decode(buf, pos)
+                separator = match_element_end(buf, end)
+            except json.JSONDecodeError:
+                separator = None
+            if separator is None:
+                #the element or the separator after it runs past the end of the buffer
+                self.pos = pos
+                self.skip_whitespace()
+                value = self.decode()
+                self.skip_whitespace()
+                separator_char = self.expect(",]")
+            else:
+                self.pos = separator.end()
+                separator_char = separator.group(1)
+            yield value
+            if separator_char == "]":
+                return
+
+    #Decodes the value starting at the current position, reading more of the stream until it is complete.
+    #A value is only accepted if it is followed by a character that can end a value, so a number cut off
+    #by the end of a chunk (e.g. "12." of "12.5") isn't mistaken for a shorter one.
+    def decode(self):
+        while True:
+            try:
+                (value, end) = _decoder.raw_decode(self.buf, self.pos)
+                if (end < len(self.buf) and self.buf[end] in _value_ends) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
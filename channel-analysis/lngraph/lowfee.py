@@ -0,0 +1,205 @@
+#Exact, incrementally updatable low-fee reachable subgraphs
+import copy
+from collections import deque
+from lngraph.skyline import Skyline
+from lngraph.profile import profiled
+
+#The low-fee reachable subgraph of a root node, computed by label correction: every non-dominated
+#(permillion, base) route cost that stays within the thresholds is propagated until no frontier changes.
+#A label reaching a node after that node has been expanded is still propagated, so the result does not
+#depend on the visiting order. That makes the frontiers a pure function of the channel graph, which is what
+#allows what-if evaluation of adding or removing one of the root's channels by re-propagating only the
+#labels that channel can influence, with the same result as propagating everything again.
+class LowfeeFrontiers:
+    #graph is a lngraph.graph.ChannelGraph.
+    #If within is given, it must be a LowfeeFrontiers of the same graph and root node with thresholds at least
+    #as loose as these; its frontiers are then filtered instead of propagated again.
+    #root_peers optionally replaces the successors of root_node in graph, to propagate the frontiers of the
+    #graph with a channel of root_node opened or closed from scratch.
+    def __init__(self, graph, root_node, base_fee_threshold, permillion_fee_threshold, within = None, root_peers = None):
+        self.graph = graph
+        self.root_node = root_node
+        self.root_peers = set(graph.successors(root_node)) if root_peers is None else set(root_peers)
+        self.base_fee_threshold = base_fee_threshold
+        self.permillion_fee_threshold = permillion_fee_threshold
+
+        #maps each low-fee reachable node to the Skyline of its Pareto-optimal (permillion, base) route costs
+        self.frontiers = {root_node: Skyline([(0, 0)])}
+        self.edges = set()
+        #use (0, 0) for our own channels because we control their fees
+        for o in self.root_peers:
+            self.edges.add((root_node, o))
+        if within is None:
+            pending = dict()
+            for o in self.root_peers:
+                if self._writable_frontier(self.frontiers, o).insert((0, 0)):
+                    pending[o] = {(0, 0)}
+            self._propagate(self.frontiers, self.edges, pending)
+        else:
+            self._restrict(within)
+        self._index_edges()
+
+    def _index_edges(self):
+        self.nodes = set()
+        self.lowfee_outgoing = dict()
+        self.lowfee_incoming = dict()
+        for (src, dest) in self.edges:
+            self.nodes.add(src)
+            self.nodes.add(dest)
+            self.lowfee_outgoing.setdefault(src, set()).add(dest)
+            self.lowfee_incoming.setdefault(dest, set()).add(src)
+
+    #Fees are never negative, so a route within these thresholds has every prefix within them too, and a label
+    #dominating it is within them as well: the frontiers are exactly the labels of within that fit.
+    def _restrict(self, within):
+        for (n, frontier) in within.frontiers.items():
+            kept = frontier.restricted(self.base_fee_threshold, self.permillion_fee_threshold)
+            if len(kept) > 0:
+                self.frontiers[n] = kept
+        for (n, frontier) in self.frontiers.items():
+            if n == self.root_node:
+                continue
+            for e in self.graph.edges_from(n):
+                chan_permillion = self.graph.fee_permillion[e]
+                chan_base = self.graph.fee_base[e]
+                for (p, b) in frontier:
+                    if p + chan_permillion <= self.permillion_fee_threshold and b + chan_base <= self.base_fee_threshold:
+                        self.edges.add((n, self.graph.targets[e]))
+                        break
+
+    #Returns the frontiers for tighter fee thresholds without propagating labels again
+    def restricted(self, base_fee_threshold, permillion_fee_threshold):
+        return LowfeeFrontiers(self.graph, self.root_node, base_fee_threshold, permillion_fee_threshold, self)
+
+    #Returns the frontier of node held in changed, copying it from the baseline on first use
+    def _writable_frontier(self, changed, node):
+        if node not in changed:
+            changed[node] = self.frontiers[node].copy() if node in self.frontiers else Skyline()
+        return changed[node]
+
+    #pending maps nodes to labels that were added to their frontier in changed but not yet relaxed
+    @profiled("pareto propagation")
+    def _propagate(self, changed, edges, pending):
+        queue = deque(pending)
+        while len(queue) > 0:
+            cur_node = queue.popleft()
+            labels = [l for l in pending.pop(cur_node) if l in changed[cur_node]]
+            for e in self.graph.edges_from(cur_node):
+                o = self.graph.targets[e]
+                chan_permillion = self.graph.fee_permillion[e]
+                chan_base = self.graph.fee_base[e]
+                for (permillion_fee, base_fee) in labels:
+                    new_permillion_fee = permillion_fee + chan_permillion
+                    new_base_fee = base_fee + chan_base
+                    if new_permillion_fee > self.permillion_fee_threshold or new_base_fee > self.base_fee_threshold:
+                        continue
+                    edges.add((cur_node, o))
+                    if self._writable_frontier(changed, o).insert((new_permillion_fee, new_base_fee)):
+                        if o not in pending:
+                            pending[o] = set()
+                            queue.append(o)
+                        pending[o].add((new_permillion_fee, new_base_fee))
+
+    #Returns the set of nodes reachable from node over the low-fee edges plus extra_outgoing
+    def reachable_from(self, node, extra_outgoing = None):
+        return self.reachable_from_nodes([node], extra_outgoing)
+
+    #Returns the set of nodes reachable from any of start_nodes over the low-fee edges plus extra_outgoing
+    def reachable_from_nodes(self, start_nodes, extra_outgoing = None):
+        reachable = set(start_nodes)
+        queue = deque(reachable)
+        while len(queue) > 0:
+            cur_node = queue.popleft()
+            for adjacent in (self.lowfee_outgoing, extra_outgoing if extra_outgoing is not None else {}):
+                for o in adjacent.get(cur_node, ()):
+                    if o not in reachable:
+                        reachable.add(o)
+                        queue.append(o)
+        return reachable
+
+    #What-if for opening a channel root_node -> peer.
+    #Returns (changed_frontiers, added_edges): the new frontiers of every node whose frontier changed,
+    #and the low-fee edges that are not in the baseline subgraph.
+    def with_new_peer(self, peer):
+        changed = dict()
+        added_edges = set()
+        if peer not in self.root_peers:
+            added_edges.add((self.root_node, peer))
+        pending = dict()
+        if self._writable_frontier(changed, peer).insert((0, 0)):
+            pending[peer] = {(0, 0)}
+        self._propagate(changed, added_edges, pending)
+        added_edges -= self.edges
+        return ({n: f for (n, f) in changed.items() if f != self.frontiers.get(n)}, added_edges)
+
+    #What-if for closing the channel root_node -> peer.
+    #Only the frontiers of nodes reachable from peer in the baseline subgraph can depend on it; those are
+    #rebuilt from the unchanged labels of their other low-fee predecessors.
+    #Returns (changed_frontiers, edges): the new frontiers of every node in that region (empty if it is no
+    #longer low-fee reachable) and the complete new set of low-fee edges.
+    def without_peer(self, peer):
+        region = self.reachable_from(peer)
+        region.discard(self.root_node)
+        changed = {n: Skyline() for n in region}
+        edges = {(src, dest) for (src, dest) in self.edges if src not in region}
+        edges.discard((self.root_node, peer))
+
+        pending = dict()
+        boundary = {src for n in region for src in self.lowfee_incoming.get(n, ()) if src not in region}
+        for src in boundary:
+            for e in self.graph.edges_from(src):
+                n = self.graph.targets[e]
+                if n not in region:
+                    continue
+                if src == self.root_node:
+                    if n == peer:
+                        continue
+                    offers = [(0, 0)]
+                else:
+                    offers = [(p + self.graph.fee_permillion[e], b + self.graph.fee_base[e]) for (p, b) in self.frontiers[src]]
+                for (p, b) in offers:
+                    if p <= self.permillion_fee_threshold and b <= self.base_fee_threshold and changed[n].insert((p, b)):
+                        pending.setdefault(n, set()).add((p, b))
+        self._propagate(changed, edges, pending)
+        return (changed, edges)
+
+    #Returns the frontiers of graph, a later version of this graph in which only changed_channels, a set of
+    #(src, dest) pairs, were added, removed or changed fees. Nodes must keep their numbers in graph.
+    #As in without_peer(), the frontiers of nodes reachable from a changed low-fee edge are rebuilt from the
+    #labels of their other predecessors, and the labels every changed channel now offers are propagated.
+    #Returns (frontiers, changed_nodes): the new LowfeeFrontiers and the nodes whose frontier may differ.
+    def updated(self, graph, changed_channels):
+        updated = copy.copy(self)
+        updated.graph = graph
+        updated.root_peers = set(graph.successors(self.root_node))
+        region = self.reachable_from_nodes({dest for (src, dest) in changed_channels if (src, dest) in self.edges})
+        region.discard(self.root_node)
+        updated.frontiers = {n: f for (n, f) in self.frontiers.items() if n not in region}
+        changed = {n: Skyline() for n in region}
+        edges = {(src, dest) for (src, dest) in self.edges if src not in region and (src, dest) not in changed_channels}
+        edges.update([(self.root_node, o) for o in updated.root_peers])
+
+        pending = dict()
+        offering = {src for n in region for src in self.lowfee_incoming.get(n, ()) if src not in region}
+        offering.update([src for (src, dest) in changed_channels if src in updated.frontiers])
+        for src in offering:
+            for e in graph.edges_from(src):
+                n = graph.targets[e]
+                if src == self.root_node:
+                    offers = [(0, 0)]
+                else:
+                    offers = [(p + graph.fee_permillion[e], b + graph.fee_base[e]) for (p, b) in updated.frontiers[src]]
+                for (p, b) in offers:
+                    if p > self.permillion_fee_threshold or b > self.base_fee_threshold:
+                        continue
+                    edges.add((src, n))
+                    if updated._writable_frontier(changed, n).insert((p, b)):
+                        pending.setdefault(n, set()).add((p, b))
+        updated._propagate(changed, edges, pending)
+
+        for (n, frontier) in changed.items():
+            if len(frontier) > 0:
+                updated.frontiers[n] = frontier
+        updated.edges = edges
+        updated._index_edges()
+        return (updated, set(changed))
@@ -0,0 +1,45 @@
+#Geometric means of route metrics, computed in log space
+#pip3 install mpmath numpy
+import math
+import numpy
+from mpmath import mpf, nstr
+from lngraph.profile import profiled
+
+#Multiplying hundreds of thousands of arbitrary-precision values in a Python loop and taking the n-th root
+#of the product is slow. The mean of the logarithms of a float64 array gives the same geometric mean to well
+#beyond the 6 significant digits that get reported, and the sum of logs cannot overflow the way the
+#product of large values (e.g. sys.maxsize for unreachable nodes) would in floating point.
+
+#Returns the natural logarithms of values in ascending order. A value of 0 yields -inf, so that it still
+#makes a geometric mean 0 as it did for the product. Sorting makes their sum independent of the order the
+#values come in, so the same values give the same result to the last bit however they were collected.
+def _logs(values):
+    with numpy.errstate(divide = "ignore"):
+        return numpy.sort(numpy.log(numpy.asarray(values, dtype = numpy.float64)))
+
+#Returns the sum of the natural logarithms of values
+def log_sum(values):
+    return float(_logs(values).sum())
+
+#Returns the geometric mean of values
+@profiled("geomean")
+def geomean(values):
+    logs = _logs(values)
+    if len(logs) == 0:
+        raise ValueError("geometric mean of no values")
+    return math.exp(float(logs.mean()))
+
+#Returns the geometric mean of count values whose logarithms add up to total
+def geomean_of_log_sum(total, count):
+    return math.exp(total / count)
+
+#Returns the geometric mean of fee rates, counting a fee rate of 0 as 1 so that one free route
+#does not make the whole mean 0
+def fee_geomean(fees):
+    fee_array = numpy.asarray(fees, dtype = numpy.float64)
+    return geomean(numpy.where(fee_array == 0, 1, fee_array))
+
+#Formats a metric the way the scripts always have, i.e. as mpmath's nstr() to 6 significant digits
+@profiled("mpmath format")
+def format_metric(value):
+    return nstr(mpf(value), 6)
@@ -0,0 +1,147 @@
+#Per-phase wall times, call counts and allocation peaks, optionally as Chrome trace events
+import os, json, time, functools, tracemalloc
+
+#Phases nest: a phase entered while another one is running counts towards both, so the wall time of a phase
+#includes that of the phases inside it. An item is a phase (e.g. one candidate peer) that also gets its own
+#record of the time spent in each phase inside it.
+#
+#The profiler is off until enable() is called. Until then phase() returns a shared do-nothing context and
+#functions decorated with profiled() call straight through, so instrumented code costs about one extra call
+#per phase when it isn't being profiled.
+class _NullPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_NULL_PHASE = _NullPhase()
+
+class _Phase:
+    __slots__ = ("profiler", "name", "label", "start", "base", "peak", "phase_seconds")
+
+    def __init__(self, profiler, name, label = None):
+        self.profiler = profiler
+        self.name = name
+        self.label = label
+
+    def __enter__(self):
+        self.profiler._enter(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler._exit(self)
+        return False
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.track_memory = False
+        self.trace = False
+        self.max_trace_events = 0
+        self.phases = dict() #maps phase names to [calls, wall seconds, peak bytes allocated]
+        self.items = list()
+        self.events = list()
+        self.dropped_events = 0
+        self._stack = list()
+        self._origin = 0.0
+
+    #With track_memory, tracemalloc records the peak of memory allocated above the start of each phase, which
+    #slows down allocation-heavy code considerably. With trace, every phase is also kept as a trace event, up to
+    #max_trace_events of them.
+    def enable(self, track_memory = False, trace = False, max_trace_events = 1000000):
+        self.enabled = True
+        self.track_memory = track_memory
+        self.trace = trace
+        self.max_trace_events = max_trace_events
+        self._origin = time.perf_counter()
+        if track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def phase(self, name):
+        return _Phase(self, name) if self.enabled else _NULL_PHASE
+
+    #Returns the context of an item called name, recorded under label
+    def item(self, name, label):
+        return _Phase(self, name, label) if self.enabled else _NULL_PHASE
+
+    def _enter(self, p):
+        if self.track_memory:
+            (current, peak) = tracemalloc.get_traced_memory()
+            #the peak is reset for the new phase, so the running one keeps the peak it reached so far
+            if len(self._stack) > 0:
+                self._stack[-1].peak = max(self._stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+            p.base = p.peak = current
+        if p.label is not None:
+            p.phase_seconds = {name: stats[1] for (name, stats) in self.phases.items()}
+        self._stack.append(p)
+        p.start = time.perf_counter()
+
+    def _exit(self, p):
+        end = time.perf_counter()
+        self._stack.pop()
+        stats = self.phases.get(p.name)
+        if stats is None:
+            stats = self.phases[p.name] = [0, 0.0, 0]
+        stats[0] += 1
+        stats[1] += end - p.start
+        if self.track_memory:
+            p.peak = max(p.peak, tracemalloc.get_traced_memory()[1])
+            stats[2] = max(stats[2], p.peak - p.base)
+            if len(self._stack) > 0:
+                self._stack[-1].peak = max(self._stack[-1].peak, p.peak)
+        if p.label is not None:
+            item = {"label": p.label, "wall_seconds": round(end - p.start, 6)}
+            if self.track_memory:
+                item["peak_alloc_bytes"] = p.peak - p.base
+            #only the phases inside the item, i.e. those whose time grew while it ran
+            item["phases"] = {name: round(stats[1] - p.phase_seconds.get(name, 0.0), 6) for (name, stats) in self.phases.items() if name != p.name and stats[1] > p.phase_seconds.get(name, 0.0)}
+            self.items.append(item)
+        if self.trace:
+            if len(self.events) < self.max_trace_events:
+                event = {"name": p.name, "ph": "X", "ts": round((p.start - self._origin) * 1e6, 3), "dur": round((end - p.start) * 1e6, 3), "pid": os.getpid(), "tid": 0}
+                if p.label is not None:
+                    event["args"] = {"label": p.label}
+                self.events.append(event)
+            else:
+                self.dropped_events += 1
+
+    #Returns the JSON-serializable profile: one entry per phase, most wall time first, and one per item in order
+    def summary(self):
+        phases = list()
+        for (name, (calls, seconds, peak)) in sorted(self.phases.items(), key = lambda x: x[1][1], reverse = True):
+            obj = {"phase": name, "calls": calls, "wall_seconds": round(seconds, 6)}
+            if self.track_memory:
+                obj["peak_alloc_bytes"] = peak
+            phases.append(obj)
+        obj = {"phases": phases, "items": self.items}
+        if self.dropped_events > 0:
+            obj["dropped_trace_events"] = self.dropped_events
+        return obj
+
+    def write_summary(self, path):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent = 4)
+            f.write("\n")
+
+    #Writes the trace events in the Chrome trace event format, for chrome://tracing or Perfetto
+    def write_trace(self, path):
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+            f.write("\n")
+
+#The profiler the lngraph modules and the scripts record their phases in
+profiler = Profiler()
+
+#Decorator recording every call of a function as the phase name of profiler
+def profiled(name):
+    def decorate(f):
+        @functools.wraps(f)
+        def profiled_call(*args, **kwargs):
+            if not profiler.enabled:
+                return f(*args, **kwargs)
+            with profiler.phase(name):
+                return f(*args, **kwargs)
+        return profiled_call
+    return decorate
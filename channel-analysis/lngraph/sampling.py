@@ -0,0 +1,46 @@
+#Stratified random samples of target nodes, for estimating metrics over all of them
+import math
+import random
+
+#z value of a two-sided 95% confidence interval
+Z_95 = 1.959964
+
+#A stratified random sample of a population of nodes. The sample is allocated to the strata in proportion to
+#their sizes, with at least two nodes from each stratum so its variance can be estimated; strata with no more
+#nodes than their allocation are taken whole and contribute no sampling error.
+class StratifiedSample:
+    #strata is a list of collections of nodes. The same strata, sample_size and seed always give the same sample.
+    def __init__(self, strata, sample_size, seed):
+        rnd = random.Random(seed)
+        self.population = sum([len(stratum) for stratum in strata])
+        self.strata = list() #(stratum size, sampled nodes)
+        for stratum in strata:
+            if len(stratum) == 0:
+                continue
+            allocation = min(len(stratum), max(2, int(round(sample_size * len(stratum) / self.population))))
+            self.strata.append((len(stratum), rnd.sample(sorted(stratum), allocation)))
+        self.nodes = {n for (size, sampled) in self.strata for n in sampled}
+
+    #Returns (mean, standard error): the stratified estimate of the mean of a value over the population.
+    #values maps sampled nodes to their value; sampled nodes missing from it count as 0.
+    def mean(self, values):
+        mean = 0.0
+        variance = 0.0
+        for (size, sampled) in self.strata:
+            weight = size / self.population
+            sample_values = [values.get(n, 0) for n in sampled]
+            stratum_mean = sum(sample_values) / len(sample_values)
+            mean += weight * stratum_mean
+            if len(sampled) < size:
+                stratum_variance = sum([(v - stratum_mean) ** 2 for v in sample_values]) / (len(sampled) - 1)
+                variance += weight ** 2 * (1 - len(sampled) / size) * stratum_variance / len(sampled)
+        return (mean, math.sqrt(variance))
+
+    #Returns (total, standard error): the stratified estimate of the sum of a value over the population
+    def total(self, values):
+        (mean, error) = self.mean(values)
+        return (mean * self.population, error * self.population)
+
+#Returns the two-sided 95% confidence interval (low, high) of a normally distributed estimate
+def confidence_interval(estimate, error):
+    return (estimate - Z_95 * error, estimate + Z_95 * error)
@@ -0,0 +1,65 @@
+#Pareto frontiers of (permillion, base) fee labels
+from bisect import bisect_right
+
+#The Pareto-optimal (permillion, base) labels of the routes to one node, kept sorted by increasing
+#permillion and therefore strictly decreasing base. The best base fee among all labels with at most a
+#given permillion fee is found by bisection, so checking a new label for dominance is O(log k) instead of
+#a scan of every label, and the labels it dominates form one contiguous run that is cut out in one step.
+class Skyline:
+    def __init__(self, labels = ()):
+        self.permillion = list()
+        self.neg_base = list() #negated base fees, so that both lists are ascending
+        for label in labels:
+            self.insert(label)
+
+    #Adds label unless it is already present or dominated, dropping the labels it dominates.
+    #Returns whether the skyline changed.
+    def insert(self, label):
+        (ppm, base) = label
+        i = bisect_right(self.permillion, ppm)
+        if i > 0 and -self.neg_base[i - 1] <= base:
+            return False
+        start = i - 1 if i > 0 and self.permillion[i - 1] == ppm else i
+        end = bisect_right(self.neg_base, -base, start)
+        self.permillion[start:end] = [ppm]
+        self.neg_base[start:end] = [-base]
+        return True
+
+    #Returns whether some label of the skyline is at least as cheap as label on both fees
+    def covers(self, label):
+        i = bisect_right(self.permillion, label[0])
+        return i > 0 and -self.neg_base[i - 1] <= label[1]
+
+    #Returns the skyline of the labels within the given fee thresholds
+    def restricted(self, base_fee_threshold, permillion_fee_threshold):
+        restricted = Skyline()
+        i = bisect_right(self.permillion, permillion_fee_threshold)
+        j = bisect_right(self.neg_base, -base_fee_threshold - 1, 0, i)
+        restricted.permillion = self.permillion[j:i]
+        restricted.neg_base = self.neg_base[j:i]
+        return restricted
+
+    def copy(self):
+        copy = Skyline()
+        copy.permillion = list(self.permillion)
+        copy.neg_base = list(self.neg_base)
+        return copy
+
+    def min_permillion(self):
+        return self.permillion[0]
+
+    def __contains__(self, label):
+        i = bisect_right(self.permillion, label[0])
+        return i > 0 and self.permillion[i - 1] == label[0] and self.neg_base[i - 1] == -label[1]
+
+    def __iter__(self):
+        return zip(self.permillion, [-b for b in self.neg_base])
+
+    def __len__(self):
+        return len(self.permillion)
+
+    def __eq__(self, other):
+        return isinstance(other, Skyline) and self.permillion == other.permillion and self.neg_base == other.neg_base
+
+    def __repr__(self):
+        return "Skyline(%r)" % list(self)
@@ -0,0 +1,240 @@
+#Binary, memory-mapped snapshots of a parsed channel graph
+#pip3 install numpy
+import os, json, mmap, zlib, hashlib
+from array import array
+import numpy
+from lngraph.graph import ChannelGraph, set_order
+
+#File layout: the 8 byte magic, the length of the JSON header as a little-endian uint64, the JSON header,
+#and then the payload: the arrays listed in the header, each starting at an 8-byte aligned offset relative
+#to the start of the payload. The header holds the CRC-32 of the payload and a fingerprint of every source
+#file the snapshot was compiled from, so both a damaged and a stale snapshot are detected when it is opened.
+#
+#The snapshot is compiled without a root node or banned nodes, and each node's channels are stored in
+#input order. The root node and banned nodes only change the node numbering and the set of channels, so
+#channel_graph() can derive the exact graph a ChannelGraphParser would have built from the same input.
+SNAPSHOT_MAGIC = b"LNGSNAP\0"
+SNAPSHOT_VERSION = 1
+
+class SnapshotError(Exception):
+    pass
+
+#Returns the fingerprint of a source file: its size, modification time and BLAKE2b digest
+def source_fingerprint(path):
+    digest = hashlib.blake2b(digest_size = 20)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "blake2b": digest.hexdigest()}
+
+#Returns whether path still has the content described by fingerprint. The digest is only recomputed when
+#the size and modification time no longer match.
+def source_unchanged(fingerprint):
+    try:
+        stat = os.stat(fingerprint["path"])
+    except OSError:
+        return False
+    if stat.st_size == fingerprint["size"] and stat.st_mtime_ns == fingerprint["mtime_ns"]:
+        return True
+    return stat.st_size == fingerprint["size"] and source_fingerprint(fingerprint["path"])["blake2b"] == fingerprint["blake2b"]
+
+def _string_table(strings):
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = numpy.zeros(len(encoded) + 1, dtype = numpy.int64)
+    numpy.cumsum([len(e) for e in encoded], out = offsets[1:])
+    return (numpy.frombuffer(b"".join(encoded), dtype = numpy.uint8), offsets)
+
+#Writes the graph held by parser (a lngraph.ingest.ChannelGraphParser without root node or banned nodes)
+#to path. sources are the fingerprints of the files it was parsed from; pass an empty list for a pipe.
+def write_snapshot(path, parser, sources):
+    num_nodes = len(parser.node_to_id)
+    node_ids = [parser.node_to_id[n] for n in range(num_nodes)]
+    #aliases of nodes without channels are kept too, since one of them may be the root node
+    node_ids.extend([node_id for node_id in parser.id_to_alias if node_id not in parser.id_to_node])
+    alias_nodes = [k for (k, node_id) in enumerate(node_ids) if node_id in parser.id_to_alias]
+
+    offsets = array('q', [0])
+    targets = array('q')
+    fee_permillion = array('q')
+    fee_base = array('q')
+    capacity = array('q')
+    max_channel_capacity = array('q')
+    for n in range(num_nodes):
+        for o in parser.outgoing.get(n, ()):
+            (permillion, base) = parser.chan_fees[(n, o)]
+            targets.append(o)
+            fee_permillion.append(permillion)
+            fee_base.append(base)
+            capacity.append(parser.chan_capacity[(n, o)])
+            max_channel_capacity.append(parser.max_channel_capacity[(n, o)])
+        offsets.append(len(targets))
+
+    (id_bytes, id_offsets) = _string_table(node_ids)
+    (alias_bytes, alias_offsets) = _string_table([parser.id_to_alias[node_ids[k]] for k in alias_nodes])
+    arrays = [
+        ("node_id_bytes", id_bytes),
+        ("node_id_offsets", id_offsets),
+        ("alias_nodes", numpy.array(alias_nodes, dtype = numpy.int64)),
+        ("alias_bytes", alias_bytes),
+        ("alias_offsets", alias_offsets),
+        ("channel_endpoints", numpy.frombuffer(parser.channel_endpoints, dtype = numpy.int64)),
+        ("offsets", numpy.frombuffer(offsets, dtype = numpy.int64)),
+        ("targets", numpy.frombuffer(targets, dtype = numpy.int64)),
+        ("fee_permillion", numpy.frombuffer(fee_permillion, dtype = numpy.int64)),
+        ("fee_base", numpy.frombuffer(fee_base, dtype = numpy.int64)),
+        ("capacity", numpy.frombuffer(capacity, dtype = numpy.int64)),
+        ("max_channel_capacity", numpy.frombuffer(max_channel_capacity, dtype = numpy.int64)),
+    ]
+
+    index = dict()
+    payload = bytearray()
+    for (name, values) in arrays:
+        payload.extend(b"\0" * (-len(payload) % 8))
+        index[name] = {"dtype": values.dtype.str, "offset": len(payload), "count": len(values)}
+        payload.extend(values.tobytes())
+
+    header = {
+        "version": SNAPSHOT_VERSION,
+        "software": parser.software_type.value,
+        "sources": sources,
+        "num_nodes": num_nodes,
+        "num_channels": parser.num_channels,
+        "num_inactive_channels": parser.num_inactive_channels,
+        "arrays": index,
+        "payload_crc32": zlib.crc32(payload),
+    }
+    header_bytes = json.dumps(header).encode("utf-8")
+    header_bytes += b" " * (-(len(SNAPSHOT_MAGIC) + 8 + len(header_bytes)) % 8)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(len(header_bytes).to_bytes(8, "little"))
+        f.write(header_bytes)
+        f.write(payload)
+    os.replace(tmp_path, path)
+
+#Reads the header of the snapshot at path without mapping or checking its payload
+def read_snapshot_header(path):
+    with open(path, "rb") as f:
+        if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+            raise SnapshotError("%s is not a channel graph snapshot" % path)
+        header_length = int.from_bytes(f.read(8), "little")
+        try:
+            header = json.loads(f.read(header_length).decode("utf-8"))
+        except ValueError:
+            raise SnapshotError("%s has a damaged header" % path)
+    if header.get("version") != SNAPSHOT_VERSION:
+        raise SnapshotError("%s has snapshot format version %s, expected %d; compile it again" % (path, header.get("version"), SNAPSHOT_VERSION))
+    return (header, len(SNAPSHOT_MAGIC) + 8 + header_length)
+
+#Returns an array('q') holding the values of a numpy array, the type ChannelGraph's hot loops index fastest
+def _int_array(values):
+    result = array('q')
+    result.frombytes(numpy.ascontiguousarray(values, dtype = numpy.int64).tobytes())
+    return result
+
+#A snapshot file mapped into memory. The arrays are read-only numpy views of the mapping, so opening a
+#snapshot costs one checksum pass over the file instead of parsing JSON.
+class GraphSnapshot:
+    #Raises SnapshotError if the file is damaged or, unless allow_stale is set, one of its sources changed
+    def __init__(self, path, allow_stale = False):
+        (self.header, payload_start) = read_snapshot_header(path)
+        with open(path, "rb") as f:
+            self.mapping = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        payload = memoryview(self.mapping)[payload_start:]
+        if zlib.crc32(payload) != self.header["payload_crc32"]:
+            raise SnapshotError("%s is damaged: payload checksum mismatch" % path)
+        if not allow_stale:
+            for source in self.header["sources"]:
+                if not source_unchanged(source):
+                    raise SnapshotError("%s is stale: %s changed since it was compiled" % (path, source["path"]))
+        self.arrays = dict()
+        for (name, entry) in self.header["arrays"].items():
+            self.arrays[name] = numpy.frombuffer(self.mapping, dtype = numpy.dtype(entry["dtype"]), count = entry["count"], offset = payload_start + entry["offset"])
+        self.software_type = self.header["software"]
+        self.num_nodes = self.header["num_nodes"]
+
+    def _strings(self, bytes_name, offsets_name):
+        blob = self.arrays[bytes_name].tobytes()
+        offsets = self.arrays[offsets_name].tolist()
+        return [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+    #Returns the ids of all nodes in the snapshot; the first num_nodes of them have channels
+    def node_ids(self):
+        return self._strings("node_id_bytes", "node_id_offsets")
+
+    #Returns a dict mapping node ids to aliases
+    def id_to_alias(self, node_ids = None):
+        if node_ids is None:
+            node_ids = self.node_ids()
+        aliases = self._strings("alias_bytes", "alias_offsets")
+        return {node_ids[n]: alias for (n, alias) in zip(self.arrays["alias_nodes"].tolist(), aliases)}
+
+    #Returns (channel_graph, node_to_id, node_to_alias) numbered exactly as a ChannelGraphParser that was given
+    #root_node_id first and skips channels of banned_nodes numbers them: the root node is 0 and the other
+    #nodes follow in order of their first channel that doesn't involve a banned node.
+    def channel_graph(self, root_node_id, banned_nodes = ()):
+        node_ids = self.node_ids()
+        num_nodes = self.num_nodes
+        banned = numpy.zeros(num_nodes, dtype = bool)
+        for node_id in banned_nodes:
+            if node_id in node_ids[:num_nodes]:
+                banned[node_ids.index(node_id)] = True
+
+        #first appearance of every node among the channels without a banned endpoint
+        endpoints = self.arrays["channel_endpoints"].reshape(-1, 2)
+        kept_channels = ~(banned[endpoints[:, 0]] | banned[endpoints[:, 1]])
+        appearances = endpoints[kept_channels].reshape(-1)
+        (appearing, first_index) = numpy.unique(appearances, return_index = True)
+        order_array = appearing[numpy.argsort(first_index, kind = "stable")]
+
+        #old_of_new[n] is the snapshot number of node n, or -1 for a root node without (unbanned) channels
+        root_old = node_ids.index(root_node_id) if root_node_id in node_ids[:num_nodes] else -1
+        if root_old >= 0 and banned[root_old]:
+            root_old = -1
+        old_of_new = numpy.concatenate(([root_old], order_array[order_array != root_old]))
+        new_of_old = numpy.full(num_nodes, -1, dtype = numpy.int64)
+        kept_nodes = old_of_new >= 0
+        new_of_old[old_of_new[kept_nodes]] = numpy.flatnonzero(kept_nodes)
+        node_to_id = {n: node_ids[old] for (n, old) in enumerate(old_of_new.tolist())}
+        node_to_id[0] = root_node_id
+
+        #relabel the channels and group them by their new source, keeping each node's snapshot order
+        old_offsets = self.arrays["offsets"]
+        sources = new_of_old[numpy.repeat(numpy.arange(num_nodes), numpy.diff(old_offsets))]
+        targets = new_of_old[self.arrays["targets"]]
+        kept = numpy.flatnonzero((sources >= 0) & (targets >= 0))
+        kept = kept[numpy.argsort(sources[kept], kind = "stable")]
+        degree = numpy.bincount(sources[kept], minlength = len(old_of_new))
+        offsets = numpy.zeros(len(old_of_new) + 1, dtype = numpy.int64)
+        numpy.cumsum(degree, out = offsets[1:])
+        #each node's channels are put in the order ChannelGraphParser.channel_graph() gives them, the iteration
+        #order of a set of their targets. That order is the only part that needs a Python loop, over the nodes
+        #with more than one channel; the permutation it implies is applied to all arrays at once.
+        kept_targets = targets[kept]
+        ordered_targets = kept_targets.tolist()
+        offset_list = offsets.tolist()
+        for n in numpy.flatnonzero(degree > 1).tolist():
+            (start, end) = (offset_list[n], offset_list[n + 1])
+            ordered_targets[start:end] = set_order(ordered_targets[start:end])
+        #a node's targets are distinct, so sorting by (node, target) matches each target with its edge
+        new_sources = numpy.repeat(numpy.arange(len(old_of_new)), degree)
+        ordered_targets = numpy.array(ordered_targets, dtype = numpy.int64)
+        permutation = numpy.empty(len(kept), dtype = numpy.int64)
+        permutation[numpy.lexsort((ordered_targets, new_sources))] = kept[numpy.lexsort((kept_targets, new_sources))]
+        channel_graph = ChannelGraph(len(node_to_id), _int_array(offsets), _int_array(ordered_targets),
+                                     _int_array(self.arrays["fee_permillion"][permutation]), _int_array(self.arrays["fee_base"][permutation]),
+                                     _int_array(self.arrays["capacity"][permutation]))
+
+        id_to_node = {node_id: n for (n, node_id) in node_to_id.items()}
+        node_to_alias = {id_to_node[node_id]: alias for (node_id, alias) in self.id_to_alias(node_ids).items() if node_id in id_to_node}
+        return (channel_graph, node_to_id, node_to_alias)
+
+    #Returns the (src, dest) snapshot node numbers of the active channels whose largest single channel is bigger
+    #than min_channel_capacity, as an array of shape (channels, 2). These are the numbers of node_ids() and of the
+    #ChannelGraphParser the snapshot was compiled from, without renumbering.
+    def channels(self, min_channel_capacity):
+        sources = numpy.repeat(numpy.arange(self.num_nodes), numpy.diff(self.arrays["offsets"]))
+        big_enough = self.arrays["max_channel_capacity"] > min_channel_capacity
+        return numpy.stack((sources[big_enough], self.arrays["targets"][big_enough]), axis = 1)
@@ -0,0 +1,70 @@
+#Incremental extraction of triangle-closed hubs ("megahubs") from the directed channels
+from collections import deque
+from lngraph.profile import profiled
+
+#A megahub grown from seed nodes: a node outside the hub with a channel from a hub member joins once more than
+#min_triangles of the hub members it has channels to are triangle partners, i.e. have a channel in either
+#direction to another hub member it has a channel to. Joining only ever adds triangle partners to the nodes
+#outside, so the hub is the least set containing the seeds that no outside node qualifies for, whatever order
+#the nodes join in.
+#
+#Instead of rescanning every neighbour of the hub until a full pass admits no one, the extraction keeps the
+#triangle partners of each node outside the hub and, when a node joins, only updates the nodes with a channel to
+#or from it. Nodes whose partners or eligibility changed go on a worklist and are admitted when they qualify.
+class MegahubExtraction:
+    #edges are the (src, dest) node numbers of the channels, below num_nodes like the seeds, as
+    #ChannelGraphParser.channels() and GraphSnapshot.channels() return them
+    def __init__(self, edges, num_nodes, seeds, min_triangles):
+        self.adjacent = [set() for n in range(num_nodes)]
+        self.incoming = [set() for n in range(num_nodes)]
+        for (src, dest) in edges.tolist():
+            self.adjacent[src].add(dest)
+            self.incoming[dest].add(src)
+        self.min_triangles = min_triangles
+        self.hub = set()
+        self.reached = set() #nodes outside the hub that a hub member has a channel to
+        self.partners = dict() #maps nodes outside the hub to their triangle partners in the hub
+        worklist = deque()
+        for seed in seeds:
+            if seed not in self.hub:
+                worklist.extend(self._join(seed))
+        self._extract(worklist)
+
+    @profiled("triangle extraction")
+    def _extract(self, worklist):
+        queued = set(worklist)
+        while len(worklist) > 0:
+            n = worklist.popleft()
+            queued.discard(n)
+            if n in self.hub or n not in self.reached or len(self.partners.get(n, ())) - 1 < self.min_triangles:
+                continue
+            for m in self._join(n):
+                if m not in queued:
+                    queued.add(m)
+                    worklist.append(m)
+
+    #Adds n to the hub and returns the nodes outside it whose state changed
+    def _join(self, n):
+        self.hub.add(n)
+        self.reached.discard(n)
+        self.partners.pop(n, None)
+        changed = list()
+        out = self.adjacent[n]
+        into = self.incoming[n]
+        for m in out:
+            if m not in self.hub and m not in self.reached:
+                self.reached.add(m)
+                changed.append(m)
+        #n is a new hub neighbour of every node with a channel to it, and forms a triangle with each of that
+        #node's hub neighbours that n has a channel to or from
+        linked = out | into
+        for m in into:
+            if m in self.hub:
+                continue
+            common = [x for x in (self.adjacent[m] & linked) if x in self.hub and x != n]
+            if len(common) > 0:
+                partners = self.partners.setdefault(m, set())
+                partners.add(n)
+                partners.update(common)
+                changed.append(m)
+        return changed
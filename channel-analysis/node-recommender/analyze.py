@@ -17,71 +17,111 @@ def trunc_pad(str_in, max_len):
 def f(rank):
     return 1.0 + (math.log(1.0 + rank) / math.log(8))
 
-n = 10 if len(sys.argv) == 1 else int(sys.argv[1])
-json_data = json.load(sys.stdin)
-cur_maxflow_geo = float(json_data["root_node_metrics"]["existing_maxflow_geomean"])
-cur_shortest_geo = float(json_data["root_node_metrics"]["existing_shortest_path_geomean"])
-cur_cheapest_geo = float(json_data["root_node_metrics"]["existing_cheapest_ppm_geomean"])
-print("Found %d potential peers" % len(json_data["peer_metrics"]))
-print("Current maxflow = %f" % cur_maxflow_geo)
-print("Current shortest = %f" % cur_shortest_geo)
-print("Current cheapest = %f" % cur_cheapest_geo)
-print("")
+def print_analysis(json_data, n):
+    cur_maxflow_geo = float(json_data["root_node_metrics"]["existing_maxflow_geomean"])
+    cur_shortest_geo = float(json_data["root_node_metrics"]["existing_shortest_path_geomean"])
+    cur_cheapest_geo = float(json_data["root_node_metrics"]["existing_cheapest_ppm_geomean"])
+    print("Found %d potential peers" % len(json_data["peer_metrics"]))
+    print("Current maxflow = %f" % cur_maxflow_geo)
+    print("Current shortest = %f" % cur_shortest_geo)
+    print("Current cheapest = %f" % cur_cheapest_geo)
+    print("")
+
+    peers = json_data["peer_metrics"]
+    peers_by_maxflow = sorted(peers, key = lambda x: float(x["new_maxflow_geomean"]), reverse = True)
+    peers_by_shortest = sorted(peers, key = lambda x: float(x["new_shortest_path_geomean"]))
+    peers_by_cheapest = sorted(peers, key = lambda x: float(x["new_cheapest_ppm_geomean"]))
+    peer_products = dict()
+
+    print("-----")
+    print("")
+    print("Top %d potential peers by maxflow:" % n)
+    print("")
+    for i in range(0, n):
+        peer = peers_by_maxflow[i]
+        print("%.4f - %s (%s)" % (float(peer["new_maxflow_geomean"]), trunc_pad(peer["peer_alias"], 30), peer["peer_id"]))
+    for i in range(0, len(peers_by_maxflow)):
+        peer = peers_by_maxflow[i]
+        peer_id = peer["peer_id"]
+        peer_products[peer_id] = f(i)
+    print("")
 
-peers = json_data["peer_metrics"]
-peers_by_maxflow = sorted(peers, key = lambda x: float(x["new_maxflow_geomean"]), reverse = True)
-peers_by_shortest = sorted(peers, key = lambda x: float(x["new_shortest_path_geomean"]))
-peers_by_cheapest = sorted(peers, key = lambda x: float(x["new_cheapest_ppm_geomean"]))
-peer_products = dict()
+    print("-----")
+    print("")
+    print("Top %d potential peers by shortest paths:" % n)
+    print("")
+    for i in range(0, n):
+        peer = peers_by_shortest[i]
+        print("%.4f - %s (%s)" % (float(peer["new_shortest_path_geomean"]), trunc_pad(peer["peer_alias"], 30), peer["peer_id"]))
+    for i in range(0, len(peers_by_shortest)):
+        peer = peers_by_shortest[i]
+        peer_id = peer["peer_id"]
+        peer_products[peer_id] = peer_products[peer_id] * f(i)
+    print("")
 
-print("-----")
-print("")
-print("Top %d potential peers by maxflow:" % n)
-print("")
-for i in range(0, n):
-    peer = peers_by_maxflow[i]
-    print("%.4f - %s (%s)" % (float(peer["new_maxflow_geomean"]), trunc_pad(peer["peer_alias"], 30), peer["peer_id"]))
-for i in range(0, len(peers_by_maxflow)):
-    peer = peers_by_maxflow[i]
-    peer_id = peer["peer_id"]
-    peer_products[peer_id] = f(i)
-print("")
+    print("-----")
+    print("")
+    print("Top %d potential peers by cheapest ppm:" % n)
+    print("")
+    for i in range(0, n):
+        peer = peers_by_cheapest[i]
+        print("%.4f - %s (%s)" % (float(peer["new_cheapest_ppm_geomean"]), trunc_pad(peer["peer_alias"], 30), peer["peer_id"]))
+    for i in range(0, len(peers_by_cheapest)):
+        peer = peers_by_cheapest[i]
+        peer_id = peer["peer_id"]
+        peer_products[peer_id] = peer_products[peer_id] * f(i)
+    print("")
 
-print("-----")
-print("")
-print("Top %d potential peers by shortest paths:" % n)
-print("")
-for i in range(0, n):
-    peer = peers_by_shortest[i]
-    print("%.4f - %s (%s)" % (float(peer["new_shortest_path_geomean"]), trunc_pad(peer["peer_alias"], 30), peer["peer_id"]))
-for i in range(0, len(peers_by_shortest)):
-    peer = peers_by_shortest[i]
-    peer_id = peer["peer_id"]
-    peer_products[peer_id] = peer_products[peer_id] * f(i)
-print("")
+    if "new_routing_capacity_geomean" in peers[0]:
+        #node_recommender.py --routing-capacity; not part of the rank product, to keep it comparable to runs without
+        peers_by_capacity = sorted(peers, key = lambda x: float(x["new_routing_capacity_geomean"]), reverse = True)
+        print("-----")
+        print("")
+        print("Top %d potential peers by routing capacity (current %s sat):" % (n, json_data["root_node_metrics"]["existing_routing_capacity_geomean"]))
+        print("")
+        for i in range(0, n):
+            peer = peers_by_capacity[i]
+            print("%.6g - %s (%s)" % (float(peer["new_routing_capacity_geomean"]), trunc_pad(peer["peer_alias"], 30), peer["peer_id"]))
+        print("")
 
-print("-----")
-print("")
-print("Top %d potential peers by cheapest ppm:" % n)
-print("")
-for i in range(0, n):
-    peer = peers_by_cheapest[i]
-    print("%.4f - %s (%s)" % (float(peer["new_cheapest_ppm_geomean"]), trunc_pad(peer["peer_alias"], 30), peer["peer_id"]))
-for i in range(0, len(peers_by_cheapest)):
-    peer = peers_by_cheapest[i]
-    peer_id = peer["peer_id"]
-    peer_products[peer_id] = peer_products[peer_id] * f(i)
-print("")
+    print("-----")
+    print("")
+    print("Top %d potential peers by f(rank) product:" % n)
+    print("(where f() is some logarithmic function)")
+    print("")
+    peers_by_rank_product = sorted(peers, key = lambda x: peer_products[x["peer_id"]])
+    for i in range(0, n):
+        peer = peers_by_rank_product[i]
+        print("%7.4f - %s (%s)" % (peer_products[peer["peer_id"]], trunc_pad(peer["peer_alias"], 30), peer["peer_id"]))
+    print("")
 
-print("-----")
-print("")
-print("Top %d potential peers by f(rank) product:" % n)
-print("(where f() is some logarithmic function)")
-print("")
-peers_by_rank_product = sorted(peers, key = lambda x: peer_products[x["peer_id"]])
-for i in range(0, n):
-    peer = peers_by_rank_product[i]
-    print("%7.4f - %s (%s)" % (peer_products[peer["peer_id"]], trunc_pad(peer["peer_alias"], 30), peer["peer_id"]))
-print("")
+    print("-----")
 
-print("-----")
+def print_series_analysis(json_data, n):
+    """Summarizes the output of node_recommender.py --batch"""
+    print("Scored candidates in %d snapshots" % len(json_data["snapshots"]))
+    print("")
+    print("-----")
+    print("")
+    print("Top %d potential peers by mean peer_score:" % n)
+    print("(mean +- standard deviation, minimum, mean rank; snapshots a peer wasn't a candidate in count as 0)")
+    print("")
+    series = json_data["peer_score_series"]
+    for i in range(0, min(n, len(series))):
+        peer = series[i]
+        print("%8.2f +- %6.2f, min %4d, rank %7.2f - %s (%s)" % (peer["mean_peer_score"], peer["stdev_peer_score"], peer["min_peer_score"], peer["mean_rank"], trunc_pad(peer["peer_alias"], 30), peer["peer_id"]))
+    print("")
+    print("-----")
+
+n = 10 if len(sys.argv) == 1 else int(sys.argv[1])
+json_data = json.load(sys.stdin)
+if "peer_score_series" in json_data:
+    print_series_analysis(json_data, n)
+elif "threshold_sweep" in json_data:
+    #output of node_recommender.py --thresholds: one result block per fee threshold
+    for block in json_data["threshold_sweep"]:
+        print("===== base fee threshold %d, permillion fee threshold %d =====" % (block["base_fee_threshold"], block["permillion_fee_threshold"]))
+        print("")
+        print_analysis(block, n)
+else:
+    print_analysis(json_data, n)
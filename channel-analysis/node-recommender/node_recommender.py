@@ -1,11 +1,25 @@
 #!/usr/bin/env python3
 #Pipe input from `lightning-cli listchannels`
-#pip3 install PyMaxflow mpmath
-import sys, signal, json
+#pip3 install PyMaxflow mpmath numpy
+import sys, os, io, signal, json, math, time
+import contextlib
+import socketserver
+import multiprocessing
+import heapq
+import functools
 from functools import reduce
-import maxflow
-from mpmath import *
-from enum import Enum
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(sys.argv[0])), ".."))
+from lngraph.allpairs import AllPairsDistances
+from lngraph.checkpoint import Checkpoint, CheckpointError, run_fingerprint
+from lngraph.connectivity import UnitConnectivity, CapacityConnectivity
+from lngraph.ingest import LNSoftwareType, ChannelGraphParser
+from lngraph.lowfee import LowfeeFrontiers
+from lngraph.profile import profiler, profiled
+from lngraph.metrics import log_sum, geomean, geomean_of_log_sum, fee_geomean, format_metric
+from lngraph.sampling import StratifiedSample, confidence_interval
+from lngraph.snapshot import GraphSnapshot, SnapshotError
+from collections import ChainMap
 
 
 #####################################################
@@ -24,6 +38,70 @@ permillion_fee_threshold = 0
 min_channels = 10
 min_capacity = 15000000 #NOT about total capacity of a channel path
 
+#Number of worker processes used to evaluate candidate peers (1 = evaluate serially)
+num_jobs = 1
+
+#Compute the baseline once and evaluate each added or removed peer by propagating only the labels it changes
+incremental = False
+
+#Skip every maxflow that can't change a peer_score: keep a minimum cut per baseline maxflow, solve only for
+#nodes whose cut a new peer's channels cross, and stop those flows one path above the baseline. Implies --incremental.
+bounded_maxflow = False
+
+#With bounded_maxflow, still solve the flows of improved nodes exactly so new_maxflow_geomean is exact
+exact_geomean = False
+
+#Capacity in satoshi assumed for a new channel when computing the capacity-weighted maxflows of the low-fee
+#reachable subgraph ("low-fee routing capacity"); None leaves that metric out
+new_channel_capacity = None
+
+#Estimate each candidate's metrics from this many target nodes, sampled from the baseline's low-fee reachable
+#nodes stratified by hop distance from root_node, instead of from all of them; None evaluates every node.
+#Implies --incremental.
+sample_size = None
+
+#Seed of the target sample, so repeated runs on the same graph sample the same targets
+sample_seed = 1
+
+#Files to read the channel graph JSON from, in order, instead of stdin
+input_paths = list()
+
+#Read the channel graph from this compiled snapshot (see ../compile-snapshot) instead of JSON on stdin
+snapshot_path = None
+
+#List of (base_fee, permillion_fee) thresholds to analyze in one run instead of the single pair given on the
+#command line
+threshold_sweep = None
+
+#Only find the top_k candidates with the highest peer_score, skipping candidates that provably can't be among them
+top_k = None
+
+#Plan a portfolio of this many new channels opened together instead of scoring each candidate on its own
+plan_size = None
+
+#Unix socket to answer queries on instead of writing one analysis, keeping the graph and baseline in memory
+serve_path = None
+
+#Channel graph JSON files of successive snapshots to score the candidates in, each an update of the one before
+batch_paths = list()
+
+#Write the results of finished candidates to this file every checkpoint_interval seconds and on Ctrl-C
+checkpoint_path = None
+checkpoint_interval = 60
+
+#Take the results of candidates that are already in the checkpoint file instead of evaluating them again
+resume = False
+
+#Write per-phase wall times and call counts, and per-candidate breakdowns of them, to this JSON file. Candidates
+#are then evaluated serially, so that every phase is recorded in one process and none is slowed by the others.
+profile_path = None
+
+#Write every profiled phase as a Chrome trace event to this file (implies profiling)
+profile_trace_path = None
+
+#Also record the peak of memory allocated in each phase and candidate, with tracemalloc
+profile_memory = False
+
 #Excluded nodes (the node and all its channels will be excluded from the channel graph):
 banned_nodes = {'0217890e3aad8d35bc054f43acc00084b25229ecff0ab68debd82883ad65ee8266', #1ML.com ALPHA
                 '03c2abfa93eacec04721c019644584424aab2ba4dff3ac9bdab4e9c97007491dda'} #tippin.me
@@ -32,17 +110,24 @@ nodes = set()
 node_to_id = dict()
 id_to_node = dict()
 node_to_alias = dict()
-chan_fees = {}
-chan_fee_anchors = {}
-chan_capacity = {}
-outgoing = {}
-incoming = {}
+channel_graph = None #compact ChannelGraph of the parsed channels
+lowfee_frontiers = None #LowfeeFrontiers of the current fee thresholds, if they are evaluated incrementally
+baseline_cuts = None #MinCuts of the baseline maxflows, with bounded_maxflow
+baseline_connectivity = None #UnitConnectivity of the baseline low-fee edges, once removed peers need it
+lowfee_capacities = None #maps the baseline low-fee edges to their capacities, with new_channel_capacity
+existing_capacity_flows = None #capacity-weighted maxflows of the baseline, with new_channel_capacity
+capacity_cuts = None #MinCuts of the baseline's capacity-weighted maxflows, if it is evaluated incrementally
+target_sample = None #StratifiedSample of the baseline's low-fee reachable nodes, with sample_size
+existing_distances = None #hop distances from root_node in the baseline, with sample_size
+existing_cheapest_ppm = None #maps the baseline's low-fee reachable nodes to their cheapest ppm, with sample_size
+existing_geomeans = None #(maxflow, shortest path, cheapest ppm) geomeans of the baseline, with sample_size
 new_peer_benefit = {}
-
-class LNSoftwareType(Enum):
-    LND = "LND"
-    CLI = "C-Lightning"
-    UKN = 3
+swept_removed_peer_flows = dict() #maps the fee thresholds a sweep analyzed so far to the maxflows without each root peer
+root_metrics = None #root_node_metrics object of the current baseline
+candidate_cache = dict() #maps candidates to (peer metrics object, nodes whose channels the result depends on)
+removed_peer_cache = dict() #maps root peers to (removed peer metrics object, nodes whose channels it depends on)
+candidate_flows = dict() #maps candidates to (added low-fee edges, maxflows still valid), with batch_paths
+checkpoint = None #Checkpoint of the run, with checkpoint_path
 
 ln_software_type = LNSoftwareType.UKN
 
@@ -53,8 +138,32 @@ ln_software_type = LNSoftwareType.UKN
 
 def print_usage_and_die():
     sys.stderr.write("Usage:\n")
-    sys.stderr.write("with C-Lightning: (echo \"{\"; lightning-cli listnodes | tail -n +2 | head -n -2; echo \"],\"; lightning-cli listchannels | tail -n +2) | %s root_node base_fee permillion_fee [min_channels] [min_capacity]\n" % sys.argv[0])
-    sys.stderr.write("with LND: lncli describegraph | %s root_node base_fee permillion_fee [min_channels] [min_capacity]\n" % sys.argv[0])
+    sys.stderr.write("with C-Lightning: (lightning-cli listnodes; lightning-cli listchannels) | %s [options] root_node base_fee permillion_fee [min_channels] [min_capacity]\n" % sys.argv[0])
+    sys.stderr.write("              or: %s [options] --input listnodes.json --input listchannels.json root_node base_fee permillion_fee [min_channels] [min_capacity]\n" % sys.argv[0])
+    sys.stderr.write("with LND: lncli describegraph | %s [options] root_node base_fee permillion_fee [min_channels] [min_capacity]\n" % sys.argv[0])
+    sys.stderr.write("snapshot series: %s [options] --batch lnchannels.1 --batch lnchannels.2 [--batch ...] root_node base_fee permillion_fee [min_channels] [min_capacity]\n" % sys.argv[0])
+    sys.stderr.write("fee threshold sweep: ... | %s [options] --thresholds base_fee:permillion_fee[,base_fee:permillion_fee...] root_node [min_channels] [min_capacity]\n" % sys.argv[0])
+    sys.stderr.write("\n")
+    sys.stderr.write("options:\n")
+    sys.stderr.write("--jobs N: Evaluate candidate peers in N worker processes. (optional, default %d)\n" % num_jobs)
+    sys.stderr.write("--thresholds base_fee:permillion_fee,...: Analyze several fee thresholds in one run, reusing the fee frontiers of the loosest one and the removed-peer maxflows of the tighter ones. Implies --incremental. The output contains one result block per threshold. (optional)\n")
+    sys.stderr.write("--input FILE: Read channel graph JSON from FILE instead of stdin. Give it once per file, e.g. for separate listnodes and listchannels output. (optional)\n")
+    sys.stderr.write("--snapshot FILE: Read the channel graph from a snapshot compiled by compile_snapshot.py instead of from stdin. (optional)\n")
+    sys.stderr.write("--top K: Only output the K candidate peers with the highest peer_score, best first. Candidates whose upper bound on peer_score can't beat the K-th best found so far are not evaluated; the result is the same as the first K of a full run sorted by peer_score. (optional)\n")
+    sys.stderr.write("--plan K: Choose K new peers to open channels to together: each round picks the candidate with the highest peer_score given the channels chosen in earlier rounds, re-scoring candidates lazily. The output lists the chosen peers and each one's marginal gain. (optional)\n")
+    sys.stderr.write("--batch FILE: Score the candidates in each of several snapshots of the channel graph, given in time order by repeating --batch, instead of reading one from stdin. Each snapshot is applied as an update of the one before, so only the maxflows its changes can affect are solved again. The output holds a peer_score series and stability statistics per candidate. Implies --incremental. (optional)\n")
+    sys.stderr.write("--serve SOCKET: Keep the graph and baseline metrics in memory and answer queries (see README.md) on the Unix socket SOCKET instead of writing an analysis. Implies --incremental. (optional)\n")
+    sys.stderr.write("--bounded-maxflow: Only solve the maxflows a peer_score depends on: nodes whose baseline minimum cut none of a candidate's new channels cross keep their maxflow, newly reachable nodes get none, and the rest are solved only up to one path more than before. peer_score is the same as with --incremental, but new_maxflow_geomean is a lower bound. Implies --incremental. (optional)\n")
+    sys.stderr.write("--exact-geomean: With --bounded-maxflow, solve the maxflows of improved nodes exactly, so new_maxflow_geomean is the same as with --incremental. (optional)\n")
+    sys.stderr.write("--sample-targets N: Estimate each candidate's peer_score, routability improvements, bonus and new maxflow, shortest path and cheapest ppm geomeans from N target nodes sampled from the low-fee reachable subgraph, stratified by hop distance, and report a 95%% confidence interval next to each. Newly reachable nodes and the root node metrics are still exact. Implies --incremental. (optional)\n")
+    sys.stderr.write("--sample-seed S: Random seed of the --sample-targets sample. (optional, default %d)\n" % sample_seed)
+    sys.stderr.write("--routing-capacity SATS: Also compute the low-fee routing capacity, the geometric mean of the capacity-weighted maxflows, assuming a new channel of SATS satoshi to each candidate peer. (optional)\n")
+    sys.stderr.write("--checkpoint FILE: Save the results of finished candidates to FILE every %d seconds and when interrupted with Ctrl-C, along with a fingerprint of the channel graph and settings. (optional)\n" % checkpoint_interval)
+    sys.stderr.write("--resume: With --checkpoint, take the results of the candidates already in FILE instead of evaluating them again. FILE must come from a run on the same channel graph with the same options and arguments; the output is the same as that of an uninterrupted run. (optional)\n")
+    sys.stderr.write("--profile FILE: Write the wall time, number of calls and, with --profile-memory, peak memory allocated in each phase (JSON parsing, fee merging, fee frontier propagation, maxflow graph building and solving, shortest paths, ...) and for each candidate to FILE as JSON. Candidates are evaluated serially. (optional)\n")
+    sys.stderr.write("--profile-trace FILE: Write every phase as an event to FILE in the Chrome trace event format, for chrome://tracing or Perfetto. Candidates are evaluated serially. (optional)\n")
+    sys.stderr.write("--profile-memory: With --profile or --profile-trace, also record allocation peaks with tracemalloc, which slows down the run. (optional)\n")
+    sys.stderr.write("--incremental: Compute the low-fee reachable subgraph and maxflows once and update only what each added or removed peer affects. The output is the same as that of a default run. (optional)\n")
     sys.stderr.write("\n")
     sys.stderr.write("root_node: Your node pubkey\n")
     sys.stderr.write("base_fee: The maximum base fee (in milisatoshi) accumulated along a route to remain \"low-fee reachable\"\n")
@@ -64,154 +173,164 @@ def print_usage_and_die():
     sys.exit(1)
 
 def sigint_handler(signal, frame):
+    if checkpoint is not None:
+        checkpoint.save()
+        sys.stderr.write("\nSaved %d finished candidates to %s; run again with --resume to continue\n" % (checkpoint.num_results(), checkpoint_path))
     print('\nInterrupted')
     sys.exit(0)
 
-def detect_ln_software_type(json_data):
-    try:
-        buf = json_data['channels'][0]
-        return LNSoftwareType.CLI
-    except KeyError:
-        pass
-    try:
-        buf = json_data['edges'][0]
-        return LNSoftwareType.LND
-    except KeyError:
-        return LNSoftwareType.UKN
-
-def parse_node_aliases(json_data):
-    for node in json_data['nodes']:
-        if 'alias' in node and node['nodeid'] in id_to_node:
-            n = id_to_node[node['nodeid']]
-            node_to_alias[n] = node['alias']
+#Removes "--option value" pairs from argv and returns the remaining positional arguments
+def parse_options(argv):
+    global num_jobs, incremental, threshold_sweep, snapshot_path, serve_path, top_k, plan_size, bounded_maxflow, exact_geomean, new_channel_capacity, sample_size, sample_seed, checkpoint_path, resume, profile_path, profile_trace_path, profile_memory
+    positional = list()
+    i = 0
+    while i < len(argv):
+        if argv[i] == "--jobs" and i + 1 < len(argv):
+            num_jobs = int(argv[i + 1])
+            i += 2
+        elif argv[i] == "--input" and i + 1 < len(argv):
+            input_paths.append(argv[i + 1])
+            i += 2
+        elif argv[i] == "--snapshot" and i + 1 < len(argv):
+            snapshot_path = argv[i + 1]
+            i += 2
+        elif argv[i] == "--top" and i + 1 < len(argv):
+            top_k = int(argv[i + 1])
+            i += 2
+        elif argv[i] == "--plan" and i + 1 < len(argv):
+            plan_size = int(argv[i + 1])
+            i += 2
+        elif argv[i] == "--serve" and i + 1 < len(argv):
+            serve_path = argv[i + 1]
+            incremental = True
+            i += 2
+        elif argv[i] == "--batch" and i + 1 < len(argv):
+            batch_paths.append(argv[i + 1])
+            incremental = True
+            i += 2
+        elif argv[i] == "--routing-capacity" and i + 1 < len(argv):
+            new_channel_capacity = int(argv[i + 1])
+            i += 2
+        elif argv[i] == "--sample-targets" and i + 1 < len(argv):
+            sample_size = int(argv[i + 1])
+            incremental = True
+            i += 2
+        elif argv[i] == "--sample-seed" and i + 1 < len(argv):
+            sample_seed = int(argv[i + 1])
+            i += 2
+        elif argv[i] == "--checkpoint" and i + 1 < len(argv):
+            checkpoint_path = argv[i + 1]
+            i += 2
+        elif argv[i] == "--profile" and i + 1 < len(argv):
+            profile_path = argv[i + 1]
+            i += 2
+        elif argv[i] == "--profile-trace" and i + 1 < len(argv):
+            profile_trace_path = argv[i + 1]
+            i += 2
+        elif argv[i] == "--profile-memory":
+            profile_memory = True
+            i += 1
+        elif argv[i] == "--resume":
+            resume = True
+            i += 1
+        elif argv[i] == "--incremental":
+            incremental = True
+            i += 1
+        elif argv[i] == "--bounded-maxflow":
+            bounded_maxflow = True
+            incremental = True
+            i += 1
+        elif argv[i] == "--exact-geomean":
+            exact_geomean = True
+            i += 1
+        elif argv[i] == "--thresholds" and i + 1 < len(argv):
+            threshold_sweep = list()
+            for threshold in argv[i + 1].split(","):
+                (base_fee, permillion_fee) = threshold.split(":")
+                threshold_sweep.append((int(base_fee), int(permillion_fee)))
+            i += 2
+        elif argv[i].startswith("--"):
+            sys.stderr.write("Unknown option %s\n\n" % argv[i])
+            print_usage_and_die()
+        else:
+            positional.append(argv[i])
+            i += 1
+    if num_jobs < 1 or (top_k is not None and top_k < 1) or (plan_size is not None and plan_size < 1) or (new_channel_capacity is not None and new_channel_capacity < 0):
+        print_usage_and_die()
+    #--serve and --plan replace the analysis that --thresholds and --top modify
+    if serve_path is not None and (threshold_sweep is not None or top_k is not None or plan_size is not None):
+        print_usage_and_die()
+    if plan_size is not None and (threshold_sweep is not None or top_k is not None):
+        print_usage_and_die()
+    #--batch reads its own snapshots and replaces the analysis as well
+    if len(batch_paths) > 0 and (len(input_paths) > 0 or snapshot_path is not None or serve_path is not None or plan_size is not None or threshold_sweep is not None or top_k is not None):
+        print_usage_and_die()
+    if exact_geomean and not bounded_maxflow:
+        print_usage_and_die()
+    #only the sweep over all candidates is checkpointed
+    if checkpoint_path is not None and (top_k is not None or plan_size is not None or serve_path is not None or len(batch_paths) > 0):
+        print_usage_and_die()
+    if resume and checkpoint_path is None:
+        print_usage_and_die()
+    #the daemon never finishes a profile
+    if (profile_path is not None or profile_trace_path is not None) and serve_path is not None:
+        print_usage_and_die()
+    if profile_memory and profile_path is None and profile_trace_path is None:
+        print_usage_and_die()
+    #estimated scores can exceed the upper bounds --top and --plan prune with, and the sample is drawn per baseline
+    if sample_size is not None and (sample_size < 1 or top_k is not None or plan_size is not None or serve_path is not None or len(batch_paths) > 0):
+        print_usage_and_die()
+    return positional
 
 def node_is_big_enough(n):
-    num_channels = 0
-    total_capacity = 0
-    if n in outgoing:
-        num_channels += len(outgoing[n])
-        total_capacity += reduce(lambda x,y: x+y, [chan_capacity[(n, o)] for o in outgoing[n]])
+    num_channels = channel_graph.out_degree(n)
+    total_capacity = channel_graph.total_capacity(n)
 
     if num_channels < min_channels or total_capacity < min_capacity:
         return False
     else:
         return True
 
-def is_pareto_dominated(x, y, tuple_set):
-    for (t_x, t_y) in tuple_set:
-        if (t_x != x or t_y != y) and t_x <= x and t_y <= y:
-            return True
-    return False
-
-def get_unweighted_maxflow(source, sink, edges):
-    node_map = dict()
-    source_cap = 0
-    sink_cap = 0
-
-    i = 0
-    for (src, dest) in edges:
-        if src not in node_map:
-            node_map[src] = i
-            i += 1
-        if dest not in node_map:
-            node_map[dest] = i
-            i += 1
-        if src == source:
-            source_cap += 1
-        if dest == sink:
-            sink_cap += 1
-    g = maxflow.Graph[int](i, len(edges))
-    g.add_nodes(i)
-
-    for (src, dest) in edges:
-        g_src = node_map[src]
-        g_dest = node_map[dest]
-        g.add_edge(g_src, g_dest, 1, 0)
-    g.add_tedge(node_map[source], source_cap, 0)
-    g.add_tedge(node_map[sink], 0, sink_cap)
-
-    return g.maxflow()
-
-#Returns a set of node tuples
+#Returns (lowfee_edges, lowfee_nodes, min_cost_to_node) of the low-fee reachable subgraph, with a channel to
+#proposed_new_peer opened or the one to removed_peer closed, propagated from scratch. min_cost_to_node maps each
+#node to the Skyline of its Pareto-optimal (permillion, base) route costs. The incremental evaluators derive the
+#same subgraph from the baseline's LowfeeFrontiers.
 #Note that not all routes through the low-fee reachable subgraph are low-fee routes!
-def get_lowfee_reachable_subgraph(proposed_new_peer=None, max_hops=None):
-    lowfee_edges = set()
-    lowfee_nodes = set()
-    min_cost_to_node = dict() #maps to a set of fee tuples (permillion, base) of costs to reach that node
-                              #that lie along the Pareto frontier (i.e, there is no other min_cost_to_node
-                              #that is strictly worse on both permillion and base)
-    processed_nodes = set()
-    queued = set()
-    if max_hops == None:
-        max_hops = 20
-
-    min_cost_to_node[root_node] = set()
-    min_cost_to_node[root_node].add((0, 0)) #(feerate_min_permillion, feerate_min_base)
-    processed_nodes.add(root_node)
-    queued.add(root_node)
-    bfs_queue = [(n, 1) for n in outgoing[root_node]]
-    for o in outgoing[root_node]:
-        min_cost_to_node[o] = set()
-        min_cost_to_node[o].add((0, 0))
-        lowfee_edges.add((root_node, o))
-        queued.add(o)
-
+def get_lowfee_reachable_subgraph(proposed_new_peer=None, removed_peer=None):
+    root_peers = set(channel_graph.successors(root_node))
     if proposed_new_peer is not None:
-        lowfee_edges.add((root_node, proposed_new_peer))
-        min_cost_to_node[proposed_new_peer] = set()
-        min_cost_to_node[proposed_new_peer].add((0, 0))
-        queued.add(proposed_new_peer)
-        bfs_queue.append((proposed_new_peer, 1))
-    #use (0, 0) here instead of chan_fees[(root_node, n)] because we control these fees and they're independent of the peer node's low-fee reachability
-
-    while len(bfs_queue) > 0:
-        (cur_node, cur_hops) = bfs_queue.pop(0)
-        processed_nodes.add(cur_node)
-        pareto_optimal_feerates = set()
-        for (ppm, base) in min_cost_to_node[cur_node]:
-            if not is_pareto_dominated(ppm, base, min_cost_to_node[cur_node]):
-                #we checked for Pareto optimality below, but as min_cost_to_node was under
-                #construction it may have old entries that are no longer on the Pareto frontier
-                pareto_optimal_feerates.add((ppm, base))
-        min_cost_to_node[cur_node] = pareto_optimal_feerates
-        for min_feerate in pareto_optimal_feerates:
-            (permillion_fee, base_fee) = min_feerate
-
-            if permillion_fee > permillion_fee_threshold or base_fee > base_fee_threshold:
-                continue
-
-            if cur_node not in outgoing:
-                continue
-
-            for o in outgoing[cur_node]:
-                (new_permillion_fee, new_base_fee) = chan_fees[(cur_node, o)]
-                new_permillion_fee += permillion_fee
-                new_base_fee += base_fee
-
-                if new_permillion_fee <= permillion_fee_threshold and new_base_fee <= base_fee_threshold:
-                    lowfee_edges.add((cur_node, o))
-                    if o not in processed_nodes and o not in queued and cur_hops < max_hops:
-                        queued.add(o)
-                        bfs_queue.append((o, cur_hops + 1))
-                    if o not in min_cost_to_node:
-                        min_cost_to_node[o] = set()
-                    if not is_pareto_dominated(new_permillion_fee, new_base_fee, min_cost_to_node[o]):
-                        min_cost_to_node[o].add((new_permillion_fee, new_base_fee))
-
-    for (src, dest) in lowfee_edges:
-      lowfee_nodes.add(src)
-      lowfee_nodes.add(dest)
-
-    return (lowfee_edges, lowfee_nodes, min_cost_to_node)
+        root_peers.add(proposed_new_peer)
+    root_peers.discard(removed_peer)
+    frontiers = LowfeeFrontiers(channel_graph, root_node, base_fee_threshold, permillion_fee_threshold, root_peers = root_peers)
+    return (frontiers.edges, frontiers.nodes, frontiers.frontiers)
 
 def get_lowfee_reachable_unweighted_maxflows(lowfee_edges, lowfee_nodes):
-    lowfee_maxflows = dict()
-    for cur_node in lowfee_nodes:
-        #calculate the maxflow from root_node -> cur_node with all channels having unit weight
-        lowfee_maxflows[cur_node] = get_unweighted_maxflow(root_node, cur_node, lowfee_edges)
-    return lowfee_maxflows
-
-def get_lowfee_reachable_ppm_geomean(lowfee_nodes, min_cost_to_node):
+    #calculate the maxflow from root_node -> each node with all channels having unit weight,
+    #sharing one flow network across all sinks
+    return UnitConnectivity(lowfee_edges, root_node).maxflows(lowfee_nodes)
+
+#Returns the capacity of every edge of edges, a set of (src, dest) pairs, taking those in known_capacities from
+#there. A channel of root_node that isn't in the channel graph is a new one and gets new_channel_capacity.
+def edge_capacities(edges, known_capacities = None):
+    if known_capacities is None:
+        known_capacities = dict()
+    capacities = {e: known_capacities[e] for e in edges if e in known_capacities}
+    capacities.update(channel_graph.capacities([e for e in edges if e not in capacities]))
+    for e in edges:
+        if e not in capacities:
+            capacities[e] = new_channel_capacity
+    return capacities
+
+#Returns (capacity_improvements, capacity_geomean): how many nodes of the baseline have a higher capacity-weighted
+#maxflow in now_capacity, and the geometric mean of the baseline's capacity maxflows with those of now_capacity
+#taking their place
+def capacity_metrics(now_capacity):
+    improvements = len([r for r in now_capacity if r in existing_capacity_flows and now_capacity[r] > existing_capacity_flows[r]])
+    return (improvements, geomean([now_capacity.get(r, flow) for (r, flow) in existing_capacity_flows.items()]))
+
+#Returns (cheapest_route, warnings): the ppm of the cheapest low-fee route to each of lowfee_nodes
+@profiled("cheapest ppm")
+def get_cheapest_ppms(lowfee_nodes, min_cost_to_node):
     cheapest_route = dict()
     warnings = list()
 
@@ -223,317 +342,1063 @@ def get_lowfee_reachable_ppm_geomean(lowfee_nodes, min_cost_to_node):
         except:
             msg = "Could not find costs for node %s" % (node_to_id[cur_node])
             warnings.append(msg)
+    return (cheapest_route, warnings)
+
+def get_lowfee_reachable_ppm_geomean(lowfee_nodes, min_cost_to_node):
+    (cheapest_route, warnings) = get_cheapest_ppms(lowfee_nodes, min_cost_to_node)
 
     #ppm_sum = reduce(lambda x,y: x+y, [ppm for n, ppm in cheapest_route.items()])
-    ppm_prod = reduce(lambda x,y: x*y, [ppm if ppm != 0 else 1 for n, ppm in cheapest_route.items()])
     #ppm_mean = float(ppm_sum) / float(len(cheapest_route))
-    ppm_geomean = power(ppm_prod, mpf(1.0) / mpf(len(cheapest_route)))
+    ppm_geomean = fee_geomean(list(cheapest_route.values()))
 
     return (ppm_geomean, warnings)
 
+#Returns the list of shortest path lengths from root_node to each node of edges, ignoring channel directions, and
+#None for the other nodes. With targets, stops as soon as the lengths of all of them are known.
+@profiled("asp")
+def shortest_path_lengths(edges, targets = None):
+    return AllPairsDistances(edges, channel_graph.num_nodes).distances_from(root_node, targets)
+
 #Calculate the average shortest path length from root_node to each node in lowfee_nodes
 def calculate_asp(edges, lowfee_nodes):
-    min_distance = dict()
-    lowfee_adjacent = dict()
-    processed = set()
-
-    for (src, dest) in edges:
-        if src not in lowfee_adjacent:
-            lowfee_adjacent[src] = set()
-        if dest not in lowfee_adjacent:
-            lowfee_adjacent[dest] = set()
-        lowfee_adjacent[src].add(dest)
-        lowfee_adjacent[dest].add(src)
-        min_distance[src] = sys.maxsize
-        min_distance[dest] = sys.maxsize
-
-    #Calculate shortest path lengths:
-    bfs_queue = [(root_node, 0)]
-    processed.add(root_node)
-    while len(bfs_queue) > 0:
-        (cur_node, distance) = bfs_queue.pop(0)
-        for a in lowfee_adjacent[cur_node]:
-            if (distance + 1) < min_distance[a]:
-                min_distance[a] = distance + 1
-            if a not in processed:
-                bfs_queue.append((a, distance + 1))
-                processed.add(a)
+    min_distance = shortest_path_lengths(edges)
 
     #Calculate average shortest path lengths:
     #path_length_sum = reduce(lambda x,y: x+y, map(lambda n: min_distance[n], filter(lambda n: True if n in min_distance else False, lowfee_nodes)))
     #return float(path_length_sum)/len(lowfee_nodes)
-    filter_func = lambda n: True if n in min_distance else False
-    path_length_prod = reduce(lambda x,y: x*y, map(lambda n: mpf(min_distance[n]), filter(filter_func, lowfee_nodes)))
-    path_length_count = reduce(lambda x,y: x+y, map(lambda n: 1, filter(filter_func, lowfee_nodes)))
-    return power(path_length_prod, mpf(1.0) / mpf(path_length_count))
-
-
-#####################################################
-#MAIN BODY
-#####################################################
-
-signal.signal(signal.SIGINT, sigint_handler)
-nodes.add(root_node)
-
-if len(sys.argv) < 4:
-    print_usage_and_die()
-else:
-    root_node_id = sys.argv[1]
-    node_to_id[root_node] = root_node_id
-    id_to_node[root_node_id] = root_node
-    base_fee_threshold = int(sys.argv[2])
-    permillion_fee_threshold = int(sys.argv[3])
-    if len(sys.argv) >= 5:
-        min_channels = int(sys.argv[4])
-    if len(sys.argv) >= 6:
-        min_capacity = int(sys.argv[5])
-
-json_data = json.load(sys.stdin)
-ln_software_type = detect_ln_software_type(json_data)
-if ln_software_type == LNSoftwareType.UKN:
-    sys.stderr.write("Valid JSON detected on stdin but it doesn't look like output from C-Lightning or LND. Please see usage below.\n\n")
-    print_usage_and_die()
-json_data_root = json_data["channels"] if ln_software_type == LNSoftwareType.CLI else json_data["edges"]
-
-i = 1
-num_inactive_channels = 0
-for chan in json_data_root:
-    if ln_software_type == LNSoftwareType.LND and (chan["node1_policy"] == None or chan["node2_policy"] == None):
-        continue
-
-    src_id = chan["source"] if ln_software_type == LNSoftwareType.CLI else chan["node1_pub"]
-    dest_id = chan["destination"] if ln_software_type == LNSoftwareType.CLI else chan["node2_pub"]
-
-    if src_id in banned_nodes or dest_id in banned_nodes:
-        continue
-
-    if src_id not in id_to_node:
-        node_to_id[i] = src_id
-        id_to_node[src_id] = i
-        nodes.add(i)
-        i += 1
-    src = id_to_node[src_id]
-
-    if dest_id not in id_to_node:
-        node_to_id[i] = dest_id
-        id_to_node[dest_id] = i
-        nodes.add(i)
-        i += 1
-    dest = id_to_node[dest_id]
-
-    if (ln_software_type == LNSoftwareType.CLI and not chan["active"]) or (ln_software_type == LNSoftwareType.LND and (chan["node1_policy"]["disabled"] or chan["node2_policy"]["disabled"])):
-        num_inactive_channels += 1
-        continue
-
-    if src not in outgoing:
-        outgoing[src] = set()
-    outgoing[src].add(dest)
-    if dest not in incoming:
-        incoming[dest] = set()
-    incoming[dest].add(src)
-
-    capacity = 0
-    if ln_software_type == LNSoftwareType.CLI:
-        base_fee = chan["base_fee_millisatoshi"]
-        permillion_fee = chan["fee_per_millionth"]
-        capacity = chan["satoshis"]
-    else:
-        base_fee = int(chan["node2_policy"]["fee_base_msat"])
-        permillion_fee = int(chan["node2_policy"]["fee_rate_milli_msat"])
-        capacity = int(chan["capacity"])
-
-    if (src, dest) not in chan_fees:
-        chan_capacity[(src, dest)] = capacity
-        chan_fees[(src, dest)] = (permillion_fee, base_fee)
-        chan_fee_anchors[(src, dest)] = (permillion_fee, base_fee, capacity)
-    else:
-        (existing_permillion, existing_base) = chan_fees[(src, dest)]
-        (anchor_permillion, anchor_base, anchor_capacity) = chan_fee_anchors[(src, dest)]
-        if abs(existing_permillion - permillion_fee) <= 20 and abs(existing_base - base_fee) <= 200:
-            #the channels are roughly the same fee rate; combine capacity
-            chan_capacity[(src, dest)] += capacity
-            if permillion_fee < existing_permillion:
-                #always record the lowest PPM feerate for the parallel channels
-                chan_fees[(src, dest)] = (permillion_fee, base_fee)
-            if abs(anchor_permillion - permillion_fee) > 20 or abs(anchor_base - base_fee) > 200:
-                #we've drifted too far from the anchor fees
-                #reset the anchor and remove capacity from parallel channels with too-high fees
-                chan_capacity -= anchor_capacity
-                (t1, t2) = chan_fees[(src, dest)]
-                chan_fee_anchors[(src, dest)] = (t1, t2, capacity if permillion_fee < existing_permillion else chan_capacity - capacity)
-        elif permillion_fee <= existing_permillion and existing_base - base_fee > -200:
-            #this is a new, lower-rate channel, allowing for some base fee leeway
-            #discard old capacity; only consider capacity in lowest-rate channels between nodes
-            chan_fees[(src, dest)] = (permillion_fee, base_fee)
-            chan_fee_anchors[(src, dest)] = (permillion_fee, base_fee, capacity)
-            chan_capacity[(src, dest)] = capacity
-
-    if ln_software_type == LNSoftwareType.CLI:
-        continue
-
-    # LND specific: REVERSE DIRECTION node2=>node1, fees of node1_policy count
-    if src not in incoming:
-        incoming[src] = set()
-    incoming[src].add(dest)
-    if dest not in outgoing:
-        outgoing[dest] = set()
-    outgoing[dest].add(src)
-
-    base_fee = int(chan["node1_policy"]["fee_base_msat"])
-    permillion_fee = int(chan["node1_policy"]["fee_rate_milli_msat"])
-    capacity = int(chan["capacity"])
-
-    if (dest, src) not in chan_fees:
-        chan_capacity[(dest, src)] = capacity
-        chan_fees[(dest, src)] = (permillion_fee, base_fee)
-        chan_fee_anchors[(dest, src)] = (permillion_fee, base_fee, capacity)
-    else:
-        (existing_permillion, existing_base) = chan_fees[(dest, src)]
-        (anchor_permillion, anchor_base, anchor_capacity) = chan_fee_anchors[(dest, src)]
-        if abs(existing_permillion - permillion_fee) <= 20 and abs(existing_base - base_fee) <= 200:
-            #the channels are roughly the same fee rate; combine capacity
-            chan_capacity[(dest, src)] += capacity
-            if permillion_fee < existing_permillion:
-                #always record the lowest PPM feerate for the parallel channels
-                chan_fees[(dest, src)] = (permillion_fee, base_fee)
-            if abs(anchor_permillion - permillion_fee) > 20 or abs(anchor_base - base_fee) > 200:
-                #we've drifted too far from the anchor fees
-                #reset the anchor and remove capacity from parallel channels with too-high fees
-                chan_capacity -= anchor_capacity
-                (t1, t2) = chan_fees[(dest, src)]
-                chan_fee_anchors[(dest, src)] = (t1, t2, capacity if permillion_fee < existing_permillion else chan_capacity - capacity)
-        elif permillion_fee <= existing_permillion and existing_base - base_fee > -200:
-            #this is a new, lower-rate channel, allowing for some base fee leeway
-            #discard old capacity; only consider capacity in lowest-rate channels between nodes
-            chan_fees[(dest, src)] = (permillion_fee, base_fee)
-            chan_fee_anchors[(dest, src)] = (permillion_fee, base_fee, capacity)
-            chan_capacity[(dest, src)] = capacity
-
-if ln_software_type == LNSoftwareType.CLI and "nodes" in json_data:
-    parse_node_aliases(json_data)
-
-nodes.remove(root_node)
-(lowfee_edges, lowfee_nodes, min_cost_to_node) = get_lowfee_reachable_subgraph()
-existing_reachable_nodes = get_lowfee_reachable_unweighted_maxflows(lowfee_edges, lowfee_nodes)
-maxflow_prod = reduce(lambda x,y: x*y, [mpf(n[1]) for n in existing_reachable_nodes.items()])
-maxflow_geomean = power(maxflow_prod, mpf(1.0) / mpf(len(existing_reachable_nodes)))
-asp = calculate_asp(lowfee_edges, lowfee_nodes)
-(ppm_geomean, warnings) = get_lowfee_reachable_ppm_geomean(lowfee_nodes, min_cost_to_node)
-
-sys.stdout.write("{\n    \"root_node_metrics\": ")
-obj = {
-    "root_node_id": root_node_id,
-    "existing_reachable": len(existing_reachable_nodes),
-    "existing_maxflow_geomean": nstr(maxflow_geomean, 6),
-    "existing_shortest_path_geomean": nstr(asp, 6),
-    "existing_cheapest_ppm_geomean": nstr(ppm_geomean, 6)
-}
-if len(warnings) > 0:
-    obj["warnings"] = reduce(lambda x,y: x + "; " + y, warnings)
-obj_str = json.dumps(obj, indent = 4)
-obj_str_arr = obj_str.splitlines()
-for i in range(len(obj_str_arr)):
-    if i != 0:
-        sys.stdout.write("    ")
-    sys.stdout.write("%s" % obj_str_arr[i])
-    if i == (len(obj_str_arr) - 1):
-        sys.stdout.write(",")
-    sys.stdout.write("\n")
-sys.stdout.flush()
+    return geomean([min_distance[n] for n in lowfee_nodes if min_distance[n] is not None])
 
-#Iterate over all other nodes, sorted by decreasing number of incoming channels under the theory that more connected nodes
-#are more likely to have higher peer benefit, thus giving good answers more quickly
-sys.stdout.write("    \"peer_metrics\": [\n")
-i = 0
-nodes_num_outgoing = {n: len(outgoing[n]) if n in outgoing else 0 for n in nodes}
-for n in [k for k, v in sorted(nodes_num_outgoing.items(), key = lambda x: x[1], reverse = True)]:
-    if n in outgoing[root_node]:
-        continue
-    if not node_is_big_enough(n):
-        continue
-    if i != 0:
+#Writes obj as an element of a JSON array nested inside the top-level document
+def write_array_element(obj, is_first, indent):
+    if not is_first:
         sys.stdout.write(",\n")
+    obj_str = json.dumps(obj, indent = 4)
+    obj_str_arr = obj_str.splitlines()
+    for j in range(len(obj_str_arr)):
+        sys.stdout.write("%s%s" % (indent, obj_str_arr[j]))
+        if j != (len(obj_str_arr) - 1):
+            sys.stdout.write("\n")
+    sys.stdout.flush()
+
+#Calculates the metrics for the proposed new peer n against the existing (global) low-fee reachable subgraph.
+#Records each call of evaluate, a function of a candidate node and possibly more arguments, as a profiler item
+#labelled with the candidate's node id
+def profiled_candidate(evaluate):
+    @functools.wraps(evaluate)
+    def evaluate_profiled(n, *args, **kwargs):
+        with profiler.item("candidate", node_to_id[n]):
+            return evaluate(n, *args, **kwargs)
+    return evaluate_profiled
+
+#Only reads global state, so it can run in forked worker processes that share the parsed channel graph.
+@profiled_candidate
+def evaluate_candidate(n):
     (new_lowfee_edges, new_lowfee_nodes, min_cost_to_node) = get_lowfee_reachable_subgraph(n)
     now_reachable = get_lowfee_reachable_unweighted_maxflows(new_lowfee_edges, new_lowfee_nodes)
     asp = calculate_asp(new_lowfee_edges, lowfee_nodes)
     (ppm_geomean, warnings) = get_lowfee_reachable_ppm_geomean(lowfee_nodes, min_cost_to_node)
-    maxflow_prod = mpf('1.0')
+    maxflow_log_sum = log_sum([now_reachable[r] for r in existing_reachable_nodes])
     num_new_nodes = 0
     routability_improvements = 0
     bonus = 0
     for r in now_reachable:
-        if r in existing_reachable_nodes:
-          maxflow_prod *= now_reachable[r]
         if r not in existing_reachable_nodes:
             num_new_nodes += 1
         elif now_reachable[r] > existing_reachable_nodes[r]:
             routability_improvements += 1
             if existing_reachable_nodes[r] < 3:
                 bonus += 3 - existing_reachable_nodes[r]
-    maxflow_geomean = power(maxflow_prod, mpf('1.0') / mpf(len(existing_reachable_nodes)))
-    new_peer_benefit[n] = 3*num_new_nodes + routability_improvements + bonus
+    maxflow_geomean = geomean_of_log_sum(maxflow_log_sum, len(existing_reachable_nodes))
     alias = node_to_alias[n] if n in node_to_alias else ""
     obj = {
       "peer_alias": alias,
-      "peer_score": new_peer_benefit[n],
+      "peer_score": 3*num_new_nodes + routability_improvements + bonus,
       "peer_id": node_to_id[n],
       "root_node_id": root_node_id,
       "newly_reachable": num_new_nodes,
       "routability_improvements": routability_improvements,
       "bonus": bonus,
-      "new_maxflow_geomean": nstr(maxflow_geomean, 6),
-      "new_shortest_path_geomean": nstr(asp, 6),
-      "new_cheapest_ppm_geomean": nstr(ppm_geomean, 6)
+      "new_maxflow_geomean": format_metric(maxflow_geomean),
+      "new_shortest_path_geomean": format_metric(asp),
+      "new_cheapest_ppm_geomean": format_metric(ppm_geomean)
     }
+    if new_channel_capacity is not None:
+        now_capacity = CapacityConnectivity(edge_capacities(new_lowfee_edges, lowfee_capacities), root_node).maxflows(new_lowfee_nodes)
+        (obj["capacity_improvements"], capacity_geomean) = capacity_metrics(now_capacity)
+        obj["new_routing_capacity_geomean"] = format_metric(capacity_geomean)
     if len(warnings) > 0:
         obj["warnings"] = reduce(lambda x,y: x + "; " + y, warnings)
-    obj_str = json.dumps(obj, indent = 4)
-    obj_str_arr = obj_str.splitlines()
-    for j in range(len(obj_str_arr)):
-        sys.stdout.write("        %s" % obj_str_arr[j])
-        if j != (len(obj_str_arr) - 1):
-            sys.stdout.write("\n")
-    sys.stdout.flush()
-    i += 1
-sys.stdout.write("\n    ],\n")
-
-#Iterate over all channel peers and calculate statistics again, pretending we didn't have this channel
-sys.stdout.write("    \"removed_peer_metrics\": [\n")
-our_peers = outgoing[root_node]
-i = 0
-for peer in our_peers:
-    if i != 0:
-        sys.stdout.write(",\n")
-    outgoing[root_node].remove(peer)
-    (lowfee_edges, lowfee_nodes, min_cost_to_node) = get_lowfee_reachable_subgraph()
-    existing_reachable_nodes = get_lowfee_reachable_unweighted_maxflows(lowfee_edges, lowfee_nodes)
-    asp = calculate_asp(lowfee_edges, lowfee_nodes)
-    (ppm_geomean, warnings) = get_lowfee_reachable_ppm_geomean(lowfee_nodes, min_cost_to_node)
-    outgoing[root_node].add(peer)
-
-    maxflow_prod = reduce(lambda x,y: x*y, [mpf(n[1]) for n in existing_reachable_nodes.items()])
-    maxflow_geomean = power(maxflow_prod, mpf(1.0) / mpf(len(existing_reachable_nodes)))
+    return (n, obj)
+
+#Same metrics as evaluate_candidate(), but derived from the baseline in lowfee_frontiers: only the labels
+#downstream of n are propagated, and only nodes reachable from n in the new subgraph can gain maxflow.
+def evaluate_candidate_incremental(n):
+    return (n, candidate_metrics_incremental(n)[0])
+
+#Returns (obj, footprint): the metrics of evaluate_candidate_incremental() and the nodes whose channels were
+#read to compute them. Beyond the baseline, the result only depends on the channels of those nodes.
+#flow_cache optionally maps candidates to (added_edges, maxflows): the low-fee edges a candidate added to an
+#earlier baseline and the solved maxflows of nodes in its new subgraph that are still the same. They are reused
+#if n adds the same edges again, and the entry of n is replaced with the maxflows solved now.
+@profiled_candidate
+def candidate_metrics_incremental(n, flow_cache = None):
+    (changed_frontiers, added_edges) = lowfee_frontiers.with_new_peer(n)
+    new_lowfee_edges = lowfee_edges | added_edges
+    added_outgoing = dict()
+    for (src, dest) in added_edges:
+        if src not in added_outgoing:
+            added_outgoing[src] = set()
+        added_outgoing[src].add(dest)
+    affected = lowfee_frontiers.reachable_from(n, added_outgoing)
+    affected.add(root_node) #its own maxflow is bounded by its out-degree, which just grew
+    connectivity = UnitConnectivity(new_lowfee_edges, root_node)
+    if bounded_maxflow:
+        crossed_cuts = baseline_cuts.crossed_by(added_edges)
+        augmented_cuts = baseline_cuts.augmented_by(added_edges)
+    cached = flow_cache.get(n) if flow_cache is not None else None
+    known_flows = cached[1] if cached is not None and cached[0] == added_edges else dict()
+    solved_flows = dict()
+    now_reachable = dict()
+    for r in affected:
+        if target_sample is not None and r in existing_reachable_nodes and r not in target_sample.nodes:
+            #only the sampled targets are solved; the estimates account for the rest
+            continue
+        if r in known_flows:
+            now_reachable[r] = solved_flows[r] = known_flows[r]
+        elif r not in existing_reachable_nodes:
+            #newly reachable nodes only count, whatever their maxflow
+            now_reachable[r] = None if bounded_maxflow or target_sample is not None else connectivity.maxflow_to(r)
+        elif existing_reachable_nodes[r] >= connectivity.upper_bound(r):
+            #maxflows only grow when edges are added, and this one is already at its bound
+            now_reachable[r] = existing_reachable_nodes[r]
+        elif bounded_maxflow and baseline_cuts.has_cut(r) and r not in crossed_cuts:
+            #no new edge crosses its baseline minimum cut, which therefore still bounds the maxflow
+            now_reachable[r] = existing_reachable_nodes[r]
+        elif bounded_maxflow and not exact_geomean:
+            #one path more than before is all peer_score needs to know
+            if r in augmented_cuts:
+                now_reachable[r] = existing_reachable_nodes[r] + 1
+            else:
+                now_reachable[r] = solved_flows[r] = connectivity.maxflow_to(r, existing_reachable_nodes[r] + 1)
+        else:
+            now_reachable[r] = solved_flows[r] = connectivity.maxflow_to(r)
+    if flow_cache is not None:
+        flow_cache[n] = (added_edges, solved_flows)
+    if target_sample is not None:
+        (obj, warnings) = estimated_candidate_obj(n, now_reachable, new_lowfee_edges, ChainMap(changed_frontiers, min_cost_to_node))
+    else:
+        asp = calculate_asp(new_lowfee_edges, lowfee_nodes)
+        (ppm_geomean, warnings) = get_lowfee_reachable_ppm_geomean(lowfee_nodes, ChainMap(changed_frontiers, min_cost_to_node))
+        num_new_nodes = 0
+        routability_improvements = 0
+        bonus = 0
+        for r in now_reachable:
+            if r not in existing_reachable_nodes:
+                num_new_nodes += 1
+            elif now_reachable[r] > existing_reachable_nodes[r]:
+                routability_improvements += 1
+                if existing_reachable_nodes[r] < 3:
+                    bonus += 3 - existing_reachable_nodes[r]
+        #the logs of the same values as in evaluate_candidate(), rather than the baseline's log sum plus the log
+        #ratios of the improved nodes, so that both give the same geomean to the last bit
+        maxflow_log_sum = log_sum([now_reachable.get(r, flow) for (r, flow) in existing_reachable_nodes.items()])
+        maxflow_geomean = geomean_of_log_sum(maxflow_log_sum, len(existing_reachable_nodes))
+        alias = node_to_alias[n] if n in node_to_alias else ""
+        obj = {
+          "peer_alias": alias,
+          "peer_score": 3*num_new_nodes + routability_improvements + bonus,
+          "peer_id": node_to_id[n],
+          "root_node_id": root_node_id,
+          "newly_reachable": num_new_nodes,
+          "routability_improvements": routability_improvements,
+          "bonus": bonus,
+          "new_maxflow_geomean": format_metric(maxflow_geomean),
+          "new_shortest_path_geomean": format_metric(asp),
+          "new_cheapest_ppm_geomean": format_metric(ppm_geomean)
+        }
+    if new_channel_capacity is not None:
+        #the new subgraph only adds edges to the baseline, so as with the unit maxflows only affected nodes can
+        #gain capacity, only if they are below their bound, and only if an added edge crosses their baseline
+        #minimum cut, whose capacity otherwise still bounds the maxflow
+        capacity_connectivity = CapacityConnectivity(edge_capacities(new_lowfee_edges, lowfee_capacities), root_node)
+        crossed_capacity_cuts = capacity_cuts.crossed_by(added_edges)
+        now_capacity = dict()
+        for r in affected:
+            if r not in existing_capacity_flows or existing_capacity_flows[r] >= capacity_connectivity.upper_bound(r):
+                continue
+            if capacity_cuts.has_cut(r) and r not in crossed_capacity_cuts:
+                continue
+            now_capacity[r] = capacity_connectivity.maxflow_to(r)
+        (obj["capacity_improvements"], capacity_geomean) = capacity_metrics(now_capacity)
+        obj["new_routing_capacity_geomean"] = format_metric(capacity_geomean)
+    if len(warnings) > 0:
+        obj["warnings"] = reduce(lambda x,y: x + "; " + y, warnings)
+    return (obj, set(changed_frontiers) | {n})
+
+#Returns the estimate of a total over all baseline nodes and its 95% confidence interval, rounded for the output
+def rounded_estimate(total, error):
+    (low, high) = confidence_interval(total, error)
+    return (round(total, 1), [round(max(0, low), 1), round(high, 1)])
+
+#Returns the formatted estimate of a geomean over all baseline nodes and its 95% confidence interval, given the
+#baseline's geomean and the logs of the ratio of new to baseline value of the sampled nodes (0 if unchanged)
+def estimated_geomean(baseline_geomean, log_ratios):
+    (mean, error) = target_sample.mean(log_ratios)
+    (low, high) = confidence_interval(mean, error)
+    return (format_metric(baseline_geomean * math.exp(mean)), [format_metric(baseline_geomean * math.exp(low)), format_metric(baseline_geomean * math.exp(high))])
+
+#Returns (obj, warnings): the metrics of candidate_metrics_incremental() estimated from target_sample, given the
+#maxflows now_reachable of the newly reachable and sampled nodes n affects. newly_reachable is still exact.
+#The geomeans are estimated as the baseline's times the geometric mean ratio of new to baseline value, which is 1
+#for most nodes and so has a much narrower confidence interval than the geomean of the sampled values would.
+def estimated_candidate_obj(n, now_reachable, new_lowfee_edges, new_min_cost_to_node):
+    num_new_nodes = len([r for r in now_reachable if r not in existing_reachable_nodes])
+    improved = dict()
+    score_points = dict()
+    bonus_points = dict()
+    maxflow_log_ratios = dict()
+    zero_raised = False
+    for r in now_reachable:
+        if r in existing_reachable_nodes and now_reachable[r] > existing_reachable_nodes[r]:
+            improved[r] = 1
+            bonus_points[r] = max(0, 3 - existing_reachable_nodes[r])
+            score_points[r] = 1 + bonus_points[r]
+            if existing_reachable_nodes[r] == 0:
+                #the baseline geomean is 0, so there is no ratio to it to estimate
+                zero_raised = True
+            else:
+                maxflow_log_ratios[r] = math.log(now_reachable[r] / existing_reachable_nodes[r])
+    distances = shortest_path_lengths(new_lowfee_edges, target_sample.nodes)
+    asp_log_ratios = {r: math.log(distances[r] / existing_distances[r]) for r in target_sample.nodes}
+    (cheapest_route, warnings) = get_cheapest_ppms(target_sample.nodes, new_min_cost_to_node)
+    #as in fee_geomean(), a fee rate of 0 counts as 1
+    ppm_log_ratios = {r: math.log(max(ppm, 1) / max(existing_cheapest_ppm[r], 1)) for (r, ppm) in cheapest_route.items() if r in existing_cheapest_ppm}
+    (score_total, score_error) = target_sample.total(score_points)
+    (peer_score, peer_score_ci) = rounded_estimate(3*num_new_nodes + score_total, score_error)
+    (routability_improvements, routability_improvements_ci) = rounded_estimate(*target_sample.total(improved))
+    (bonus, bonus_ci) = rounded_estimate(*target_sample.total(bonus_points))
+    (existing_maxflow_geomean, existing_asp, existing_ppm_geomean) = existing_geomeans
+    if not zero_raised:
+        (maxflow_geomean, maxflow_geomean_ci) = estimated_geomean(existing_maxflow_geomean, maxflow_log_ratios)
+    else:
+        #a maxflow of 0 went up (e.g. root_node's own), so estimate the geomean of the new maxflows from the sample
+        #instead; one that is still 0 keeps it 0, as in log_sum()
+        now_flows = {r: now_reachable.get(r, existing_reachable_nodes[r]) for r in target_sample.nodes}
+        if min(now_flows.values()) == 0:
+            (maxflow_geomean, maxflow_geomean_ci) = (format_metric(0), [format_metric(0), format_metric(0)])
+        else:
+            (maxflow_geomean, maxflow_geomean_ci) = estimated_geomean(1, {r: math.log(flow) for (r, flow) in now_flows.items()})
+    (asp, asp_ci) = estimated_geomean(existing_asp, asp_log_ratios)
+    (ppm_geomean, ppm_geomean_ci) = estimated_geomean(existing_ppm_geomean, ppm_log_ratios)
+    alias = node_to_alias[n] if n in node_to_alias else ""
+    obj = {
+      "peer_alias": alias,
+      "peer_score": peer_score,
+      "peer_score_ci": peer_score_ci,
+      "peer_id": node_to_id[n],
+      "root_node_id": root_node_id,
+      "newly_reachable": num_new_nodes,
+      "routability_improvements": routability_improvements,
+      "routability_improvements_ci": routability_improvements_ci,
+      "bonus": bonus,
+      "bonus_ci": bonus_ci,
+      "new_maxflow_geomean": maxflow_geomean,
+      "new_maxflow_geomean_ci": maxflow_geomean_ci,
+      "new_shortest_path_geomean": asp,
+      "new_shortest_path_geomean_ci": asp_ci,
+      "new_cheapest_ppm_geomean": ppm_geomean,
+      "new_cheapest_ppm_geomean_ci": ppm_geomean_ci
+    }
+    return (obj, warnings)
+
+#Returns (n, bound): an upper bound on the peer_score of candidate n that needs its new low-fee reachable
+#subgraph but no maxflows. The newly reachable nodes are counted exactly. Any other node can only count as a
+#routability improvement (plus its bonus) if its maxflow is below the number of edges entering it and below
+#the number leaving root_node in the new subgraph, since no more edge-disjoint paths than that can reach it.
+@profiled("upper bound")
+def peer_score_upper_bound(n):
+    if lowfee_frontiers is not None:
+        #only nodes reachable from n can gain maxflow, and the new subgraph is the baseline plus added_edges
+        (changed_frontiers, added_edges) = lowfee_frontiers.with_new_peer(n)
+        added_outgoing = dict()
+        in_degree = dict()
+        for (src, dest) in added_edges:
+            added_outgoing.setdefault(src, set()).add(dest)
+            in_degree[dest] = in_degree.get(dest, 0) + 1
+        new_nodes = lowfee_frontiers.reachable_from(n, added_outgoing)
+        new_nodes.add(root_node)
+        for r in new_nodes:
+            in_degree[r] = in_degree.get(r, 0) + len(lowfee_frontiers.lowfee_incoming.get(r, ()))
+        root_out_degree = len(lowfee_frontiers.lowfee_outgoing.get(root_node, ())) + len(added_outgoing.get(root_node, ()))
+    else:
+        (new_lowfee_edges, new_lowfee_nodes, new_min_cost_to_node) = get_lowfee_reachable_subgraph(n)
+        outgoing = dict()
+        in_degree = dict()
+        for (src, dest) in new_lowfee_edges:
+            outgoing.setdefault(src, set()).add(dest)
+            in_degree[dest] = in_degree.get(dest, 0) + 1
+        root_out_degree = len(outgoing.get(root_node, ()))
+        #as above, only nodes reachable from n can gain maxflow
+        new_nodes = {n}
+        stack = [n]
+        while len(stack) > 0:
+            for o in outgoing.get(stack.pop(), ()):
+                if o not in new_nodes:
+                    new_nodes.add(o)
+                    stack.append(o)
+        new_nodes.add(root_node)
+    bound = 0
+    for r in new_nodes:
+        if r not in existing_reachable_nodes:
+            bound += 3
+        elif existing_reachable_nodes[r] < min(root_out_degree, in_degree.get(r, 0)):
+            bound += 1 + max(0, 3 - existing_reachable_nodes[r])
+    return (n, bound)
+
+#Finds the k candidates with the highest peer_score, evaluating as few as possible: candidates are evaluated
+#in order of decreasing upper bound, batch_size at a time, until no remaining bound can beat the k-th best
+#score found so far. Ties are ranked in candidate order, so the result is exactly the first k results of a
+#full run sorted by decreasing peer_score.
+#bounds yields (candidate, upper bound) for every candidate and evaluate_batch returns the (candidate, obj)
+#results of a list of candidates. Returns (results best first, number of candidates pruned).
+def top_candidates(k, bounds, evaluate_batch, batch_size):
+    index = {n: i for (i, n) in enumerate(candidates)}
+    #sorted by decreasing (bound, -index), the best rank each candidate could still reach
+    order = sorted(bounds, key = lambda x: (-x[1], index[x[0]]))
+    best = list() #min-heap of (peer_score, -index, candidate, obj) holding the k best so far
+    pos = 0
+    while pos < len(order):
+        batch = list()
+        while pos < len(order) and len(batch) < batch_size:
+            (n, bound) = order[pos]
+            if len(best) == k and (bound, -index[n]) < best[0][:2]:
+                break
+            batch.append(n)
+            pos += 1
+        if len(batch) == 0:
+            break
+        for (n, obj) in evaluate_batch(batch):
+            item = (obj["peer_score"], -index[n], n, obj)
+            if len(best) < k:
+                heapq.heappush(best, item)
+            elif item[:2] > best[0][:2]:
+                heapq.heapreplace(best, item)
+    results = [(n, obj) for (score, neg_index, n, obj) in sorted(best, key = lambda x: x[:2], reverse = True)]
+    return (results, len(order) - pos)
+
+def make_removed_peer_obj(peer, reachable_nodes, asp, ppm_geomean, warnings, capacity_flows = None):
+    maxflow_geomean = geomean(list(reachable_nodes.values()))
     alias = node_to_alias[peer] if peer in node_to_alias else ""
     obj = {
         "removed_peer_alias": alias,
-        "removed_peer_id": node_to_id[n],
+        "removed_peer_id": node_to_id[peer],
+        "root_node_id": root_node_id,
+        "removed_reachable": len(reachable_nodes),
+        "removed_maxflow_geomean": format_metric(maxflow_geomean),
+        "removed_shortest_path_geomean": format_metric(asp),
+        "removed_cheapest_ppm_geomean": format_metric(ppm_geomean)
+    }
+    if capacity_flows is not None:
+        obj["removed_routing_capacity_geomean"] = format_metric(geomean(list(capacity_flows.values())))
+    if len(warnings) > 0:
+        obj["warnings"] = reduce(lambda x,y: x + "; " + y, warnings)
+    return obj
+
+#Calculates the metrics of the root node as if it had no channel to peer
+@profiled("removed peer")
+def evaluate_removed_peer(peer):
+    (removed_lowfee_edges, removed_lowfee_nodes, removed_min_cost_to_node) = get_lowfee_reachable_subgraph(removed_peer = peer)
+    reachable_nodes = get_lowfee_reachable_unweighted_maxflows(removed_lowfee_edges, removed_lowfee_nodes)
+    asp = calculate_asp(removed_lowfee_edges, removed_lowfee_nodes)
+    (ppm_geomean, warnings) = get_lowfee_reachable_ppm_geomean(removed_lowfee_nodes, removed_min_cost_to_node)
+    capacity_flows = None
+    if new_channel_capacity is not None:
+        capacity_flows = CapacityConnectivity(edge_capacities(removed_lowfee_edges, lowfee_capacities), root_node).maxflows(removed_lowfee_nodes)
+    return make_removed_peer_obj(peer, reachable_nodes, asp, ppm_geomean, warnings, capacity_flows)
+
+#Same metrics as evaluate_removed_peer(), recomputing frontiers and maxflows only for the nodes that
+#were reachable through peer
+@profiled("removed peer")
+def evaluate_removed_peer_incremental(peer):
+    (changed_frontiers, removed_lowfee_edges) = lowfee_frontiers.without_peer(peer)
+    removed_lowfee_nodes = set()
+    for (src, dest) in removed_lowfee_edges:
+        removed_lowfee_nodes.add(src)
+        removed_lowfee_nodes.add(dest)
+    affected = {r for r in removed_lowfee_nodes if r in changed_frontiers or r == root_node}
+    #The subgraph without peer is the baseline without the channel to peer and whatever low-fee edges only
+    #peer's low-fee routes led to. The baseline's residual graphs tell the maxflows without just that channel,
+    #which are exact when no other edge went and upper bounds otherwise. Fees are never negative, so the
+    #subgraph without peer under tighter fee thresholds is part of this one: a maxflow it reached under
+    #tighter thresholds analyzed earlier in a sweep is a lower bound, and one that meets its upper bound is
+    #not solved again.
+    single_channel = len(removed_lowfee_edges) == len(lowfee_edges) - 1
+    upper_bounds = None
+    if (root_node, peer) in lowfee_edges:
+        upper_bounds = get_baseline_connectivity().maxflows_without_source_edge(peer, affected)
+    if upper_bounds is None:
+        (upper_bounds, single_channel) = (existing_reachable_nodes, False)
+    floors = [flows[peer] for ((base_fee, permillion_fee), flows) in swept_removed_peer_flows.items() if base_fee <= base_fee_threshold and permillion_fee <= permillion_fee_threshold and peer in flows]
+    reachable_nodes = dict()
+    pending = list()
+    for r in affected:
+        if single_channel or max([f.get(r, 0) for f in floors], default = 0) >= upper_bounds[r]:
+            reachable_nodes[r] = upper_bounds[r]
+        else:
+            pending.append(r)
+    if len(pending) > 0:
+        connectivity = UnitConnectivity(removed_lowfee_edges, root_node)
+        for r in pending:
+            reachable_nodes[r] = connectivity.maxflow_to(r)
+    for r in removed_lowfee_nodes:
+        if r not in reachable_nodes:
+            reachable_nodes[r] = existing_reachable_nodes[r]
+    asp = calculate_asp(removed_lowfee_edges, removed_lowfee_nodes)
+    (ppm_geomean, warnings) = get_lowfee_reachable_ppm_geomean(removed_lowfee_nodes, ChainMap(changed_frontiers, min_cost_to_node))
+    capacity_flows = None
+    if new_channel_capacity is not None:
+        capacity_flows = CapacityConnectivity(edge_capacities(removed_lowfee_edges, lowfee_capacities), root_node).maxflows(affected)
+        for r in removed_lowfee_nodes:
+            if r not in capacity_flows:
+                capacity_flows[r] = existing_capacity_flows[r]
+    if threshold_sweep is not None:
+        swept_removed_peer_flows.setdefault((base_fee_threshold, permillion_fee_threshold), dict())[peer] = reachable_nodes
+    return make_removed_peer_obj(peer, reachable_nodes, asp, ppm_geomean, warnings, capacity_flows)
+
+#Returns the UnitConnectivity of the baseline, building it the first time it's needed
+def get_baseline_connectivity():
+    global baseline_connectivity
+    if baseline_connectivity is None:
+        baseline_connectivity = UnitConnectivity(lowfee_edges, root_node)
+    return baseline_connectivity
+
+#Makes the low-fee reachable subgraph of frontiers (or, if None, one propagated from scratch) the baseline the
+#peers are evaluated against and returns its root_node_metrics object. reachable_nodes optionally supplies
+#the maxflows of the subgraph; with bounded_maxflow they are recomputed anyway, along with their minimum cuts.
+@profiled("baseline")
+def set_baseline(frontiers, reachable_nodes = None):
+    global lowfee_frontiers, lowfee_edges, lowfee_nodes, min_cost_to_node, existing_reachable_nodes, baseline_cuts, baseline_connectivity, lowfee_capacities, existing_capacity_flows, capacity_cuts
+    global target_sample, existing_distances, existing_cheapest_ppm, existing_geomeans
+    lowfee_frontiers = frontiers
+    if frontiers is not None:
+        (lowfee_edges, lowfee_nodes, min_cost_to_node) = (lowfee_frontiers.edges, lowfee_frontiers.nodes, lowfee_frontiers.frontiers)
+    else:
+        (lowfee_edges, lowfee_nodes, min_cost_to_node) = get_lowfee_reachable_subgraph()
+    baseline_connectivity = None
+    if reachable_nodes is None or bounded_maxflow:
+        connectivity = baseline_connectivity = UnitConnectivity(lowfee_edges, root_node)
+        sys.stderr.write("low-fee reachable subgraph: %s\n" % connectivity.core_summary())
+        if bounded_maxflow:
+            (reachable_nodes, baseline_cuts) = connectivity.maxflows_and_cuts(lowfee_nodes)
+        else:
+            reachable_nodes = connectivity.maxflows(lowfee_nodes)
+    existing_reachable_nodes = reachable_nodes
+    maxflow_geomean = geomean(list(existing_reachable_nodes.values()))
+    asp = calculate_asp(lowfee_edges, lowfee_nodes)
+    (ppm_geomean, warnings) = get_lowfee_reachable_ppm_geomean(lowfee_nodes, min_cost_to_node)
+    obj = {
         "root_node_id": root_node_id,
-        "removed_reachable": len(existing_reachable_nodes),
-        "removed_maxflow_geomean": nstr(maxflow_geomean, 6),
-        "removed_shortest_path_geomean": nstr(asp, 6),
-        "removed_cheapest_ppm_geomean": nstr(ppm_geomean, 6)
+        "existing_reachable": len(existing_reachable_nodes),
+        "existing_maxflow_geomean": format_metric(maxflow_geomean),
+        "existing_shortest_path_geomean": format_metric(asp),
+        "existing_cheapest_ppm_geomean": format_metric(ppm_geomean)
     }
+    if sample_size is not None:
+        existing_distances = shortest_path_lengths(lowfee_edges)
+        existing_cheapest_ppm = get_cheapest_ppms(lowfee_nodes, min_cost_to_node)[0]
+        existing_geomeans = (maxflow_geomean, asp, ppm_geomean)
+        #one stratum per hop distance of 1, 2 or more and baseline maxflow of 1, 2 or more (the nodes a bonus can go to)
+        strata = dict()
+        for r in lowfee_nodes:
+            strata.setdefault((min(existing_distances[r], 3), min(existing_reachable_nodes[r], 3)), list()).append(r)
+        target_sample = StratifiedSample([strata[d] for d in sorted(strata)], sample_size, sample_seed)
+        obj["sampled_targets"] = len(target_sample.nodes)
+    if new_channel_capacity is not None:
+        lowfee_capacities = edge_capacities(lowfee_edges)
+        capacity_connectivity = CapacityConnectivity(lowfee_capacities, root_node)
+        if frontiers is not None:
+            (existing_capacity_flows, capacity_cuts) = capacity_connectivity.maxflows_and_cuts(lowfee_nodes)
+        else:
+            existing_capacity_flows = capacity_connectivity.maxflows(lowfee_nodes)
+        obj["existing_routing_capacity_geomean"] = format_metric(geomean(list(existing_capacity_flows.values())))
     if len(warnings) > 0:
         obj["warnings"] = reduce(lambda x,y: x + "; " + y, warnings)
+    return obj
+
+#Computes the metrics of root_node under the current fee thresholds and writes them as the root_node_metrics,
+#peer_metrics and removed_peer_metrics members of a JSON object whose members are indented by indent.
+#frontiers optionally supplies LowfeeFrontiers already computed for these thresholds.
+def write_analysis(indent, frontiers = None):
+    if frontiers is None and incremental:
+        frontiers = LowfeeFrontiers(channel_graph, root_node, base_fee_threshold, permillion_fee_threshold)
+    obj = set_baseline(frontiers)
+
+    sys.stdout.write("%s\"root_node_metrics\": " % indent)
     obj_str = json.dumps(obj, indent = 4)
     obj_str_arr = obj_str.splitlines()
-    for j in range(len(obj_str_arr)):
-        sys.stdout.write("        %s" % obj_str_arr[j])
-        if j != (len(obj_str_arr) - 1):
-            sys.stdout.write("\n")
+    for i in range(len(obj_str_arr)):
+        if i != 0:
+            sys.stdout.write(indent)
+        sys.stdout.write("%s" % obj_str_arr[i])
+        if i == (len(obj_str_arr) - 1):
+            sys.stdout.write(",")
+        sys.stdout.write("\n")
     sys.stdout.flush()
-    i += 1
-sys.stdout.write("\n    ]\n")
 
-sys.stdout.write("}\n")
+    candidate_evaluator = evaluate_candidate_incremental if lowfee_frontiers is not None else evaluate_candidate
+    if top_k is not None:
+        write_top_candidates(indent, candidate_evaluator)
+    else:
+        write_all_candidates(indent, candidate_evaluator)
+
+    #Iterate over all channel peers and calculate statistics again, pretending we didn't have this channel
+    sys.stdout.write("%s\"removed_peer_metrics\": [\n" % indent)
+    removed_peer_evaluator = evaluate_removed_peer_incremental if lowfee_frontiers is not None else evaluate_removed_peer
+    i = 0
+    for peer in channel_graph.successors(root_node):
+        write_array_element(removed_peer_evaluator(peer), i == 0, indent + "    ")
+        i += 1
+    sys.stdout.write("\n%s]\n" % indent)
+
+#Writes the peer_metrics member with the results of all candidates, in candidate order
+#With a checkpoint, candidates whose results it already holds are not evaluated again and the results of the
+#others are added to it, saving it every checkpoint_interval seconds and once all candidates are done.
+def write_all_candidates(indent, candidate_evaluator):
+    sys.stdout.write("%s\"peer_metrics\": [\n" % indent)
+    if checkpoint is not None:
+        finished = checkpoint.results("%d:%d" % (base_fee_threshold, permillion_fee_threshold))
+        resumed = {n for n in candidates if node_to_id[n] in finished}
+        if len(resumed) > 0:
+            sys.stderr.write("resuming with %d of %d candidates finished\n" % (len(resumed), len(candidates)))
+        last_save = time.monotonic()
+    else:
+        resumed = set()
+    remaining = [n for n in candidates if n not in resumed]
+    if num_jobs > 1:
+        #Forked workers inherit the parsed channel graph and the baseline metrics copy-on-write, so only
+        #candidate node numbers and result objects cross process boundaries. imap() hands back results in
+        #candidate order as soon as each one (and every one before it) is done, keeping the output identical
+        #to a serial run.
+        pool = multiprocessing.get_context("fork").Pool(num_jobs, init_worker)
+        candidate_results = pool.imap(candidate_evaluator, remaining, chunksize = 1)
+    else:
+        pool = None
+        candidate_results = map(candidate_evaluator, remaining)
+
+    i = 0
+    for n in candidates:
+        if n in resumed:
+            obj = finished[node_to_id[n]]
+        else:
+            (candidate, obj) = next(candidate_results)
+            if checkpoint is not None:
+                finished[node_to_id[n]] = obj
+                if time.monotonic() - last_save >= checkpoint_interval:
+                    save_checkpoint()
+                    last_save = time.monotonic()
+        new_peer_benefit[n] = obj["peer_score"]
+        write_array_element(obj, i == 0, indent + "    ")
+        i += 1
+    if pool is not None:
+        pool.close()
+        pool.join()
+    if checkpoint is not None and len(remaining) > 0:
+        save_checkpoint()
+    sys.stdout.write("\n%s],\n" % indent)
+
+#Saves the checkpoint with Ctrl-C held back until the file is complete; sigint_handler() then saves it once more
+def save_checkpoint():
+    signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGINT})
+    try:
+        checkpoint.save()
+    finally:
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGINT})
+
+#Writes the top_k_search member with the pruning statistics and the peer_metrics member with the results of
+#the top_k best candidates, best first
+def write_top_candidates(indent, candidate_evaluator):
+    if num_jobs > 1:
+        pool = multiprocessing.get_context("fork").Pool(num_jobs, init_worker)
+        bounds = pool.imap(peer_score_upper_bound, candidates, chunksize = 16)
+        evaluate_batch = lambda batch: pool.map(candidate_evaluator, batch, chunksize = 1)
+    else:
+        pool = None
+        bounds = map(peer_score_upper_bound, candidates)
+        evaluate_batch = lambda batch: list(map(candidate_evaluator, batch))
+    (results, num_pruned) = top_candidates(top_k, bounds, evaluate_batch, num_jobs)
+    if pool is not None:
+        pool.close()
+        pool.join()
+    sys.stderr.write("top %d of %d candidates found, %d pruned without evaluating\n" % (len(results), len(candidates), num_pruned))
+
+    obj = {"k": top_k, "candidates": len(candidates), "evaluated": len(candidates) - num_pruned, "pruned": num_pruned}
+    sys.stdout.write("%s\"top_k_search\": %s,\n" % (indent, json.dumps(obj)))
+    sys.stdout.write("%s\"peer_metrics\": [\n" % indent)
+    for i in range(len(results)):
+        (candidate, obj) = results[i]
+        new_peer_benefit[candidate] = obj["peer_score"]
+        write_array_element(obj, i == 0, indent + "    ")
+    sys.stdout.write("\n%s],\n" % indent)
+
+#Writes the threshold_sweep document with one result block per fee threshold, in the order they were given.
+#Fee frontiers under a tighter threshold are exactly the labels of the loosest frontiers that fit within it, so
+#they are propagated once and filtered for every threshold. The thresholds are analyzed in increasing order,
+#which puts every threshold after those that are tighter in both fees, so that their maxflows without each root
+#peer can spare solving the same ones again (see evaluate_removed_peer_incremental()). Each block is written
+#once all are done.
+def write_threshold_sweep():
+    global base_fee_threshold, permillion_fee_threshold
+    loosest_frontiers = LowfeeFrontiers(channel_graph, root_node, max([b for (b, p) in threshold_sweep]), max([p for (b, p) in threshold_sweep]))
+    blocks = dict()
+    for (base_fee_threshold, permillion_fee_threshold) in sorted(set(threshold_sweep)):
+        with contextlib.redirect_stdout(io.StringIO()) as block:
+            block.write("        {\n")
+            block.write("            \"base_fee_threshold\": %d,\n" % base_fee_threshold)
+            block.write("            \"permillion_fee_threshold\": %d,\n" % permillion_fee_threshold)
+            write_analysis("            ", loosest_frontiers.restricted(base_fee_threshold, permillion_fee_threshold))
+            block.write("        }")
+        blocks[(base_fee_threshold, permillion_fee_threshold)] = block.getvalue()
+    sys.stdout.write("{\n    \"threshold_sweep\": [\n")
+    sys.stdout.write(",\n".join([blocks[thresholds] for thresholds in threshold_sweep]))
+    sys.stdout.write("\n    ]\n}\n")
+
+def init_worker():
+    #the parent process reports the interruption and tears down the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+#Candidates don't depend on the fee thresholds.
+#Iterate over all other nodes, sorted by decreasing number of incoming channels under the theory that more connected nodes
+#are more likely to have higher peer benefit, thus giving good answers more quickly
+def select_candidates():
+    candidates = list()
+    root_peers = set(channel_graph.successors(root_node))
+    nodes_num_outgoing = {n: channel_graph.out_degree(n) for n in nodes}
+    for n in [k for k, v in sorted(nodes_num_outgoing.items(), key = lambda x: x[1], reverse = True)]:
+        if n in root_peers:
+            continue
+        if not node_is_big_enough(n):
+            continue
+        candidates.append(n)
+    return candidates
+
+#Returns the set of (src, dest) pairs whose merged channel differs in fees between old_graph and new_graph, or
+#exists in only one of them. Nodes must have the same numbers in both graphs.
+def changed_channels_between(old_graph, new_graph):
+    changed = set()
+    for n in range(max(old_graph.num_nodes, new_graph.num_nodes)):
+        old_fees = dict()
+        if n < old_graph.num_nodes:
+            for e in old_graph.edges_from(n):
+                old_fees[old_graph.targets[e]] = (old_graph.fee_permillion[e], old_graph.fee_base[e])
+        new_fees = dict()
+        if n < new_graph.num_nodes:
+            for e in new_graph.edges_from(n):
+                new_fees[new_graph.targets[e]] = (new_graph.fee_permillion[e], new_graph.fee_base[e])
+        if old_fees != new_fees:
+            for o in old_fees.keys() | new_fees.keys():
+                if old_fees.get(o) != new_fees.get(o):
+                    changed.add((n, o))
+    return changed
+
+#Returns the nodes whose maxflow can differ between the low-fee subgraph of frontiers and one that differs from
+#it in toggled_edges. A sink's maxflow can only change if a toggled edge lies on a path to it, and the last
+#toggled edge on such a path leads to a node that reaches the sink over edges the two subgraphs share.
+def maxflow_affected_nodes(frontiers, toggled_edges):
+    affected = frontiers.reachable_from_nodes({dest for (src, dest) in toggled_edges})
+    if any([root_node in edge for edge in toggled_edges]):
+        affected.add(root_node) #its own maxflow is bounded by its degree
+    return affected
+
+#Returns (reachable_nodes, num_recomputed): the maxflows of the low-fee subgraph of frontiers, an update of the
+#baseline lowfee_frontiers, and how many of them had to be computed. Only the maxflows of
+#maxflow_affected_nodes() are computed; the others are taken from the baseline.
+def updated_maxflows(frontiers):
+    affected = maxflow_affected_nodes(frontiers, lowfee_edges ^ frontiers.edges) & frontiers.nodes
+    reachable_nodes = {r: existing_reachable_nodes[r] for r in frontiers.nodes if r not in affected}
+    reachable_nodes.update(UnitConnectivity(frontiers.edges, root_node).maxflows(affected))
+    return (reachable_nodes, len(affected))
+
+#Opens a channel from root_node to peer in the channel graph and makes the result the baseline
+def open_channel_to(peer):
+    global channel_graph
+    channel_graph = channel_graph.with_channels(root_node, [peer], new_channel_capacity if new_channel_capacity is not None else 0)
+    candidates.remove(peer)
+    if lowfee_frontiers is not None:
+        (frontiers, changed_nodes) = lowfee_frontiers.updated(channel_graph, {(root_node, peer)})
+        return set_baseline(frontiers, updated_maxflows(frontiers)[0])
+    else:
+        return set_baseline(None)
+
+#Chooses plan_size candidates to open channels to together by lazy greedy selection (CELF): each round adds
+#the candidate with the highest peer_score against the graph with the channels chosen in earlier rounds, i.e.
+#the highest marginal gain. A channel is assumed to gain less the more channels were opened before it, so a
+#score from an earlier round (or, before the first evaluation, the upper bound of peer_score_upper_bound())
+#is treated as a bound on the current one, and only a candidate whose stale score is at the top of the queue
+#is evaluated again. Writes the plan as a JSON document.
+def write_portfolio():
+    candidate_evaluator = evaluate_candidate_incremental if incremental else evaluate_candidate
+    obj = {"root_node_metrics": set_baseline(LowfeeFrontiers(channel_graph, root_node, base_fee_threshold, permillion_fee_threshold) if incremental else None)}
+    index = {n: i for (i, n) in enumerate(candidates)}
+    #entries are (-score, candidate index, candidate, round the score was computed in, -1 for bounds)
+    queue = [(-bound, index[n], n, -1) for (n, bound) in map(peer_score_upper_bound, candidates)]
+    heapq.heapify(queue)
+    num_candidates = len(candidates)
+    num_evaluations = 0
+    num_greedy_evaluations = 0 #what re-scoring every remaining candidate in every round would take
+    scored = dict() #the latest metrics of each evaluated candidate
+    steps = list()
+    for step in range(min(plan_size, num_candidates)):
+        num_greedy_evaluations += len(queue)
+        while True:
+            (neg_score, i, n, scored_in) = heapq.heappop(queue)
+            if scored_in == step:
+                break
+            (n, scored[n]) = candidate_evaluator(n)
+            num_evaluations += 1
+            heapq.heappush(queue, (-scored[n]["peer_score"], i, n, step))
+        peer_obj = scored[n]
+        sys.stderr.write("step %d: %s (%s), marginal gain %d, %d evaluations so far\n" % (step + 1, peer_obj["peer_alias"], peer_obj["peer_id"], -neg_score, num_evaluations))
+        steps.append({"step": step + 1, "peer_alias": peer_obj["peer_alias"], "peer_id": peer_obj["peer_id"], "marginal_gain": -neg_score, "peer_metrics": peer_obj})
+        root_metrics = open_channel_to(n)
+    obj["portfolio"] = steps
+    obj["portfolio_root_node_metrics"] = root_metrics
+    obj["portfolio_search"] = {
+        "k": plan_size,
+        "candidates": num_candidates,
+        "evaluations": num_evaluations,
+        "greedy_evaluations": num_greedy_evaluations,
+        "evaluations_saved": num_greedy_evaluations - num_evaluations
+    }
+    sys.stdout.write("%s\n" % json.dumps(obj, indent = 4))
+
+#Reads the current channel graph (e.g. a fresh listchannels dump) from input_files and applies what changed
+#since the last one: the low-fee frontiers and maxflows are only recomputed where a changed channel can reach,
+#and cached peer metrics are only dropped if they depend on what changed. Returns a summary of the update.
+def apply_graph_update(input_files):
+    global channel_graph, node_to_id, id_to_node, nodes, candidates, root_metrics
+    start = time.time()
+    #existing nodes keep their numbers, so cached results and the baseline stay comparable
+    parser = ChannelGraphParser(banned_nodes, [node_to_id[n] for n in range(len(node_to_id))])
+    for path in input_files:
+        with open(path, "rb") as f:
+            parser.add_stream(f)
+    if parser.software_type != ln_software_type:
+        raise ValueError("the update is %s output, the graph was read from %s output" % (parser.software_type.value, ln_software_type.value))
+    new_graph = parser.channel_graph()
+    changed_channels = changed_channels_between(channel_graph, new_graph)
+
+    (frontiers, changed_nodes) = lowfee_frontiers.updated(new_graph, changed_channels)
+    (reachable_nodes, num_recomputed) = updated_maxflows(frontiers)
+    baseline_changed = frontiers.edges != lowfee_edges or any([frontiers.frontiers.get(n) != min_cost_to_node.get(n) for n in changed_nodes])
+    if new_channel_capacity is not None:
+        #the routing capacity also changes with the capacity of a low-fee channel, which changed_channels ignores
+        baseline_changed = baseline_changed or channel_graph.capacities(lowfee_edges) != new_graph.capacities(lowfee_edges)
+
+    num_cached = len(candidate_cache) + len(removed_peer_cache)
+    if baseline_changed:
+        #every peer metric includes geomeans over the whole low-fee reachable subgraph
+        candidate_cache.clear()
+        removed_peer_cache.clear()
+    else:
+        touched = {n for channel in changed_channels for n in channel}
+        for cache in (candidate_cache, removed_peer_cache):
+            for n in [n for (n, (obj, footprint)) in cache.items() if not footprint.isdisjoint(touched)]:
+                del cache[n]
+
+    channel_graph = new_graph
+    node_to_id = parser.node_to_id
+    id_to_node = parser.id_to_node
+    node_to_alias.update(parser.node_to_alias())
+    nodes = set(range(1, len(node_to_id)))
+    candidates = select_candidates()
+    root_metrics = set_baseline(frontiers, reachable_nodes)
+    return {
+        "changed_channels": len(changed_channels),
+        "changed_frontiers": len(changed_nodes),
+        "recomputed_maxflows": num_recomputed,
+        "invalidated_results": num_cached - len(candidate_cache) - len(removed_peer_cache),
+        "seconds": round(time.time() - start, 3)
+    }
+
+#Returns the node number of the peer_id member of request
+def requested_node(request):
+    peer_id = request.get("peer_id")
+    if peer_id not in id_to_node:
+        raise ValueError("unknown node %s" % peer_id)
+    return id_to_node[peer_id]
+
+def cached_candidate_metrics(n):
+    if n not in candidate_cache:
+        candidate_cache[n] = candidate_metrics_incremental(n)
+    return candidate_cache[n][0]
+
+#Answers one query of the --serve protocol with the object to send back
+def answer_query(request):
+    query = request.get("query")
+    if query == "root":
+        return {"result": root_metrics}
+    elif query == "score":
+        n = requested_node(request)
+        if n == root_node or n in lowfee_frontiers.root_peers:
+            raise ValueError("%s is already a peer of the root node" % request["peer_id"])
+        cached = n in candidate_cache
+        return {"result": cached_candidate_metrics(n), "cached": cached}
+    elif query == "top":
+        k = int(request.get("k", 10))
+        if k < 1:
+            raise ValueError("k must be at least 1")
+        num_cached = len(candidate_cache)
+        #cached results are their own bound
+        bounds = [(n, candidate_cache[n][0]["peer_score"]) if n in candidate_cache else peer_score_upper_bound(n) for n in candidates]
+        (results, num_pruned) = top_candidates(k, bounds, lambda batch: [(n, cached_candidate_metrics(n)) for n in batch], 1)
+        return {"result": [obj for (n, obj) in results], "evaluated": len(candidate_cache) - num_cached, "pruned": num_pruned}
+    elif query == "remove":
+        peer = requested_node(request)
+        if peer not in lowfee_frontiers.root_peers:
+            raise ValueError("%s is not a peer of the root node" % request["peer_id"])
+        cached = peer in removed_peer_cache
+        if not cached:
+            #without_peer() reads the channels into and out of the region reachable through peer
+            removed_peer_cache[peer] = (evaluate_removed_peer_incremental(peer), lowfee_frontiers.reachable_from(peer) | {root_node})
+        return {"result": removed_peer_cache[peer][0], "cached": cached}
+    elif query == "update":
+        return {"result": apply_graph_update(request["inputs"])}
+    raise ValueError("unknown query %r" % query)
+
+class QueryHandler(socketserver.StreamRequestHandler):
+    #Each line received is a JSON query object; each is answered with one line of JSON
+    def handle(self):
+        for line in self.rfile:
+            if len(line.strip()) == 0:
+                continue
+            try:
+                response = answer_query(json.loads(line))
+            except (ValueError, KeyError, TypeError, OSError) as e:
+                response = {"error": str(e)}
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+#Computes the baseline once and answers queries on the Unix socket at path until interrupted.
+#Queries are answered one at a time, so an update never runs concurrently with a query.
+def serve(path):
+    global root_metrics
+    root_metrics = set_baseline(LowfeeFrontiers(channel_graph, root_node, base_fee_threshold, permillion_fee_threshold))
+    if os.path.exists(path):
+        os.unlink(path) #left behind by a previous run
+    server = socketserver.UnixStreamServer(path, QueryHandler)
+    sys.stderr.write("baseline of %d low-fee reachable nodes ready, listening on %s\n" % (len(lowfee_nodes), path))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(path)
+
+#Evaluates candidate n with its entry of candidate_flows for write_batch(). Returns (n, obj, flow entry,
+#number of maxflows reused from the old entry), which also gets the new entry back from a worker process.
+def evaluate_candidate_in_batch(n):
+    flow_cache = {n: candidate_flows[n]} if n in candidate_flows else dict()
+    (obj, footprint) = candidate_metrics_incremental(n, flow_cache)
+    num_reused = 0
+    if n in candidate_flows and candidate_flows[n][0] == flow_cache[n][0]:
+        num_reused = len(candidate_flows[n][1].keys() & flow_cache[n][1].keys())
+    return (n, obj, flow_cache[n], num_reused)
+
+#Drops what the last baseline update, which toggled toggled_edges in the low-fee subgraph, can have changed from
+#candidate_flows: the entries of nodes that are no longer candidates, and the maxflows of maxflow_affected_nodes().
+#A candidate's new subgraph also has the edges it adds, so the nodes those edges let an affected node reach are
+#affected there too. Returns the number of maxflows kept.
+def drop_stale_flows(toggled_edges):
+    affected = maxflow_affected_nodes(lowfee_frontiers, toggled_edges)
+    current = set(candidates)
+    num_kept = 0
+    for n in list(candidate_flows):
+        if n not in current:
+            del candidate_flows[n]
+            continue
+        (added_edges, flows) = candidate_flows[n]
+        added_outgoing = dict()
+        for (src, dest) in added_edges:
+            added_outgoing.setdefault(src, set()).add(dest)
+        stale = affected | lowfee_frontiers.reachable_from_nodes(affected & added_outgoing.keys(), added_outgoing)
+        candidate_flows[n] = (added_edges, {r: flow for (r, flow) in flows.items() if r not in stale})
+        num_kept += len(candidate_flows[n][1])
+    return num_kept
+
+#Returns the stability statistics of one candidate's peer_score series, in which None marks snapshots it wasn't
+#a candidate in. Those count as a score of 0; ranks is its rank among the candidates of each snapshot it was in.
+def peer_score_stats(scores, ranks):
+    values = [score if score is not None else 0 for score in scores]
+    mean = sum(values) / len(values)
+    return {
+        "snapshots_scored": len(ranks),
+        "mean_peer_score": round(mean, 3),
+        "stdev_peer_score": round(math.sqrt(sum([(v - mean) ** 2 for v in values]) / len(values)), 3),
+        "min_peer_score": min(values),
+        "max_peer_score": max(values),
+        "mean_rank": round(sum(ranks) / len(ranks), 3),
+        "worst_rank": max(ranks)
+    }
+
+#Scores every candidate in each snapshot of batch_paths, the first of which is already parsed into channel_graph,
+#and writes each candidate's peer_score series with its stability statistics as a JSON document. Every later
+#snapshot is applied with apply_graph_update(), and a candidate's maxflows are only solved again where the
+#low-fee edges that snapshot toggled can reach.
+def write_batch():
+    scores = dict() #maps candidate node numbers to their peer_score in each snapshot so far
+    ranks = dict()
+    snapshot_objs = list()
+    for k in range(len(batch_paths)):
+        start = time.time()
+        snapshot_obj = {"input": batch_paths[k]}
+        if k == 0:
+            snapshot_obj["root_node_metrics"] = set_baseline(LowfeeFrontiers(channel_graph, root_node, base_fee_threshold, permillion_fee_threshold))
+            num_kept = 0
+        else:
+            old_lowfee_edges = lowfee_edges
+            snapshot_obj["update"] = apply_graph_update([batch_paths[k]])
+            snapshot_obj["root_node_metrics"] = root_metrics
+            num_kept = drop_stale_flows(old_lowfee_edges ^ lowfee_edges)
+
+        if num_jobs > 1:
+            pool = multiprocessing.get_context("fork").Pool(num_jobs, init_worker)
+            candidate_results = pool.imap(evaluate_candidate_in_batch, candidates, chunksize = 1)
+        else:
+            pool = None
+            candidate_results = map(evaluate_candidate_in_batch, candidates)
+        snapshot_scores = dict()
+        num_reused = 0
+        num_solved = 0
+        for (n, obj, flow_entry, num_entry_reused) in candidate_results:
+            candidate_flows[n] = flow_entry
+            snapshot_scores[n] = obj["peer_score"]
+            num_reused += num_entry_reused
+            num_solved += len(flow_entry[1]) - num_entry_reused
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+        #ties share the best rank
+        ordered = sorted(snapshot_scores.values(), reverse = True)
+        first_rank = dict()
+        for i in range(len(ordered)):
+            first_rank.setdefault(ordered[i], i + 1)
+        for (n, score) in snapshot_scores.items():
+            scores.setdefault(n, [None] * k).append(score)
+            ranks.setdefault(n, list()).append(first_rank[score])
+        for n in scores:
+            if len(scores[n]) == k:
+                scores[n].append(None)
+
+        snapshot_obj["candidates"] = len(candidates)
+        snapshot_obj["solved_maxflows"] = num_solved
+        snapshot_obj["reused_maxflows"] = num_reused
+        snapshot_obj["seconds"] = round(time.time() - start, 3)
+        snapshot_objs.append(snapshot_obj)
+        sys.stderr.write("snapshot %d of %d (%s): %d candidates scored, %d maxflows solved, %d of %d cached ones reused, %.2fs\n" % (k + 1, len(batch_paths), batch_paths[k], len(candidates), num_solved, num_reused, num_kept, snapshot_obj["seconds"]))
+
+    series = list()
+    for (n, peer_scores) in scores.items():
+        series_obj = {
+            "peer_alias": node_to_alias[n] if n in node_to_alias else "",
+            "peer_id": node_to_id[n],
+            "peer_scores": peer_scores
+        }
+        series_obj.update(peer_score_stats(peer_scores, ranks[n]))
+        series.append(series_obj)
+    series.sort(key = lambda x: (x["mean_peer_score"], -x["stdev_peer_score"]), reverse = True)
+    obj = {"root_node_id": root_node_id, "snapshots": snapshot_objs, "peer_score_series": series}
+    sys.stdout.write("%s\n" % json.dumps(obj, indent = 4))
+
+
+#####################################################
+#MAIN BODY
+#####################################################
+
+signal.signal(signal.SIGINT, sigint_handler)
+
+args = parse_options(sys.argv[1:])
+if profile_path is not None or profile_trace_path is not None:
+    profiler.enable(track_memory = profile_memory, trace = profile_trace_path is not None)
+    num_jobs = 1
+#with --thresholds the fee thresholds are not given as positional arguments
+num_threshold_args = 2 if threshold_sweep is None else 0
+if len(args) < 1 + num_threshold_args:
+    print_usage_and_die()
+else:
+    root_node_id = args[0]
+    if threshold_sweep is None:
+        base_fee_threshold = int(args[1])
+        permillion_fee_threshold = int(args[2])
+    if len(args) >= 2 + num_threshold_args:
+        min_channels = int(args[1 + num_threshold_args])
+    if len(args) >= 3 + num_threshold_args:
+        min_capacity = int(args[2 + num_threshold_args])
+
+if len(batch_paths) > 0:
+    #the first snapshot is parsed like --input; write_batch() applies the others as updates
+    input_paths.append(batch_paths[0])
+
+if snapshot_path is not None:
+    #node numbers, channel order and merged fees are exactly those of parsing the JSON the snapshot was compiled from
+    try:
+        with profiler.phase("snapshot load"):
+            snapshot = GraphSnapshot(snapshot_path)
+            (channel_graph, node_to_id, node_to_alias) = snapshot.channel_graph(root_node_id, banned_nodes)
+    except (OSError, SnapshotError) as e:
+        sys.stderr.write("%s\n" % e)
+        sys.exit(1)
+    ln_software_type = LNSoftwareType(snapshot.software_type)
+    snapshot = None
+else:
+    parser = ChannelGraphParser(banned_nodes, [root_node_id])
+    try:
+        if len(input_paths) == 0:
+            parser.add_stream(sys.stdin)
+        for path in input_paths:
+            with open(path) as f:
+                parser.add_stream(f)
+    except ValueError as e:
+        sys.stderr.write("Could not read the channel graph: %s. Please see usage below.\n\n" % e)
+        print_usage_and_die()
+    sys.stderr.write("%s\n" % parser.ingest_summary())
+    ln_software_type = parser.software_type
+    node_to_id = parser.node_to_id
+    node_to_alias = parser.node_to_alias()
+    #Everything below works on the compact graph; drop the parser's dicts so they don't bloat the
+    #process (and every forked worker)
+    channel_graph = parser.channel_graph()
+    parser = None
+id_to_node = {node_id: n for (n, node_id) in node_to_id.items()}
+nodes = set(range(1, len(node_to_id)))
+
+candidates = select_candidates()
+
+if checkpoint_path is not None:
+    #default and --incremental runs give the same results, so they can resume each other's checkpoints, but not
+    #those of versions whose default runs used a breadth-first search
+    settings = [root_node_id, min_channels, min_capacity, "exhaustive frontiers", bounded_maxflow, exact_geomean, new_channel_capacity, sample_size, sample_seed]
+    fingerprint = run_fingerprint(channel_graph, [node_to_id[n] for n in range(len(node_to_id))], node_to_alias, settings)
+    try:
+        checkpoint = Checkpoint(checkpoint_path, fingerprint, resume)
+    except CheckpointError as e:
+        sys.stderr.write("%s\n" % e)
+        sys.exit(1)
+
+if serve_path is not None:
+    serve(serve_path)
+elif len(batch_paths) > 0:
+    write_batch()
+elif plan_size is not None:
+    write_portfolio()
+elif threshold_sweep is None:
+    sys.stdout.write("{\n")
+    write_analysis("    ")
+    sys.stdout.write("}\n")
+else:
+    write_threshold_sweep()
 sys.stdout.flush()
+
+if profile_path is not None:
+    profiler.write_summary(profile_path)
+if profile_trace_path is not None:
+    profiler.write_trace(profile_trace_path)